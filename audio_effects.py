@@ -0,0 +1,174 @@
+import math
+import logging
+import discord
+from audio_source import FRAME_SECONDS
+
+try:
+    import numpy as np
+except ImportError:  # Без numpy работают громкость и нормализация (через audioop), эквалайзер отключен
+    np = None
+
+try:
+    import audioop
+except ImportError:
+    audioop = None
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 48000
+EQ_TAPS = 129  # Длина КИХ-фильтра эквалайзера (задержка 64 сэмпла, 1.3 мс)
+EQ_LIMIT_DB = 12.0
+MAX_BOOST_DB = 6.0  # Нормализация усиливает тихие треки не больше чем на столько
+MAX_CUT_DB = 15.0
+SILENCE_RMS = 100  # Кадры тише не учитываются в скользящей громкости
+RMS_WINDOW_SECONDS = 3.0
+
+
+def effects_available():
+    """Полная цепочка (с эквалайзером) требует numpy"""
+    return np is not None
+
+
+def design_eq(bass_db, mid_db, treble_db, taps=EQ_TAPS):
+    """КИХ-фильтр трехполосного эквалайзера (низкие < 250 Гц, средние, высокие > 4 кГц)"""
+    size = 1024
+    freqs = np.fft.rfftfreq(size, 1 / SAMPLE_RATE)
+    # Плавные переходы между полосами по логарифмической шкале частот
+    anchors = np.log10([20, 150, 1000, 5000, SAMPLE_RATE / 2])
+    gains_db = np.interp(np.log10(np.maximum(freqs, 20)), anchors, [bass_db, bass_db, mid_db, treble_db, treble_db])
+    response = np.fft.irfft(10 ** (gains_db / 20), size)
+    response = np.roll(response, taps // 2)[:taps] * np.hamming(taps)
+    return response.astype(np.float32)
+
+
+class AudioEffects:
+    """Настройки эффектов сервера; меняются на лету, FFmpeg не перезапускается"""
+
+    def __init__(self, volume=1.0, normalize=True, target_lufs=-14.0):
+        self.volume = volume
+        self.normalize = normalize
+        self.target_lufs = target_lufs
+        self.eq = (0.0, 0.0, 0.0)  # Низкие, средние, высокие, дБ
+
+    def set_eq(self, bass, mid, treble):
+        self.eq = tuple(max(-EQ_LIMIT_DB, min(EQ_LIMIT_DB, float(band))) for band in (bass, mid, treble))
+
+    @property
+    def eq_enabled(self):
+        return any(self.eq)
+
+    def describe(self):
+        eq = ', '.join(f"{band:+.0f}" for band in self.eq) if self.eq_enabled else 'выкл.'
+        return (
+            f"Громкость: {self.volume:.0%}\n"
+            f"Нормализация: {'вкл.' if self.normalize else 'выкл.'} ({self.target_lufs:.0f} LUFS)\n"
+            f"Эквалайзер (низ./сред./выс., дБ): {eq}"
+        )
+
+
+class EffectsSource(discord.AudioSource):
+    """Цепочка эффектов над PCM-кадрами: эквалайзер, нормализация громкости, громкость.
+
+    Громкость трека берется из данных Яндекса (R128, поле 'loudness' в записи очереди),
+    а если их нет — из скользящего RMS. Усиление меняется плавно внутри кадра,
+    поэтому смена трека или настроек не дает щелчков.
+    """
+
+    def __init__(self, source, effects):
+        self.source = source
+        self.effects = effects
+        self._gain = 1.0  # Примененное на прошлом кадре усиление
+        self._norm = 1.0  # Усиление нормализации
+        self._entry = None
+        self._rms = None  # Скользящая громкость текущего трека
+        self._rms_alpha = FRAME_SECONDS / RMS_WINDOW_SECONDS
+        self._eq = None  # Настройки, для которых рассчитан фильтр
+        self._fir = None
+        self._history = None  # Хвост предыдущего кадра для свертки
+        self._warned = False
+
+    @property
+    def entry(self):
+        # Текущий трек GuildAudioStream (для бенчмарка и отладки)
+        return getattr(self.source, 'entry', None)
+
+    def _normalization_gain(self, entry, rms):
+        effects = self.effects
+        if not effects.normalize:
+            return 1.0
+        loudness = entry.get('loudness') if isinstance(entry, dict) else None
+        if loudness is not None:
+            gain_db = effects.target_lufs - loudness
+            true_peak = entry.get('true_peak')
+            if true_peak is not None:
+                gain_db = min(gain_db, -1.0 - true_peak)  # Не выше -1 dBTP после усиления
+        else:
+            if rms is not None and rms > SILENCE_RMS:
+                self._rms = rms if self._rms is None else self._rms + (rms - self._rms) * self._rms_alpha
+            if self._rms is None:
+                return self._norm  # Громкость нового трека еще не набрана
+            # Грубое соответствие: RMS в dBFS близок к интегральной громкости музыки в LUFS
+            gain_db = effects.target_lufs - 20 * math.log10(self._rms / 32768)
+        self._norm = 10 ** (max(-MAX_CUT_DB, min(MAX_BOOST_DB, gain_db)) / 20)
+        return self._norm
+
+    def read(self):
+        frame = self.source.read()
+        if not frame:
+            return frame
+        effects = self.effects
+        entry = self.entry
+        if entry is not self._entry:
+            self._entry = entry
+            self._rms = None
+
+        needs_rms = effects.normalize and not (isinstance(entry, dict) and entry.get('loudness') is not None)
+        if np is None:
+            return self._read_fallback(frame, needs_rms)
+
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32).reshape(-1, 2)
+        rms = float(np.sqrt(np.mean(samples * samples))) if needs_rms else None
+        target = effects.volume * self._normalization_gain(entry, rms)
+
+        if effects.eq_enabled:
+            samples = self._equalize(samples)
+        elif abs(target - 1.0) < 1e-3 and abs(self._gain - 1.0) < 1e-3:
+            self._history = None
+            return frame
+
+        ramp = np.linspace(self._gain, target, len(samples), endpoint=False, dtype=np.float32)
+        self._gain = target
+        samples *= ramp[:, None]
+        return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+    def _equalize(self, samples):
+        if self._eq != self.effects.eq:
+            self._eq = self.effects.eq
+            self._fir = design_eq(*self._eq)
+        if self._history is None:
+            self._history = np.zeros((EQ_TAPS - 1, 2), dtype=np.float32)
+        padded = np.concatenate((self._history, samples))
+        self._history = padded[-(EQ_TAPS - 1):]
+        return np.stack(
+            [np.convolve(padded[:, channel], self._fir, mode='valid') for channel in range(2)],
+            axis=1
+        )
+
+    def _read_fallback(self, frame, needs_rms):
+        if self.effects.eq_enabled and not self._warned:
+            self._warned = True
+            logger.warning("Эквалайзер требует numpy, применяются только громкость и нормализация")
+        if audioop is None:
+            return frame
+        rms = audioop.rms(frame, 2) if needs_rms else None
+        target = self.effects.volume * self._normalization_gain(self._entry, rms)
+        self._gain = target
+        if abs(target - 1.0) < 1e-3:
+            return frame
+        return audioop.mul(frame, 2, target)
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        self.source.cleanup()
@@ -0,0 +1,263 @@
+import os
+import time
+import logging
+import threading
+import discord
+from config import (
+    AUDIO_BUFFER_SECONDS, AUDIO_PREROLL_SECONDS, AUDIO_PREROLL_TIMEOUT, AUDIO_STARVE_TIMEOUT,
+    FFMPEG_PROBESIZE, FFMPEG_ANALYZEDURATION, FFMPEG_NICE, FFMPEG_CPU_AFFINITY, FFMPEG_STUCK_SECONDS,
+    AUDIO_NODE_STATS_INTERVAL
+)
+from audio_source import BufferedAudioSource, ffmpeg_before_options
+from transitions import GuildAudioStream
+from audio_effects import AudioEffects, EffectsSource
+from ffmpeg_supervisor import FFmpegSupervisor, _read_proc
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_PER_FRAME = discord.opus.Encoder.SAMPLES_PER_FRAME
+FRAMES_PER_MESSAGE = 5  # Кадров в одном сообщении узла (100 мс)
+
+# Протокол узла (кортежи через multiprocessing.Connection):
+#   бот -> узел: open, close, play, queue_next, replace, clear_next, skip, credit, effects, stop, shutdown
+#   узел -> бот: hello, ready, frames, preload, end, stats
+
+
+def _make_encoder():
+    """Кодировщик Opus узла; None — libopus недоступна, узел отдает PCM"""
+    try:
+        if not discord.opus.is_loaded():
+            discord.opus._load_default()
+        return discord.opus.Encoder() if discord.opus.is_loaded() else None
+    except Exception:
+        return None
+
+
+class NodeStream:
+    """Поток сервера на узле: кадры готовятся наперед в пределах кредита, выданного ботом"""
+
+    def __init__(self, node, stream_id, stream, effects, credits):
+        self.node = node
+        self.id = stream_id
+        self.stream = stream
+        self.effects = effects
+        self.source = EffectsSource(stream, effects)
+        self.encoder = _make_encoder()
+        self.credits = credits
+        self.epoch = 0  # Номер сброса (перемотка, пропуск): кадры старых эпох бот отбрасывает
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._pump, name=f'node-stream-{stream_id}', daemon=True)
+
+    def add_credit(self, count):
+        with self.cond:
+            self.credits += count
+            self.cond.notify()
+
+    def _pump(self):
+        try:
+            while True:
+                with self.cond:
+                    while self.credits <= 0 and not self.stopped:
+                        self.cond.wait()
+                    if self.stopped:
+                        return
+                    take = min(self.credits, FRAMES_PER_MESSAGE)
+                    self.credits -= take
+                packets = []
+                for _ in range(take):
+                    frame = self.source.read()
+                    if not frame:
+                        if packets:
+                            self.node.send('frames', self.id, packets)
+                        self.node.send('end', self.id)
+                        return
+                    if self.encoder is not None:
+                        frame = self.encoder.encode(frame, SAMPLES_PER_FRAME)
+                    packets.append((self.epoch, self.stream.entry['token'], self.stream.frames_read, frame))
+                self.node.send('frames', self.id, packets)
+        except Exception as e:
+            logger.error("Ошибка потока %s на аудиоузле: %s", self.id, e)
+            self.node.send('end', self.id)
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        self.stream.cleanup()
+
+
+class AudioNode:
+    """Процесс-узел: FFmpeg, буферы, переходы, эффекты и кодирование в Opus для серверов,
+    которые назначил ему бот. Голосовое соединение остается в процессе бота."""
+
+    def __init__(self, conn, executable='ffmpeg'):
+        self.conn = conn
+        self.executable = executable
+        self.sources = {}  # Открытые, но еще не переданные потоку источники
+        self.streams = {}
+        self.supervisor = FFmpegSupervisor(
+            0, nice=FFMPEG_NICE, affinity=FFMPEG_CPU_AFFINITY, stuck_seconds=FFMPEG_STUCK_SECONDS, reap_interval=0
+        )
+        self._send_lock = threading.Lock()
+        self._running = True
+
+    def send(self, *message):
+        try:
+            with self._send_lock:
+                self.conn.send(message)
+        except (OSError, EOFError):
+            self._running = False  # Бот закрыл соединение
+
+    def run(self):
+        self.send('hello', os.getpid(), _make_encoder() is not None)
+        threading.Thread(target=self._report_stats, name='node-stats', daemon=True).start()
+        while self._running:
+            try:
+                command, *args = self.conn.recv()
+            except (OSError, EOFError):
+                break
+            try:
+                getattr(self, f'_on_{command}')(*args)
+            except Exception as e:
+                logger.error("Ошибка команды %s на аудиоузле: %s", command, e)
+        self._on_shutdown()
+
+    # Команды бота
+
+    def _on_open(self, source_id, url, start_at):
+        # Запуск и предзагрузка — в отдельном потоке, чтобы не задерживать остальные команды
+        threading.Thread(target=self._open, args=(source_id, url, start_at), daemon=True).start()
+
+    def _open(self, source_id, url, start_at):
+        try:
+            source = discord.FFmpegPCMAudio(
+                url,
+                executable=self.executable,
+                before_options=ffmpeg_before_options(FFMPEG_PROBESIZE, FFMPEG_ANALYZEDURATION, start_at)
+            )
+            source = self.supervisor.supervise(source, source_id)
+            if AUDIO_BUFFER_SECONDS > 0:
+                source = BufferedAudioSource(
+                    source, AUDIO_BUFFER_SECONDS, AUDIO_PREROLL_SECONDS, AUDIO_STARVE_TIMEOUT, name=str(source_id)
+                )
+                source.start()
+                source.wait_ready(AUDIO_PREROLL_TIMEOUT)
+        except Exception as e:
+            logger.error("Не удалось открыть источник %s на аудиоузле: %s", source_id, e)
+            self.send('ready', source_id, False)
+            return
+        self.sources[source_id] = source
+        self.send('ready', source_id, True)
+
+    def _on_close(self, source_id):
+        source = self.sources.pop(source_id, None)
+        if source is not None:
+            source.cleanup()
+
+    def _on_play(self, stream_id, source_id, entry, position, effects, preload_seconds, crossfade_seconds, credits):
+        source = self.sources.pop(source_id, None)
+        if source is None:
+            self.send('end', stream_id)
+            return
+        stream = GuildAudioStream(
+            source, entry,
+            on_preload=lambda stream: self.send('preload', stream_id),
+            preload_seconds=preload_seconds,
+            crossfade_seconds=crossfade_seconds,
+            position=position
+        )
+        node_stream = NodeStream(self, stream_id, stream, self._effects(*effects), credits)
+        self.streams[stream_id] = node_stream
+        node_stream.thread.start()
+
+    def _on_queue_next(self, stream_id, source_id, entry, position):
+        node_stream = self.streams.get(stream_id)
+        source = self.sources.pop(source_id, None)
+        if source is None:
+            return
+        if node_stream is None or not node_stream.stream.queue_next(source, entry, position):
+            source.cleanup()
+
+    def _on_replace(self, stream_id, source_id, token, position, epoch):
+        node_stream = self.streams.get(stream_id)
+        source = self.sources.pop(source_id, None)
+        if source is None:
+            return
+        if node_stream is None:
+            source.cleanup()
+            return
+        stream = node_stream.stream
+        node_stream.epoch = epoch
+        entry = stream.entry
+        if entry is None or entry['token'] != token or not stream.replace_current(source, entry, position):
+            source.cleanup()  # Узел уже перешел к следующему треку
+
+    def _on_clear_next(self, stream_id):
+        node_stream = self.streams.get(stream_id)
+        if node_stream is not None:
+            node_stream.stream.clear_next()
+
+    def _on_skip(self, stream_id, epoch):
+        node_stream = self.streams.get(stream_id)
+        if node_stream is not None:
+            node_stream.epoch = epoch  # До пропуска: кадры следующего трека уже в новой эпохе
+            node_stream.stream.skip()
+
+    def _on_credit(self, stream_id, count):
+        node_stream = self.streams.get(stream_id)
+        if node_stream is not None:
+            node_stream.add_credit(count)
+
+    def _on_effects(self, stream_id, volume, normalize, target_lufs, eq):
+        node_stream = self.streams.get(stream_id)
+        if node_stream is not None:
+            effects = node_stream.effects
+            effects.volume, effects.normalize, effects.target_lufs = volume, normalize, target_lufs
+            effects.set_eq(*eq)
+
+    def _on_stop(self, stream_id):
+        node_stream = self.streams.pop(stream_id, None)
+        if node_stream is not None:
+            node_stream.stop()
+
+    def _on_shutdown(self):
+        self._running = False
+        for stream_id in list(self.streams):
+            self._on_stop(stream_id)
+        for source_id in list(self.sources):
+            self._on_close(source_id)
+
+    @staticmethod
+    def _effects(volume, normalize, target_lufs, eq):
+        effects = AudioEffects(volume, normalize, target_lufs)
+        effects.set_eq(*eq)
+        return effects
+
+    def _report_stats(self):
+        """Нагрузка узла для выбора узла ботом: потоки, CPU и память вместе с FFmpeg"""
+        previous = None
+        while self._running:
+            time.sleep(AUDIO_NODE_STATS_INTERVAL)
+            self.supervisor.reap()
+            ffmpeg = self.supervisor.stats()
+            own = _read_proc(os.getpid())
+            cpu_percent, rss = ffmpeg['cpu_percent'], ffmpeg['rss']
+            if own is not None:
+                now = time.monotonic()
+                if previous is not None:
+                    cpu_percent += (own[0] - previous[0]) / (now - previous[1]) * 100
+                previous = (own[0], now)
+                rss += own[1]
+            self.send('stats', {
+                'streams': len(self.streams),
+                'ffmpeg': ffmpeg['active'],
+                'cpu_percent': cpu_percent,
+                'rss': rss,
+            })
+
+
+def run_node(conn, executable='ffmpeg'):
+    """Точка входа процесса-узла (multiprocessing, метод spawn)"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [audio-node %(process)d] %(levelname)s: %(message)s')
+    AudioNode(conn, executable).run()
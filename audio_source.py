@@ -0,0 +1,172 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+import discord
+from metrics import AUDIO_UNDERRUNS, AUDIO_PREROLL
+
+logger = logging.getLogger(__name__)
+
+FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE  # 20 мс PCM 48 кГц стерео
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+SILENCE = b'\x00' * FRAME_SIZE
+
+
+def ffmpeg_before_options(probesize, analyzeduration, start_at=0):
+    """Опции FFmpeg до -i: переподключение к CDN, короткий анализ потока и начальная позиция"""
+    options = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+    if start_at:
+        # -ss до -i: FFmpeg переходит к позиции запросом Range, не декодируя начало трека
+        options += f" -ss {start_at:.2f}"
+    if probesize:
+        options += f" -probesize {probesize}"
+    if analyzeduration:
+        options += f" -analyzeduration {analyzeduration}"
+    return options
+
+
+class BufferedAudioSource(discord.AudioSource):
+    """Источник с опережающим чтением в ограниченный кольцевой буфер.
+
+    Отдельный поток читает кадры из вложенного источника (FFmpegPCMAudio), пока буфер
+    не заполнится. Поток воспроизведения discord.py берет кадры из буфера, поэтому
+    кратковременные задержки CDN не слышны. При опустошении буфера отдается тишина,
+    пока не накопится запас; после каждого опустошения запас увеличивается (адаптивно),
+    но не больше емкости буфера.
+    """
+
+    def __init__(self, source, buffer_seconds=10.0, preroll_seconds=2.0, starve_timeout=15.0, name=None):
+        self.inner = source
+        self.name = name or 'audio'
+        self.capacity = max(1, int(buffer_seconds / FRAME_SECONDS))
+        self.preroll_frames = min(self.capacity, max(1, int(preroll_seconds / FRAME_SECONDS)))
+        self.rebuffer_frames = self.preroll_frames  # Запас после опустошения, растет при повторных
+        self.starve_timeout = starve_timeout
+        self.frames = deque()
+        self.underruns = 0
+        self.frames_played = 0
+        self.silence_frames = 0
+        self.eof = False
+        self._cond = threading.Condition()
+        self._ready = threading.Event()
+        self._closed = False
+        self._starving = False
+        self._starve_started = None
+        self._thread = None
+        self._started_at = None
+
+    @property
+    def _process(self):
+        # Для MusicPlayer.count_ffmpeg_processes
+        return getattr(self.inner, '_process', None)
+
+    def start(self):
+        """Запуск потока опережающего чтения"""
+        if self._thread is not None:
+            return
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._fill, name=f'buffer-{self.name}', daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        try:
+            while True:
+                with self._cond:
+                    while len(self.frames) >= self.capacity and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                frame = self.inner.read()
+                with self._cond:
+                    if not frame:
+                        self.eof = True
+                        self._ready.set()
+                        return
+                    self.frames.append(frame)
+                    if len(self.frames) >= self.preroll_frames:
+                        self._ready.set()
+        except Exception as e:
+            logger.error("Ошибка чтения аудиопотока %s: %s", self.name, e)
+            with self._cond:
+                self.eof = True
+                self._ready.set()
+
+    def wait_ready(self, timeout=5.0):
+        """Блокирующее ожидание начального запаса (для аудиоузлов, где нет цикла событий)"""
+        ready = self._ready.wait(timeout)
+        if ready:
+            AUDIO_PREROLL.observe(time.perf_counter() - self._started_at)
+        else:
+            logger.warning("Предзагрузка %s не завершилась за %.1f с, запускаем как есть", self.name, timeout)
+        return ready
+
+    async def wait_preroll(self, timeout=5.0):
+        """Ожидание начального запаса (не блокирует цикл событий); True — запас набран"""
+        deadline = time.perf_counter() + timeout
+        while not self._ready.is_set():
+            if time.perf_counter() >= deadline:
+                logger.warning("Предзагрузка %s не завершилась за %.1f с, запускаем как есть", self.name, timeout)
+                return False
+            await asyncio.sleep(0.02)
+        AUDIO_PREROLL.observe(time.perf_counter() - self._started_at)
+        return True
+
+    def read(self):
+        with self._cond:
+            if self._starving:
+                # Набираем запас после опустошения
+                if len(self.frames) < self.rebuffer_frames and not self.eof:
+                    return self._silence()
+                self._starving = False
+                self._starve_started = None
+
+            if self.frames:
+                frame = self.frames.popleft()
+                self._cond.notify()
+                self.frames_played += 1
+                return frame
+
+            if self.eof:
+                return b''
+
+            # Буфер опустел раньше конца трека
+            self.underruns += 1
+            AUDIO_UNDERRUNS.inc()
+            self._starving = True
+            self._starve_started = time.perf_counter()
+            self.rebuffer_frames = min(self.capacity, self.rebuffer_frames * 2)
+            logger.warning(
+                "Буфер %s опустел (%s раз), набираем %.1f с",
+                self.name, self.underruns, self.rebuffer_frames * FRAME_SECONDS
+            )
+            return self._silence()
+
+    def _silence(self):
+        if self._starve_started is not None and time.perf_counter() - self._starve_started > self.starve_timeout:
+            logger.error("Аудиопоток %s не отвечает %.0f с, трек завершается", self.name, self.starve_timeout)
+            return b''
+        self.silence_frames += 1
+        return SILENCE
+
+    def health(self):
+        """Состояние буфера для !status"""
+        with self._cond:
+            buffered = len(self.frames)
+        return {
+            'buffered_ms': buffered * FRAME_SECONDS * 1000,
+            'fill': buffered / self.capacity,
+            'underruns': self.underruns,
+            'silence_ms': self.silence_frames * FRAME_SECONDS * 1000,
+            'eof': self.eof,
+        }
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        with self._cond:
+            self._closed = True
+            self.frames.clear()
+            self._cond.notify_all()
+        self.inner.cleanup()
@@ -0,0 +1 @@
+"""Офлайн-бенчмарки бота: поддельный API Яндекс.Музыки и голосовые клиенты Discord"""
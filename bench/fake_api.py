@@ -0,0 +1,181 @@
+import time
+import random
+import threading
+from collections import Counter
+from types import SimpleNamespace
+from yandex_music.exceptions import NetworkError
+from blocking_guard import check_blocking_call
+
+
+class FakeDownloadInfo:
+    """Аналог yandex_music.DownloadInfo: прямая ссылка получается отдельным запросом"""
+
+    def __init__(self, api, track_id, codec, bitrate_in_kbps):
+        self._api = api
+        self.track_id = track_id
+        self.codec = codec
+        self.bitrate_in_kbps = bitrate_in_kbps
+        self.direct_link = None
+
+    def get_direct_link(self):
+        self._api._request('get_direct_link')
+        self.direct_link = f"https://fake-storage.local/{self.track_id}/{self.bitrate_in_kbps}.{self.codec}"
+        return self.direct_link
+
+
+class FakeTrack:
+    """Аналог yandex_music.Track с нужными боту полями"""
+
+    def __init__(self, api, track_id, album_id, duration_scale=1.0):
+        self._api = api
+        self.id = str(track_id)
+        self.album_id = album_id
+        self.title = f"Трек {track_id}"
+        self.artists = [SimpleNamespace(name=f"Исполнитель {track_id % 97}")]
+        self.albums = [SimpleNamespace(id=album_id, title=f"Альбом {album_id}")]
+        self.duration_ms = max(1000, int(random.randint(120, 300) * 1000 * duration_scale))
+        self.cover_uri = None
+        self.available = True
+
+    @property
+    def track_id(self):
+        return f"{self.id}:{self.album_id}"
+
+    def get_download_info(self, get_direct_links=False):
+        self._api._request('get_download_info')
+        # Набор вариантов как у Яндекса: MP3 до 320 кбит/с и AAC до 192 кбит/с
+        infos = [
+            FakeDownloadInfo(self._api, self.id, codec, bitrate)
+            for codec, bitrates in (('mp3', (64, 128, 192, 320)), ('aac', (64, 128, 192)))
+            for bitrate in bitrates
+        ]
+        if get_direct_links:
+            for info in infos:
+                info.get_direct_link()
+        return infos
+
+
+class FakeYandexApi:
+    """Локальная замена yandex_music.Client с настраиваемой задержкой и отказами.
+
+    Методы синхронные, как у настоящего клиента: задержка имитируется time.sleep,
+    поэтому вызов, сделанный мимо пула потоков, блокирует цикл событий так же, как в боте.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.5, failure_rate=0.0, method_failures=None,
+                 catalog_size=5000, playlist_size=200, liked_size=1000, duration_scale=1.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter  # Разброс задержки: доля от latency
+        self.failure_rate = failure_rate
+        self.method_failures = dict(method_failures or {})  # метод -> вероятность отказа
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.failures = Counter()
+        self._lock = threading.Lock()
+
+        self.catalog = {}
+        for track_id in range(1, catalog_size + 1):
+            # duration_scale сокращает треки, чтобы сценарий укладывался в секунды
+            self.catalog[str(track_id)] = FakeTrack(self, track_id, 10000 + track_id // 12, duration_scale)
+
+        self.playlist_revision = 1
+        self.playlist_ids = self.random.sample(list(self.catalog), min(playlist_size, catalog_size))
+        self.liked_revision = 1
+        self.liked_ids = self.random.sample(list(self.catalog), min(liked_size, catalog_size))
+        self.me = None
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def _request(self, method):
+        """Имитация HTTP-запроса: учет, задержка и возможный отказ"""
+        check_blocking_call(method)
+        with self._lock:
+            self.calls[method] += 1
+            delay = self.latency * (1 + self.random.uniform(-self.jitter, self.jitter))
+            failure_rate = self.method_failures.get(method, self.failure_rate)
+            failed = self.random.random() < failure_rate
+            if failed:
+                self.failures[method] += 1
+        time.sleep(max(0.0, delay))
+        if failed:
+            raise NetworkError(f"Искусственный отказ {method}")
+
+    def _track_short(self, track_id, with_track=False):
+        track = self.catalog[track_id]
+        return SimpleNamespace(
+            id=track.id,
+            track_id=track.track_id,
+            album_id=track.album_id,
+            track=track if with_track else None
+        )
+
+    # Методы, которые вызывает бот (сигнатуры как у yandex_music.Client)
+
+    def init(self):
+        self._request('init')
+        self.me = SimpleNamespace(account=SimpleNamespace(uid=1, login='bench'))
+        return self
+
+    def search(self, text, nocorrect=False, type_='all', page=0, playlist_in_best=True):
+        self._request('search')
+        tracks = [self.catalog[track_id] for track_id in self.random.sample(list(self.catalog), 10)]
+        playlist = SimpleNamespace(
+            playlist_id='1:1000',
+            title=f"Плейлист {text}",
+            track_count=len(self.playlist_ids),
+            cover=None,
+            owner=SimpleNamespace(name='bench')
+        )
+        return SimpleNamespace(
+            tracks=SimpleNamespace(results=tracks),
+            playlists=SimpleNamespace(results=[playlist])
+        )
+
+    def tracks(self, track_ids, with_positions=True):
+        self._request('tracks')
+        result = []
+        for track_id in track_ids:
+            track = self.catalog.get(str(track_id).split(':')[0])
+            if track is not None:
+                result.append(track)
+        return result
+
+    def tracks_download_info(self, track_id, get_direct_links=False):
+        return self.catalog[str(track_id).split(':')[0]].get_download_info(get_direct_links)
+
+    def users_playlists(self, kind=None, user_id=None, *args, **kwargs):
+        self._request('users_playlists')
+        return SimpleNamespace(
+            kind=kind,
+            revision=self.playlist_revision,
+            tracks=[self._track_short(track_id) for track_id in self.playlist_ids]
+        )
+
+    def playlists_list(self, playlist_ids):
+        self._request('playlists_list')
+        return [SimpleNamespace(playlist_id=playlist_id, revision=self.playlist_revision) for playlist_id in playlist_ids]
+
+    def users_likes_tracks(self, user_id=None, if_modified_since_revision=0):
+        self._request('users_likes_tracks')
+        if if_modified_since_revision == self.liked_revision:
+            return SimpleNamespace(revision=self.liked_revision, tracks=[])
+        return SimpleNamespace(
+            revision=self.liked_revision,
+            tracks=[self._track_short(track_id, with_track=True) for track_id in self.liked_ids]
+        )
+
+    def albums_with_tracks(self, album_id):
+        self._request('albums_with_tracks')
+        album_id = int(album_id[0] if isinstance(album_id, list) else album_id)
+        tracks = [track for track in self.catalog.values() if track.album_id == album_id]
+        return SimpleNamespace(id=album_id, title=f"Альбом {album_id}", cover=None, volumes=[tracks])
+
+    def rotor_station_tracks(self, station, settings2=True, queue=None):
+        self._request('rotor_station_tracks')
+        sequence = [
+            SimpleNamespace(track=self.catalog[track_id])
+            for track_id in self.random.sample(list(self.catalog), 5)
+        ]
+        return SimpleNamespace(batch_id=f"batch-{self.random.getrandbits(32):08x}", sequence=sequence)
@@ -0,0 +1,251 @@
+import time
+import asyncio
+import threading
+import itertools
+
+FRAME_SIZE = 3840  # 20 мс PCM 48 кГц стерео, как у discord.FFmpegPCMAudio
+FRAME_SECONDS = 0.02
+SILENCE = b'\x00' * FRAME_SIZE
+
+
+class FakeAudioSource:
+    """Замена FFmpegPCMAudio: не запускает процессов и отдает тишину длительностью в трек"""
+
+    def __init__(self, song, start_at=0):
+        self.song = song
+        self.url = song.get('url')
+        self.created_at = time.monotonic()
+        self._process = None  # Для MusicPlayer.count_ffmpeg_processes
+        self.total_frames = max(1, int(song.get('duration', 0) / FRAME_SECONDS))
+        self.frames_read = min(self.total_frames, int(start_at / FRAME_SECONDS))  # Перемотка
+
+    def read(self):
+        if self.frames_read >= self.total_frames:
+            return b''
+        self.frames_read += 1
+        return SILENCE
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        pass
+
+
+class FakeVoiceClient:
+    """Замена discord.VoiceClient: поток читает кадры источника раз в 20 мс
+    и вызывает after, когда источник закончился (как AudioPlayer в discord.py)"""
+
+    def __init__(self, bot, channel):
+        self.bot = bot
+        self.channel = channel
+        self.guild = channel.guild
+        self.source = None
+        self._connected = True
+        self._paused = False
+        self._after = None
+        self._thread = None
+        self._stop = None
+        self._track = None
+        self._last_frame_at = None
+        self._lock = threading.Lock()
+        self.play_times = []  # Моменты первого кадра каждого трека
+        self.gaps = []  # Пауза между последним кадром трека и первым кадром следующего
+        self.ended_at = None
+        self.tracks_finished = 0
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self.source is not None and not self._paused
+
+    def is_paused(self):
+        return self.source is not None and self._paused
+
+    def play(self, source, *, after=None):
+        if self.source is not None:
+            raise RuntimeError("Already playing audio.")
+        self.source = source
+        self._after = after
+        self._track = None
+        self._last_frame_at = self.ended_at  # Последний кадр предыдущего потока
+        first = self._read_frame(source)  # Первый кадр уходит сразу
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(source, self._stop, first), daemon=True)
+        self._thread.start()
+
+    def _read_frame(self, source):
+        if not source.read():
+            return False
+        moment = time.monotonic()
+        # GuildAudioStream меняет entry при переходе к следующему треку
+        track = getattr(source, 'entry', None) or source
+        if track is not self._track:
+            if self._last_frame_at is not None:
+                # Пауза сверх обычного интервала между кадрами
+                self.gaps.append(max(0.0, moment - self._last_frame_at - FRAME_SECONDS))
+            self.play_times.append(moment)
+            if self._track is not None:
+                self.tracks_finished += 1
+            self._track = track
+        self._last_frame_at = moment
+        return True
+
+    def _run(self, source, stop, playing):
+        budget = 0.0
+        last_tick = time.perf_counter()
+        while playing and not stop.wait(0.005):
+            now = time.perf_counter()
+            if not self._paused:
+                budget += now - last_tick
+            last_tick = now
+            while budget >= FRAME_SECONDS:
+                budget -= FRAME_SECONDS
+                if not self._read_frame(source):
+                    playing = False
+                    break
+        self._finish(source)
+
+    def _finish(self, source):
+        with self._lock:
+            if self.source is not source:
+                return
+            after = self._after
+            self.source = None
+            self._after = None
+            self._paused = False
+            self.ended_at = self._last_frame_at or time.monotonic()
+            self.tracks_finished += 1
+        source.cleanup()
+        if after is not None:
+            after(None)
+
+    def stop(self):
+        # Как и у discord.py, after вызывается из потока воспроизведения
+        if self._stop is not None:
+            self._stop.set()
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, *, force=False):
+        self._connected = False
+        source = self.source
+        self.source = None  # Как при обрыве: after не вызывается
+        if self._stop is not None:
+            self._stop.set()
+        if source is not None:
+            source.cleanup()
+        if self in self.bot.voice_clients:
+            self.bot.voice_clients.remove(self)
+
+
+class FakeVoiceChannel:
+    def __init__(self, bot, guild, connect_latency=0.05):
+        self.bot = bot
+        self.guild = guild
+        self.id = guild.id * 10
+        self.name = f"voice-{guild.id}"
+        self.bitrate = 64000
+        self.connect_latency = connect_latency
+
+    async def connect(self, *, timeout=60.0, reconnect=True, **kwargs):
+        await asyncio.sleep(self.connect_latency)  # Голосовое рукопожатие
+        voice_client = FakeVoiceClient(self.bot, self)
+        self.bot.voice_clients.append(voice_client)
+        return voice_client
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeGuild) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeMember:
+    _ids = itertools.count(1)
+
+    def __init__(self, voice_channel):
+        self.id = next(self._ids)
+        self.name = f"user-{self.id}"
+        self.display_name = self.name
+        self.mention = f"<@{self.id}>"
+        self.voice = type('VoiceState', (), {'channel': voice_channel})()
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None, view=None):
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.view = view
+        self.edits = 0
+
+    async def edit(self, *, content=None, embed=None, view=None, **kwargs):
+        self.edits += 1
+        self.content = content
+        if embed is not None:
+            self.embed = embed
+        self.view = view
+
+
+class FakeTextChannel:
+    def __init__(self, guild):
+        self.guild = guild
+        self.id = guild.id * 10 + 1
+        self.sent = 0  # Храним только счетчик, чтобы сообщения не искажали замер памяти
+
+    async def send(self, content=None, *, embed=None, view=None, **kwargs):
+        self.sent += 1
+        if view is not None:
+            view.stop()  # Представления не регистрируются в ViewStore: таймауты не нужны
+        return FakeMessage(self, content, embed, view)
+
+
+class FakeContext:
+    """Минимальный аналог commands.Context для вызова методов плеера и команд бота"""
+
+    def __init__(self, bot, guild, author, channel, command=None):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.channel = channel
+        self.command = command
+        self.voice_client = None
+        self.interaction = None  # Вызов префиксной командой
+
+    async def send(self, content=None, **kwargs):
+        kwargs.pop('ephemeral', None)
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeBot:
+    """То, что MusicPlayer использует от бота: цикл событий, клиент API и список голосовых клиентов"""
+
+    def __init__(self, loop, yandex_client):
+        self.loop = loop
+        self.yandex_client = yandex_client
+        self.voice_clients = []
+        self.music_player = None
+        self.playlist_manager = None
+
+
+def make_guild_context(bot, guild_id, connect_latency=0.05):
+    """Сервер с голосовым и текстовым каналом и участником в голосовом канале"""
+    guild = FakeGuild(guild_id)
+    voice_channel = FakeVoiceChannel(bot, guild, connect_latency)
+    member = FakeMember(voice_channel)
+    return FakeContext(bot, guild, member, FakeTextChannel(guild))
@@ -0,0 +1,285 @@
+import time
+import asyncio
+import logging
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from yandex_client import YandexMusicClient
+from playlist_manager import PlaylistManager
+from music_player import MusicPlayer
+from config import EXECUTOR_WORKERS, BLOCKING_GUARD
+from blocking_guard import install_blocking_guard
+from bench.fake_voice import FakeAudioSource, FakeBot, make_guild_context
+
+logger = logging.getLogger(__name__)
+
+# Модули, память которых относится к компонентам бота (замер через tracemalloc)
+COMPONENT_MODULES = {
+    'YandexMusicClient': ('yandex_client.py', 'track_cache.py'),
+    'PlaylistManager': ('playlist_manager.py', 'playlist_cache.py', 'liked_index.py'),
+    'MusicPlayer': ('music_player.py',),
+}
+
+
+class BenchMusicPlayer(MusicPlayer):
+    """MusicPlayer с поддельным источником звука вместо процесса FFmpeg"""
+
+    def _ffmpeg_available(self):
+        return True
+
+    def _create_source(self, song, start_at=0):
+        return FakeAudioSource(song, start_at)
+
+
+def percentile(values, q):
+    """Перцентиль по методу ближайшего ранга (None для пустого списка)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class BenchEnv:
+    """Бот в сборе поверх поддельного API и голосовых клиентов"""
+
+    def __init__(self, api, connect_latency=0.05, executor_workers=EXECUTOR_WORKERS):
+        self.api = api
+        self.connect_latency = connect_latency
+        self.executor_workers = executor_workers
+        self.executor = None
+        self.bot = None
+        self.contexts = {}
+        self.first_audio = []  # Время от команды до первого кадра
+        self.timed_out = False
+
+    async def setup(self):
+        loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.executor_workers, thread_name_prefix='yandex-api')
+        loop.set_default_executor(self.executor)
+        install_blocking_guard(BLOCKING_GUARD)
+
+        yandex_client = YandexMusicClient()
+        yandex_client.client = self.api
+        await yandex_client.call_api('init')
+        yandex_client.is_authenticated = True
+
+        self.bot = FakeBot(loop, yandex_client)
+        self.bot.music_player = BenchMusicPlayer(self.bot)
+        self.bot.playlist_manager = PlaylistManager(yandex_client)
+
+        # Авторизация не относится к сценарию
+        self.api.calls.clear()
+        self.api.failures.clear()
+        return self
+
+    def context(self, guild_id):
+        """Контекст команды для сервера (создается один раз)"""
+        if guild_id not in self.contexts:
+            self.contexts[guild_id] = make_guild_context(self.bot, guild_id, self.connect_latency)
+        return self.contexts[guild_id]
+
+    def voice_client(self, guild_id):
+        return self.bot.music_player.get_voice_client(guild_id)
+
+    def mark_first_audio(self, guild_id, started):
+        """Учет времени до первого кадра, если команда запустила воспроизведение"""
+        voice_client = self.voice_client(guild_id)
+        if voice_client and voice_client.play_times:
+            first = [moment for moment in voice_client.play_times if moment >= started]
+            if first:
+                self.first_audio.append(first[0] - started)
+
+    async def wait_tracks(self, guild_ids, count, timeout=60.0):
+        """Ожидание, пока на каждом сервере начнется воспроизведение count треков"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pending = [
+                guild_id for guild_id in guild_ids
+                if len(getattr(self.voice_client(guild_id), 'play_times', ())) < count
+            ]
+            if not pending:
+                return True
+            await asyncio.sleep(0.01)
+        logger.warning("Не дождались %s треков на %s серверах", count, len(pending))
+        self.timed_out = True
+        return False
+
+    async def stop_all(self):
+        player = self.bot.music_player
+        for guild_id, ctx in list(self.contexts.items()):
+            if player.get_voice_client(guild_id):
+                await player.stop_playback(ctx)
+                # Без ожидания VOICE_LINGER_SECONDS: прогон завершается сразу
+                await player.voice_manager.disconnect(guild_id)
+        await asyncio.sleep(0.05)  # Даем отработать after-колбэкам
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # Сценарии команд: те же шаги, что у соответствующих команд в bot.py
+
+    async def play(self, guild_id, query):
+        """Аналог !play <запрос>"""
+        ctx = self.context(guild_id)
+        player = self.bot.music_player
+        client = self.bot.yandex_client
+        started = time.monotonic()
+
+        if not await player.join_voice_channel(ctx):
+            return False
+        tracks = await client.search_tracks(query, limit=5)
+        if not tracks:
+            return False
+        track = tracks[0]
+        stream = await player.resolve_stream(guild_id, track['id'])
+        if not stream or not await player.add_to_queue(ctx, track, stream):
+            return False
+        if not player.get_voice_client(guild_id).is_playing():
+            await player.play_next(ctx)
+            self.mark_first_audio(guild_id, started)
+        return True
+
+    async def playlist(self, guild_id, playlist_id, limit=10, first_page_size=3):
+        """Аналог !playlist: первая страница сразу, остальные — в фоне"""
+        ctx = self.context(guild_id)
+        player = self.bot.music_player
+        client = self.bot.yandex_client
+        started = time.monotonic()
+
+        if not await player.join_voice_channel(ctx):
+            return None
+        pages = self.bot.playlist_manager.iter_playlist_tracks(
+            playlist_id, limit=limit, page_size=first_page_size, shuffle=True
+        )
+        try:
+            remaining = list(await pages.__anext__())
+        except StopAsyncIteration:
+            return None
+
+        added = 0
+        while remaining and not added:
+            track = remaining.pop(0)
+            stream = await player.resolve_stream(guild_id, track['id'])
+            if stream and await player.add_to_queue(ctx, track, stream):
+                added += 1
+        if not added:
+            await pages.aclose()
+            return None
+
+        if not player.get_voice_client(guild_id).is_playing():
+            await player.play_next(ctx)
+            self.mark_first_audio(guild_id, started)
+
+        async def enqueue_rest(tracks):
+            try:
+                while True:
+                    for track in tracks:
+                        if not player.get_voice_client(guild_id):
+                            return
+                        stream = await player.resolve_stream(guild_id, track['id'])
+                        if stream:
+                            await player.add_to_queue(ctx, track, stream)
+                    try:
+                        tracks = await pages.__anext__()
+                    except StopAsyncIteration:
+                        break
+            finally:
+                await pages.aclose()
+
+        return asyncio.create_task(enqueue_rest(remaining))
+
+    async def my_wave(self, guild_id):
+        """Аналог !mywave: первый трек и режим автоматического обновления"""
+        ctx = self.context(guild_id)
+        player = self.bot.music_player
+        client = self.bot.yandex_client
+        started = time.monotonic()
+
+        if not await player.join_voice_channel(ctx):
+            return False
+        tracks = await client.get_my_wave_tracks(limit=1)
+        if not tracks or not tracks[0].get('id'):
+            return False
+        track = tracks[0]
+        stream = await player.resolve_stream(guild_id, track['id'])
+        if not stream or not await player.add_to_queue(ctx, track, stream):
+            return False
+        player.my_wave_mode[guild_id] = True
+        if not player.get_voice_client(guild_id).is_playing():
+            await player.play_next(ctx)
+            self.mark_first_audio(guild_id, started)
+        return True
+
+
+class MemoryProbe:
+    """Замер памяти компонентов бота через tracemalloc"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.baseline = None
+
+    def start(self):
+        if self.enabled:
+            tracemalloc.start()
+            self.baseline = tracemalloc.take_snapshot()
+
+    def measure(self):
+        """Прирост памяти по компонентам в байтах"""
+        if not self.enabled:
+            return {}
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        by_file = Counter()
+        for stat in snapshot.compare_to(self.baseline, 'filename'):
+            filename = stat.traceback[0].filename.replace('\\', '/').rsplit('/', 1)[-1]
+            by_file[filename] += stat.size_diff
+
+        result = {name: sum(by_file[module] for module in modules) for name, modules in COMPONENT_MODULES.items()}
+        result['total'] = sum(size for size in by_file.values() if size > 0)
+        return result
+
+
+def build_report(name, env, guilds, memory, elapsed):
+    """Сводка сценария (строится до остановки воспроизведения)"""
+    gaps = [gap for vc in env.bot.voice_clients for gap in vc.gaps]
+    tracks_started = sum(len(vc.play_times) for vc in env.bot.voice_clients)
+    return {
+        'scenario': name,
+        'guilds': guilds,
+        'elapsed_s': elapsed,
+        'tracks_started': tracks_started,
+        'timed_out': env.timed_out,
+        'first_audio_p50_ms': _ms(percentile(env.first_audio, 50)),
+        'first_audio_p99_ms': _ms(percentile(env.first_audio, 99)),
+        'gap_p50_ms': _ms(percentile(gaps, 50)),
+        'gap_p99_ms': _ms(percentile(gaps, 99)),
+        'api_calls': env.api.total_calls,
+        'api_calls_per_track': round(env.api.total_calls / tracks_started, 2) if tracks_started else None,
+        'api_failures': sum(env.api.failures.values()),
+        'api_calls_by_method': dict(env.api.calls.most_common()),
+        'memory_per_guild_kb': {
+            component: round(size / guilds / 1024, 1) for component, size in memory.items()
+        },
+    }
+
+
+def _ms(value):
+    return None if value is None else round(value * 1000, 1)
+
+
+def format_report(report):
+    """Текстовое представление сводки"""
+    lines = [
+        f"== {report['scenario']} ({report['guilds']} серв., {report['elapsed_s']:.1f} с) ==",
+        f"  треков запущено:      {report['tracks_started']}" + (" (не дождались всех)" if report['timed_out'] else ''),
+        f"  до первого звука, мс: p50={report['first_audio_p50_ms']} p99={report['first_audio_p99_ms']}",
+        f"  пауза между, мс:      p50={report['gap_p50_ms']} p99={report['gap_p99_ms']}",
+        f"  вызовов API на трек:  {report['api_calls_per_track']} "
+        f"(всего {report['api_calls']}, отказов {report['api_failures']})",
+        "  по методам:           " + ', '.join(f"{method}={count}" for method, count in report['api_calls_by_method'].items()),
+    ]
+    if report['memory_per_guild_kb']:
+        lines.append("  память на сервер, КБ: " + ', '.join(
+            f"{component}={size}" for component, size in report['memory_per_guild_kb'].items()
+        ))
+    return '\n'.join(lines)
@@ -0,0 +1,323 @@
+"""Генератор нагрузки: сотни серверов выполняют команды bot.py на поддельном API и голосе.
+
+Запуск: python -m bench.loadgen --guilds 300 --rate 2 --duration 120
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import resource
+import tempfile
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Нагрузка не должна писать в лог бота; переменные читаются при импорте config
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'loadgen.log'))
+
+from bench.fake_api import FakeYandexApi
+from bench.fake_voice import make_guild_context
+from bench.harness import BenchMusicPlayer, percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIX = 'play=4,playlist=1,mywave=1,skip=2,queue=2,pause=1,resume=1,stop=0.5'
+START_COMMANDS = ('play', 'playlist', 'mywave')
+
+
+def parse_mix(value):
+    """Разбор строки вида 'play=4,skip=2' в словарь весов команд"""
+    mix = {}
+    for part in value.split(','):
+        if '=' not in part:
+            continue
+        name, weight = part.split('=', 1)
+        try:
+            mix[name.strip()] = max(0.0, float(weight))
+        except ValueError:
+            continue
+    return mix
+
+
+def read_rss():
+    """Резидентная память процесса в байтах"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Не Linux: пиковое значение вместо текущего
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def executor_busy(executor):
+    """Занятые потоки пула (по внутренним полям ThreadPoolExecutor)"""
+    threads = len(getattr(executor, '_threads', ()))
+    idle = getattr(getattr(executor, '_idle_semaphore', None), '_value', 0)
+    return max(0, threads - idle)
+
+
+class LoadGenerator:
+    def __init__(self, bot, api, args):
+        self.bot = bot
+        self.api = api
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.random = random.Random(args.seed)
+        self.contexts = {}
+        self.active = set()  # Серверы, где сейчас идет воспроизведение
+        self.executor = None
+        self.running = True
+
+        # Данные текущего интервала отчета
+        self.loop_lags = []
+        self.executor_queue = []
+        self.executor_busy = []
+        self.command_times = defaultdict(list)
+        self.command_errors = Counter()
+        self.first_errors = {}  # Команда -> текст первой ошибки (для итога)
+        self.commands_done = 0
+
+        self.samples = []
+        self.all_command_times = defaultdict(list)
+
+    def pick_command(self, guild_id):
+        if guild_id not in self.active:
+            return self.random.choice(START_COMMANDS)
+        names = list(self.mix)
+        return self.random.choices(names, weights=[self.mix[name] for name in names])[0]
+
+    async def run_command(self, guild_id, name):
+        ctx = self.contexts[guild_id]
+        command = self.bot.get_command(name)
+        ctx.command = command
+        kwargs = {}
+        if name == 'play':
+            kwargs['query'] = f"трек {self.random.randint(1, 10 ** 6)}"
+        elif name == 'playlist':
+            kwargs['query'] = f"плейлист {self.random.randint(1, 20)}"
+
+        started = time.perf_counter()
+        try:
+            await command(ctx, **kwargs)
+        except Exception as e:
+            self.command_errors[name] += 1
+            if name not in self.first_errors:
+                self.first_errors[name] = f"{type(e).__name__}: {e}"
+                logger.exception("Ошибка команды %s на сервере %s", name, guild_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.command_times[name].append(elapsed)
+            self.all_command_times[name].append(elapsed)
+            self.commands_done += 1
+
+        if name in START_COMMANDS:
+            self.active.add(guild_id)
+        elif name == 'stop':
+            self.active.discard(guild_id)
+
+    async def guild_session(self, guild_id, start_delay):
+        """Поток команд одного сервера с экспоненциальными интервалами"""
+        await asyncio.sleep(start_delay)
+        self.contexts[guild_id] = make_guild_context(self.bot, guild_id, self.args.connect_latency)
+        rate_per_second = self.args.rate / 60
+        while self.running:
+            await self.run_command(guild_id, self.pick_command(guild_id))
+            await asyncio.sleep(self.random.expovariate(rate_per_second))
+
+    async def monitor_loop(self):
+        """Задержка цикла событий и загрузка пула потоков"""
+        interval = self.args.lag_interval
+        while self.running:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            self.loop_lags.append(max(0.0, time.perf_counter() - expected))
+            self.executor_queue.append(self.executor._work_queue.qsize())
+            self.executor_busy.append(executor_busy(self.executor))
+
+    def streams(self):
+        return sum(
+            1 for voice_client in self.bot.music_player.voice_clients.values()
+            if voice_client.is_connected() and voice_client.is_playing()
+        )
+
+    def take_sample(self, elapsed, wall, cpu, rss, rss_start):
+        streams = self.streams()
+        command_times = [value for values in self.command_times.values() for value in values]
+        sample = {
+            't_s': round(elapsed, 1),
+            'guilds': len(self.contexts),
+            'streams': streams,
+            'commands_per_s': round(self.commands_done / wall, 1) if wall else 0,
+            'command_p99_ms': _ms(percentile(command_times, 99)),
+            'loop_lag_p99_ms': _ms(percentile(self.loop_lags, 99)),
+            'loop_lag_max_ms': _ms(max(self.loop_lags) if self.loop_lags else None),
+            'executor_queue_max': max(self.executor_queue, default=0),
+            'executor_busy_p99': percentile(self.executor_busy, 99) or 0,
+            'executor_workers': self.executor._max_workers,
+            'cpu_pct': round(cpu / wall * 100, 1) if wall else 0,
+            'cpu_pct_per_stream': round(cpu / wall * 100 / streams, 3) if wall and streams else None,
+            'rss_mb': round(rss / 2 ** 20, 1),
+            'rss_growth_mb': round((rss - rss_start) / 2 ** 20, 1),
+            'api_calls': self.api.total_calls,
+            'errors': sum(self.command_errors.values()),
+        }
+        self.samples.append(sample)
+
+        self.loop_lags = []
+        self.executor_queue = []
+        self.executor_busy = []
+        self.command_times = defaultdict(list)
+        self.commands_done = 0
+        return sample
+
+    async def run(self):
+        args = self.args
+        loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='ymusic')
+        loop.set_default_executor(self.executor)
+
+        monitor = asyncio.create_task(self.monitor_loop())
+        sessions = [
+            asyncio.create_task(self.guild_session(guild_id, args.ramp * (guild_id - 1) / max(1, args.guilds)))
+            for guild_id in range(1, args.guilds + 1)
+        ]
+
+        started = time.monotonic()
+        rss_start = read_rss()
+        last_wall, last_cpu = time.monotonic(), time.process_time()
+        while time.monotonic() - started < args.duration:
+            await asyncio.sleep(args.interval)
+            wall, cpu = time.monotonic(), time.process_time()
+            sample = self.take_sample(wall - started, wall - last_wall, cpu - last_cpu, read_rss(), rss_start)
+            last_wall, last_cpu = wall, cpu
+            if not args.json:
+                print(format_sample(sample), flush=True)
+
+        self.running = False
+        for task in sessions + [monitor]:
+            task.cancel()
+        await asyncio.gather(*sessions, monitor, return_exceptions=True)
+        for guild_id, ctx in list(self.contexts.items()):
+            if self.bot.music_player.get_voice_client(guild_id):
+                await self.bot.music_player.stop_playback(ctx)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        return self.summary(rss_start)
+
+    def summary(self, rss_start):
+        duration = self.samples[-1]['t_s'] if self.samples else 0
+        rss_growth = (self.samples[-1]['rss_mb'] * 2 ** 20 - rss_start) if self.samples else 0
+        return {
+            'guilds': self.args.guilds,
+            'duration_s': duration,
+            'peak_streams': max((sample['streams'] for sample in self.samples), default=0),
+            'loop_lag_max_ms': max((sample['loop_lag_max_ms'] or 0 for sample in self.samples), default=0),
+            'executor_queue_max': max((sample['executor_queue_max'] for sample in self.samples), default=0),
+            'rss_growth_mb_per_guild': round(rss_growth / 2 ** 20 / max(1, self.args.guilds), 3),
+            'commands': {
+                name: {
+                    'count': len(times),
+                    'p50_ms': _ms(percentile(times, 50)),
+                    'p99_ms': _ms(percentile(times, 99)),
+                    'errors': self.command_errors[name],
+                }
+                for name, times in sorted(self.all_command_times.items())
+            },
+            'errors': sum(self.command_errors.values()),
+            'first_errors': dict(self.first_errors),
+            'api_calls_by_method': dict(self.api.calls.most_common()),
+            'samples': self.samples,
+        }
+
+
+def _ms(value):
+    return None if value is None else round(value * 1000, 1)
+
+
+def format_sample(sample):
+    return (
+        f"[{sample['t_s']:6.1f} с] серв={sample['guilds']} потоков={sample['streams']} "
+        f"команд/с={sample['commands_per_s']} p99 команды={sample['command_p99_ms']} мс | "
+        f"лаг цикла p99={sample['loop_lag_p99_ms']} max={sample['loop_lag_max_ms']} мс | "
+        f"пул: занято p99={sample['executor_busy_p99']}/{sample['executor_workers']} очередь max={sample['executor_queue_max']} | "
+        f"CPU={sample['cpu_pct']}% на поток={sample['cpu_pct_per_stream']}% | "
+        f"RSS={sample['rss_mb']} МБ (+{sample['rss_growth_mb']})"
+    )
+
+
+def format_summary(summary):
+    lines = [
+        f"== Итог: {summary['guilds']} серверов, {summary['duration_s']} с ==",
+        f"  пик одновременных потоков: {summary['peak_streams']}",
+        f"  макс. лаг цикла событий:   {summary['loop_lag_max_ms']} мс",
+        f"  макс. очередь пула:        {summary['executor_queue_max']}",
+        f"  рост RSS на сервер:        {summary['rss_growth_mb_per_guild']} МБ",
+        "  команды (p50/p99 мс, ошибки):",
+    ]
+    for name, stats in summary['commands'].items():
+        lines.append(f"    {name:<9} x{stats['count']:<6} {stats['p50_ms']}/{stats['p99_ms']}  ошибок {stats['errors']}")
+    lines.append(f"  ошибок команд всего:       {summary['errors']}")
+    for name, error in summary['first_errors'].items():
+        lines.append(f"    первая ошибка {name}: {error}")
+    return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест команд бота на поддельном API и голосе")
+    parser.add_argument('--guilds', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=2.0, help="Команд в минуту на сервер")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Веса команд после запуска воспроизведения")
+    parser.add_argument('--duration', type=float, default=60.0, help="Длительность теста, с")
+    parser.add_argument('--ramp', type=float, default=10.0, help="Время подключения всех серверов, с")
+    parser.add_argument('--interval', type=float, default=5.0, help="Период отчета, с")
+    parser.add_argument('--lag-interval', type=float, default=0.05, help="Период замера лага цикла, с")
+    parser.add_argument('--workers', type=int, default=None, help="Потоков пула (по умолчанию EXECUTOR_WORKERS)")
+    parser.add_argument('--latency', type=float, default=0.05, help="Средняя задержка API, с")
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--connect-latency', type=float, default=0.05)
+    parser.add_argument('--time-scale', type=float, default=0.05, help="Множитель длительности трека")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', action='store_true')
+    return parser.parse_args(argv)
+
+
+async def main_async(args):
+    # bot.py импортируется здесь: при импорте настраивается логирование и создается бот
+    import bot as bot_module
+    from config import EXECUTOR_WORKERS, BLOCKING_GUARD
+    from blocking_guard import install_blocking_guard
+
+    if args.workers is None:
+        args.workers = EXECUTOR_WORKERS
+
+    install_blocking_guard(BLOCKING_GUARD)
+    api = FakeYandexApi(
+        latency=args.latency, failure_rate=args.failure_rate, duration_scale=args.time_scale, seed=args.seed
+    )
+    bot = bot_module.bot
+    bot.loop = asyncio.get_running_loop()
+    bot.yandex_client.client = api
+    await bot.yandex_client.call_api('init')
+    bot.yandex_client.is_authenticated = True
+    bot.music_player = BenchMusicPlayer(bot)
+    api.calls.clear()
+
+    return await LoadGenerator(bot, api, args).run()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    summary = asyncio.run(main_async(args))
+    if args.json:
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print(format_summary(summary))
+
+
+if __name__ == '__main__':
+    main()
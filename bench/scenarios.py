@@ -0,0 +1,129 @@
+"""Сценарии бенчмарка.
+
+Запуск: python -m bench.scenarios [--scenario single|guilds|playlist_burst|mywave_marathon|all]
+"""
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from bench.fake_api import FakeYandexApi
+from bench.harness import BenchEnv, MemoryProbe, build_report, format_report
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+@scenario('single')
+async def single_guild(env, args):
+    """Один сервер: несколько !play подряд, треки играют до конца"""
+    await env.play(1, 'тест')
+    for number in range(args.tracks - 1):
+        await env.play(1, f'тест {number}')
+    await env.wait_tracks([1], args.tracks, timeout=args.timeout)
+    return 1
+
+
+@scenario('guilds')
+async def many_guilds(env, args):
+    """Много серверов одновременно выполняют !play и слушают очередь"""
+    guild_ids = list(range(1, args.guilds + 1))
+
+    async def run_guild(guild_id):
+        for number in range(args.tracks):
+            await env.play(guild_id, f'запрос {guild_id} {number}')
+
+    await asyncio.gather(*(run_guild(guild_id) for guild_id in guild_ids))
+    await env.wait_tracks(guild_ids, args.tracks, timeout=args.timeout)
+    return len(guild_ids)
+
+
+@scenario('playlist_burst')
+async def playlist_burst(env, args):
+    """Всплеск !playlist: все серверы одновременно запускают один и тот же плейлист"""
+    guild_ids = list(range(1, args.guilds + 1))
+    tasks = await asyncio.gather(*(
+        env.playlist(guild_id, '1:1000', limit=args.tracks) for guild_id in guild_ids
+    ))
+    await env.wait_tracks(guild_ids, args.tracks, timeout=args.timeout)
+    for task in tasks:
+        if task is not None:
+            await task
+    return len(guild_ids)
+
+
+@scenario('mywave_marathon')
+async def mywave_marathon(env, args):
+    """Марафон 'Моя волна': каждый следующий трек подбирается после окончания текущего"""
+    guild_ids = list(range(1, args.guilds + 1))
+    await asyncio.gather(*(env.my_wave(guild_id) for guild_id in guild_ids))
+    await env.wait_tracks(guild_ids, args.tracks, timeout=args.timeout)
+    return len(guild_ids)
+
+
+async def run_scenario(name, args):
+    api = FakeYandexApi(
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        catalog_size=args.catalog,
+        duration_scale=args.time_scale,
+        seed=args.seed,
+    )
+    env = BenchEnv(api, connect_latency=args.connect_latency)
+    memory = MemoryProbe(enabled=not args.no_memory)
+
+    await env.setup()
+    memory.start()
+    started = time.monotonic()
+    guilds = await SCENARIOS[name](env, args)
+    elapsed = time.monotonic() - started
+
+    report = build_report(name, env, guilds, memory.measure(), elapsed)
+    await env.stop_all()
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк бота с поддельным API и голосом")
+    parser.add_argument('--scenario', default='all', choices=sorted(SCENARIOS) + ['all'])
+    parser.add_argument('--guilds', type=int, default=100, help="Серверов (кроме single)")
+    parser.add_argument('--tracks', type=int, default=5, help="Треков на сервер")
+    parser.add_argument('--latency', type=float, default=0.05, help="Средняя задержка API, с")
+    parser.add_argument('--jitter', type=float, default=0.5, help="Разброс задержки (доля)")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Вероятность отказа вызова API")
+    parser.add_argument('--connect-latency', type=float, default=0.05, help="Подключение к голосу, с")
+    parser.add_argument('--time-scale', type=float, default=0.01, help="Множитель длительности трека")
+    parser.add_argument('--catalog', type=int, default=5000, help="Треков в поддельном каталоге")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Предел ожидания сценария, с")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--no-memory', action='store_true', help="Без замера памяти (tracemalloc замедляет)")
+    parser.add_argument('--json', action='store_true', help="Вывод в JSON")
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING))
+
+    names = sorted(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    reports = [asyncio.run(run_scenario(name, args)) for name in names]
+
+    if args.json:
+        json.dump(reports, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for report in reports:
+            print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
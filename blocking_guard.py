@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import functools
+import traceback
+from loop_monitor import find_culprit
+
+logger = logging.getLogger(__name__)
+
+_mode = 'off'
+_installed = False
+_reported = set()  # Места вызова, о которых уже предупредили
+
+
+class BlockingCallError(RuntimeError):
+    """Синхронный сетевой вызов из потока цикла событий (режим BLOCKING_GUARD=raise)"""
+
+
+def on_event_loop():
+    """Выполняется ли код в потоке работающего цикла событий"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def check_blocking_call(description):
+    """Проверка перед блокирующим запросом: в цикле событий — предупреждение или исключение"""
+    if _mode == 'off' or not on_event_loop():
+        return
+
+    summary = traceback.extract_stack()[:-1]
+    culprit = find_culprit(summary, skip=(__file__,))
+    if _mode == 'raise':
+        raise BlockingCallError(f"Блокирующий вызов {description} в цикле событий: {culprit}")
+
+    if culprit not in _reported:
+        _reported.add(culprit)
+        logger.warning(
+            "Блокирующий вызов %s в цикле событий: %s\n%s",
+            description, culprit, ''.join(traceback.format_list(summary[-12:]))
+        )
+
+
+def install_blocking_guard(mode='warn'):
+    """Проверка всех HTTP-запросов yandex_music (через Request._request_wrapper).
+
+    mode: 'off' — без проверки, 'warn' — предупреждение один раз на место вызова,
+    'raise' — BlockingCallError вместо запроса (для отладки).
+    """
+    global _mode, _installed
+    _mode = mode if mode in ('off', 'warn', 'raise') else 'warn'
+    if _installed or _mode == 'off':
+        return
+
+    from yandex_music.utils.request import Request
+
+    original = Request._request_wrapper
+
+    @functools.wraps(original)
+    def guarded_request_wrapper(self, *args, **kwargs):
+        method, url = (args + (None, None))[:2]
+        check_blocking_call(f"{method} {url}" if url else 'HTTP')
+        return original(self, *args, **kwargs)
+
+    Request._request_wrapper = guarded_request_wrapper
+    _installed = True
+    logger.info("Проверка блокирующих вызовов включена (режим %s)", _mode)
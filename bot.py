@@ -4,20 +4,23 @@ from discord import app_commands
 import asyncio
 import logging
 import os
-from config import DISCORD_TOKEN, PREFIX, ERROR_MESSAGES, YANDEX_TOKEN
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    DISCORD_TOKEN, PREFIX, ERROR_MESSAGES, YANDEX_TOKEN,
+    EXECUTOR_WORKERS, METRICS_HOST, METRICS_PORT, LOOP_MONITOR_INTERVAL, LOOP_STALL_THRESHOLD,
+    BLOCKING_GUARD
+)
 from yandex_client import YandexMusicClient
 from music_player import MusicPlayer
 from playlist_manager import PlaylistManager
+from log_setup import setup_logging
+from metrics import EXECUTOR_QUEUE, start_metrics_server
+from tracing import tracer, render_waterfall, detached
+from loop_monitor import LoopMonitor
+from blocking_guard import install_blocking_guard
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Настройка логирования (запись в файл и консоль — в отдельном потоке)
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -42,11 +45,63 @@ class YandexMusicBot(commands.Bot):
         self.yandex_client = YandexMusicClient()
         self.music_player = MusicPlayer(self)
         self.playlist_manager = PlaylistManager(self.yandex_client)
+        self.executor = None
+        self.metrics_runner = None
+        self.loop_monitor = LoopMonitor(LOOP_MONITOR_INTERVAL, LOOP_STALL_THRESHOLD)
+    
+    async def setup_hook(self):
+        """Подготовка перед подключением к Discord"""
+        # Собственный пул потоков для блокирующих вызовов, чтобы видеть его очередь в метриках
+        self.executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix='ymusic')
+        asyncio.get_running_loop().set_default_executor(self.executor)
+        EXECUTOR_QUEUE.set_function(lambda: self.executor._work_queue.qsize())
+        
+        # Сетевые вызовы yandex_music из потока цикла событий: предупреждение или исключение
+        install_blocking_guard(BLOCKING_GUARD)
+        
+        # Сторожевой поток: задержка цикла событий и стек блокирующих вызовов
+        if LOOP_STALL_THRESHOLD > 0:
+            self.loop_monitor.start()
+        
+        # HTTP-эндпоинт /metrics только на локальном интерфейсе
+        if METRICS_PORT:
+            try:
+                self.metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+            except OSError as e:
+                logger.error("Не удалось запустить сервер метрик: %s", e)
+        
+        # Кнопки управления на сообщениях всех серверов, в том числе отправленных до перезапуска
+        self.music_player.register_controls()
+        
+        # Периодическое сохранение очереди и позиции для продолжения после перезапуска
+        self.music_player.start_state_saver()
+        
+        # FFmpeg проверяется один раз за запуск, дальше процессы под надзором
+        await asyncio.get_running_loop().run_in_executor(None, self.music_player.ffmpeg.probe)
+        self.music_player.ffmpeg.start()
+        
+        # Аудиоузлы запускаются с уже найденным FFmpeg
+        if self.music_player.nodes is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.music_player.nodes.start, self.music_player.ffmpeg.path or 'ffmpeg'
+            )
+    
+    async def close(self):
+        """Остановка бота и вспомогательных сервисов"""
+        # Последняя запись позиции — до отключения от голосовых каналов
+        try:
+            await self.music_player.shutdown()
+        except Exception as e:
+            logger.error("Не удалось сохранить состояние воспроизведения: %s", e)
+        self.loop_monitor.stop()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+        await super().close()
     
     async def on_ready(self):
         """Событие готовности бота"""
-        logger.info(f'{self.user} подключился к Discord!')
-        logger.info(f'Бот работает на {len(self.guilds)} серверах')
+        logger.info('%s подключился к Discord!', self.user)
+        logger.info('Бот работает на %s серверах', len(self.guilds))
         
         # Аутентификация в Яндекс.Музыке
         if YANDEX_TOKEN:
@@ -57,6 +112,9 @@ class YandexMusicBot(commands.Bot):
         else:
             logger.error("YANDEX_TOKEN не найден в переменных окружения!")
         
+        # Продолжение воспроизведения, прерванного перезапуском (после авторизации: ссылки могли истечь)
+        await self.music_player.restore_state()
+        
         # Устанавливаем статус бота
         activity = discord.Activity(
             type=discord.ActivityType.listening,
@@ -68,36 +126,89 @@ class YandexMusicBot(commands.Bot):
             # Небольшая задержка для стабильности
             await asyncio.sleep(2)
             global_synced = await self.tree.sync()
-            logger.info(f"Синхронизировано глобальных slash-команд: {len(global_synced)}")
+            logger.info("Синхронизировано глобальных slash-команд: %s", len(global_synced))
             
             # Синхронизация по серверам с задержкой
             for i, guild in enumerate(self.guilds):
                 try:
                     await asyncio.sleep(0.5)  # Задержка между синхронизациями
                     guild_synced = await self.tree.sync(guild=guild)
-                    logger.info(f"Синхронизировано для сервера {guild.name} ({guild.id}): {len(guild_synced)}")
+                    logger.info("Синхронизировано для сервера %s (%s): %s", guild.name, guild.id, len(guild_synced))
                 except Exception as ge:
-                    logger.error(f"Не удалось синхронизировать для сервера {guild.id}: {ge}")
+                    logger.error("Не удалось синхронизировать для сервера %s: %s", guild.id, ge)
         except Exception as e:
-            logger.error(f"Не удалось синхронизировать slash-команды: {e}")
+            logger.error("Не удалось синхронизировать slash-команды: %s", e)
+    
+    async def on_voice_state_update(self, member, before, after):
+        """Отслеживание голосового состояния самого бота (перемещение, обрыв соединения)"""
+        if self.user is None or member.id != self.user.id:
+            return
+        self.music_player.voice_manager.on_voice_state_update(
+            member.guild, before, after, self.music_player.resume_after_reconnect,
+            lambda guild_id: self.music_player.reset_playback(guild_id, "👋 Бота отключили от голосового канала")
+        )
     
     async def on_command_error(self, ctx, error):
         """Обработка ошибок команд"""
         if isinstance(error, commands.CommandNotFound):
             return
         
-        logger.error(f"Ошибка команды {ctx.command}: {error}")
+        # Для slash-команд after_invoke при ошибке не вызывается — закрываем отрезок здесь
+        tracer.finish_span(getattr(ctx, 'trace_span', None), error)
+        
+        logger.error("Ошибка команды %s: %s", ctx.command, error)
         
         if isinstance(error, commands.MissingRequiredArgument):
             await ctx.send(f"❌ Недостаточно аргументов! Используйте: `{ctx.command.usage}`")
         elif isinstance(error, commands.BadArgument):
             await ctx.send("❌ Неверный аргумент!")
+        elif isinstance(error, commands.MissingPermissions):
+            await ctx.send("❌ Недостаточно прав для этой команды!")
         else:
             await ctx.send("❌ Произошла ошибка при выполнении команды!")
 
 # Создаем экземпляр бота
 bot = YandexMusicBot()
 
+@bot.before_invoke
+async def start_command_trace(ctx):
+    """Начало трассы команды: все вложенные вызовы попадут в нее"""
+    ctx.trace_span = tracer.start_span(
+        f"command.{ctx.command.qualified_name}",
+        guild=ctx.guild.id if ctx.guild else None,
+        user=ctx.author.id
+    )
+
+@bot.after_invoke
+async def finish_command_trace(ctx):
+    """Завершение трассы команды"""
+    tracer.finish_span(getattr(ctx, 'trace_span', None))
+
+# Размер первой страницы плейлиста: чем меньше, тем быстрее начинается воспроизведение
+PLAYLIST_FIRST_PAGE_SIZE = 3
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+background_tasks = set()
+
+async def run_in_worker(ctx, coro, name):
+    """Долгая часть команды (поиск, API, запуск FFmpeg) в очереди сервера, по порядку поступления.
+
+    Slash-команда подтверждается до начала работы: на ответ Discord дает 3 секунды, сообщения
+    придут продолжением. Ответ на подтвержденное взаимодействие публичный, поэтому скрытые
+    сообщения (ephemeral) команда отправляет до вызова.
+    """
+    interaction = getattr(ctx, 'interaction', None)  # У GuildContext и контекстов бенчмарка его может не быть
+    if interaction is not None and not interaction.response.is_done():
+        await ctx.defer()
+    return await bot.music_player.workers.submit(ctx.guild.id, coro, name)
+
+def spawn_background(func, *args):
+    """Запуск фоновой задачи с сохранением ссылки на нее"""
+    task = asyncio.create_task(detached(func, *args))  # Своя трасса, не продолжение трассы команды
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
 @bot.hybrid_command(name='play', aliases=['p'], description='Поиск и воспроизведение трека')
 @app_commands.describe(query='Название трека или ссылка Яндекс.Музыки')
 async def play_music(ctx, *, query: str = None):
@@ -105,19 +216,32 @@ async def play_music(ctx, *, query: str = None):
     if not query:
         await ctx.send("❌ Укажите название трека! Пример: `!play название песни`")
         return
-    
+    await run_in_worker(ctx, play_query(ctx, query), 'play')
+
+@bot.hybrid_command(name='playnext', aliases=['pn'], description='Трек вне очереди: сыграет следующим')
+@app_commands.describe(query='Название трека или ссылка Яндекс.Музыки')
+@commands.has_guild_permissions(move_members=True)
+async def play_next_music(ctx, *, query: str = None):
+    """Добавление трека в приоритетную полосу: он играет раньше общей очереди"""
+    if not query:
+        await ctx.send("❌ Укажите название трека! Пример: `!playnext название песни`")
+        return
+    await run_in_worker(ctx, play_query(ctx, query, priority=True), 'playnext')
+
+async def play_query(ctx, query, priority=False):
+    """Поиск трека по запросу или ссылке и добавление в очередь"""
     # Извлекаем ID трека из URL если передан URL
     track_id = None
     if 'music.yandex.ru/track/' in query:
         try:
             track_id = query.split('music.yandex.ru/track/')[1].split('?')[0].split('/')[0]
-            logger.info(f"Извлечен ID трека из URL: {track_id}")
+            logger.info("Извлечен ID трека из URL: %s", track_id)
         except:
             pass
     
     if track_id:
         # Если это ID трека, воспроизводим напрямую
-        await play_track_by_id(ctx, track_id)
+        await play_track_by_id(ctx, track_id, priority)
         return
     
     if not await bot.music_player.join_voice_channel(ctx):
@@ -138,15 +262,16 @@ async def play_music(ctx, *, query: str = None):
         track = tracks[0]
         
         # Получаем URL для воспроизведения
-        track_url = await bot.yandex_client.get_track_url(track['id'])
+        stream = await bot.music_player.resolve_stream(ctx.guild.id, track['id'])
         
-        if not track_url:
+        if not stream:
             await search_msg.edit(content="❌ Не удалось получить ссылку на трек!")
             return
         
         # Добавляем в очередь
-        if await bot.music_player.add_to_queue(ctx, track, track_url):
-            await search_msg.edit(content=f"✅ Добавлено в очередь: **{track['title']}** - {track['artist']}")
+        if await bot.music_player.add_to_queue(ctx, track, stream, priority):
+            added = "Сыграет следующим" if priority else "Добавлено в очередь"
+            await search_msg.edit(content=f"✅ {added}: **{track['title']}** - {track['artist']}")
             
             # Если ничего не играет, начинаем воспроизведение
             voice_client = bot.music_player.get_voice_client(ctx.guild.id)
@@ -154,10 +279,10 @@ async def play_music(ctx, *, query: str = None):
                 await bot.music_player.play_next(ctx)
     
     except Exception as e:
-        logger.error(f"Ошибка в команде play: {e}")
+        logger.error("Ошибка в команде play: %s", e)
         await search_msg.edit(content="❌ Произошла ошибка при поиске трека!")
 
-async def play_track_by_id(ctx, track_id):
+async def play_track_by_id(ctx, track_id, priority=False):
     """Воспроизведение трека по ID"""
     if not await bot.music_player.join_voice_channel(ctx):
         return
@@ -173,15 +298,16 @@ async def play_track_by_id(ctx, track_id):
             return
         
         # Получаем URL для воспроизведения
-        track_url = await bot.yandex_client.get_track_url(track_id)
+        stream = await bot.music_player.resolve_stream(ctx.guild.id, track_id)
         
-        if not track_url:
+        if not stream:
             await search_msg.edit(content="❌ Не удалось получить ссылку на трек!")
             return
         
         # Добавляем в очередь
-        if await bot.music_player.add_to_queue(ctx, track_info, track_url):
-            await search_msg.edit(content=f"✅ Добавлено в очередь: **{track_info['title']}** - {track_info['artist']}")
+        if await bot.music_player.add_to_queue(ctx, track_info, stream, priority):
+            added = "Сыграет следующим" if priority else "Добавлено в очередь"
+            await search_msg.edit(content=f"✅ {added}: **{track_info['title']}** - {track_info['artist']}")
             
             # Если ничего не играет, начинаем воспроизведение
             voice_client = bot.music_player.get_voice_client(ctx.guild.id)
@@ -189,12 +315,16 @@ async def play_track_by_id(ctx, track_id):
                 await bot.music_player.play_next(ctx)
     
     except Exception as e:
-        logger.error(f"Ошибка воспроизведения трека по ID: {e}")
+        logger.error("Ошибка воспроизведения трека по ID: %s", e)
         await search_msg.edit(content="❌ Произошла ошибка при загрузке трека!")
 
 @bot.hybrid_command(name='mywave', aliases=['mw'], description="Воспроизведение 'Моя волна'")
 async def my_wave(ctx):
     """Воспроизведение 'Моя волна' из Яндекс.Музыки"""
+    await run_in_worker(ctx, start_my_wave(ctx), 'mywave')
+
+async def start_my_wave(ctx):
+    """Подключение и первый трек 'Моя волна'"""
     if not await bot.music_player.join_voice_channel(ctx):
         return
     
@@ -217,20 +347,16 @@ async def my_wave(ctx):
                 await search_msg.edit(content="❌ У трека отсутствует ID!")
                 return
             
-            track_url = await bot.yandex_client.get_track_url(track['id'])
+            stream = await bot.music_player.resolve_stream(ctx.guild.id, track['id'])
             
-            if track_url and await bot.music_player.add_to_queue(ctx, track, track_url):
-                # Создаем кнопки управления
-                from music_player import MusicControlView
-                view = MusicControlView(bot.music_player, ctx.guild.id)
-                
+            if stream and await bot.music_player.add_to_queue(ctx, track, stream):
                 embed = discord.Embed(
                     title="✅ Добавлен трек из 'Моя волна'",
                     description=f"**{track['title']}**\n{track['artist']}",
                     color=0x00ff00
                 )
                 
-                await search_msg.edit(content=None, embed=embed, view=view)
+                await search_msg.edit(content=None, embed=embed, view=bot.music_player.control_layout(ctx.guild.id))
                 
                 # Включаем режим "Моя волна" для автоматического обновления треков
                 bot.music_player.my_wave_mode[ctx.guild.id] = True
@@ -245,7 +371,7 @@ async def my_wave(ctx):
             await search_msg.edit(content="❌ Не удалось получить треки из 'Моя волна'!")
     
     except Exception as e:
-        logger.error(f"Ошибка в команде mywave: {e}")
+        logger.error("Ошибка в команде mywave: %s", e)
         await search_msg.edit(content="❌ Произошла ошибка при загрузке 'Моя волна'!")
 
 @bot.command(name='mywavetest')
@@ -276,7 +402,7 @@ async def my_wave_test_command(ctx):
         await ctx.send(embed=embed)
         
     except Exception as e:
-        logger.error(f"Ошибка команды mywavetest: {e}")
+        logger.error("Ошибка команды mywavetest: %s", e)
         await ctx.send(f"❌ Ошибка тестирования 'Моя волна': {e}")
 
 @bot.command(name='radiodebug')
@@ -285,8 +411,8 @@ async def radio_debug_command(ctx):
     try:
         await ctx.send("🔍 Отладка радиостанций...")
         
-        # Получаем радиостанции (синхронный вызов)
-        stations = bot.yandex_client.client.rotor_stations_dashboard()
+        # Получаем радиостанции
+        stations = await bot.yandex_client.call_api('rotor_stations_dashboard')
         
         if not stations or not hasattr(stations, 'stations'):
             await ctx.send("❌ Не удалось получить радиостанции")
@@ -313,7 +439,7 @@ async def radio_debug_command(ctx):
         await ctx.send(embed=embed)
         
     except Exception as e:
-        logger.error(f"Ошибка команды radiodebug: {e}")
+        logger.error("Ошибка команды radiodebug: %s", e)
         await ctx.send(f"❌ Ошибка отладки радиостанций: {e}")
 
 @bot.command(name='radiotest')
@@ -326,8 +452,8 @@ async def radio_test_command(ctx, station_id=None):
     try:
         await ctx.send(f"🔍 Тестирую радиостанцию {station_id}...")
         
-        # Получаем треки с радиостанции (синхронный вызов)
-        station_tracks = bot.yandex_client.client.rotor_station_tracks(station_id)
+        # Получаем треки с радиостанции
+        station_tracks = await bot.yandex_client.call_api('rotor_station_tracks', station_id)
         
         if not station_tracks or not hasattr(station_tracks, 'sequence'):
             await ctx.send("❌ Не удалось получить треки с радиостанции")
@@ -364,7 +490,7 @@ async def radio_test_command(ctx, station_id=None):
             await ctx.send("❌ Не найдено треков на радиостанции")
         
     except Exception as e:
-        logger.error(f"Ошибка команды radiotest: {e}")
+        logger.error("Ошибка команды radiotest: %s", e)
         await ctx.send(f"❌ Ошибка тестирования радиостанции: {e}")
 
 @bot.command(name='mywavedirect')
@@ -395,7 +521,7 @@ async def my_wave_direct_command(ctx):
         await ctx.send(embed=embed)
         
     except Exception as e:
-        logger.error(f"Ошибка команды mywavedirect: {e}")
+        logger.error("Ошибка команды mywavedirect: %s", e)
         await ctx.send(f"❌ Ошибка прямого тестирования user:onyourwave: {e}")
 
 @bot.hybrid_command(name='mywaveoff', description="Отключение режима 'Моя волна'")
@@ -410,7 +536,7 @@ async def my_wave_off_command(ctx):
             del bot.music_player.played_tracks[ctx.guild.id]
         await ctx.send("🔴 Режим 'Моя волна' отключен. Треки больше не будут автоматически обновляться.")
     except Exception as e:
-        logger.error(f"Ошибка команды mywaveoff: {e}")
+        logger.error("Ошибка команды mywaveoff: %s", e)
         await ctx.send(f"❌ Ошибка отключения режима 'Моя волна': {e}")
 
 @bot.hybrid_command(name='played', description='Показ статистики проигранных треков')
@@ -426,13 +552,18 @@ async def played_tracks_command(ctx):
             await ctx.send(f"📊 Проиграно треков: **{count}**")
             
     except Exception as e:
-        logger.error(f"Ошибка команды played: {e}")
+        logger.error("Ошибка команды played: %s", e)
         await ctx.send(f"❌ Ошибка получения статистики: {e}")
 
 @bot.hybrid_command(name='skip', aliases=['s'], description='Пропуск текущего трека')
 async def skip_song(ctx):
     """Пропуск текущего трека"""
-    await bot.music_player.skip_song(ctx)
+    voice_client = bot.music_player.get_voice_client(ctx.guild.id)
+    if not voice_client or not voice_client.is_playing():
+        await ctx.send("Сейчас ничего не играет!", ephemeral=True)
+        return
+    # В режиме "Моя волна" пропуск ждет API
+    await run_in_worker(ctx, bot.music_player.skip_song(ctx), 'skip')
 
 @bot.hybrid_command(name='pause', description='Пауза воспроизведения')
 async def pause_song(ctx):
@@ -444,16 +575,82 @@ async def resume_song(ctx):
     """Возобновление воспроизведения"""
     await bot.music_player.resume_song(ctx)
 
+@bot.hybrid_command(name='seek', description='Перемотка текущего трека')
+@app_commands.describe(position='Позиция: 1:30, 90, +15 или -10 секунд')
+async def seek(ctx, position: str):
+    """Перемотка текущего трека"""
+    await bot.music_player.seek(ctx, position)
+
 @bot.hybrid_command(name='stop', description='Остановка и очистка очереди')
 async def stop_playback(ctx):
     """Остановка воспроизведения"""
     await bot.music_player.stop_playback(ctx)
 
+@bot.hybrid_command(name='volume', aliases=['vol'], description='Громкость воспроизведения')
+@app_commands.describe(percent='Громкость в процентах (без значения — текущая)')
+async def set_volume(ctx, percent: int = None):
+    """Громкость воспроизведения"""
+    await bot.music_player.set_volume(ctx, percent)
+
+@bot.hybrid_command(name='normalize', description='Выравнивание громкости треков')
+@app_commands.describe(enabled='Включить или выключить (без значения — текущее состояние)')
+async def set_normalization(ctx, enabled: bool = None):
+    """Включение и выключение нормализации громкости"""
+    await bot.music_player.set_normalization(ctx, enabled)
+
+@bot.hybrid_command(name='eq', description='Эквалайзер: низкие, средние, высокие (дБ)')
+@app_commands.describe(bass='Низкие частоты, дБ', mid='Средние частоты, дБ', treble='Высокие частоты, дБ')
+async def set_equalizer(ctx, bass: float = 0.0, mid: float = 0.0, treble: float = 0.0):
+    """Трехполосный эквалайзер (без параметров — сброс)"""
+    await bot.music_player.set_equalizer(ctx, bass, mid, treble)
+
 @bot.hybrid_command(name='queue', aliases=['q'], description='Показ текущей очереди')
 async def show_queue(ctx):
     """Показ текущей очереди"""
     await bot.music_player.show_queue(ctx)
 
+@bot.hybrid_command(name='remove', aliases=['rm'], description='Удаление трека из очереди')
+@app_commands.describe(position='Номер трека в очереди')
+async def remove_from_queue(ctx, position: int):
+    """Удаление трека из очереди по номеру"""
+    await bot.music_player.remove_from_queue(ctx, position)
+
+@bot.hybrid_command(name='move', aliases=['mv'], description='Перенос трека на другую позицию очереди')
+@app_commands.describe(source='Текущий номер трека', target='Новый номер трека')
+async def move_in_queue(ctx, source: int, target: int):
+    """Перенос трека в очереди"""
+    await bot.music_player.move_in_queue(ctx, source, target)
+
+@bot.hybrid_command(name='shuffle', description='Перемешивание очереди')
+async def shuffle_queue(ctx):
+    """Перемешивание очереди"""
+    await bot.music_player.shuffle_queue(ctx)
+
+@bot.hybrid_command(name='jump', aliases=['j'], description='Переход к треку очереди')
+@app_commands.describe(position='Номер трека в очереди')
+async def jump_to(ctx, position: int):
+    """Переход к треку очереди по номеру"""
+    await run_in_worker(ctx, bot.music_player.jump_to(ctx, position), 'jump')
+
+@bot.hybrid_command(name='previous', aliases=['prev', 'back'], description='Предыдущий трек из истории')
+async def previous_track(ctx):
+    """Возврат к предыдущему треку без повторного поиска"""
+    if not bot.music_player.get_history(ctx.guild.id):
+        await ctx.send("❌ История пуста", ephemeral=True)
+        return
+    
+    async def go_back():
+        if await bot.music_player.join_voice_channel(ctx):
+            await bot.music_player.previous_track(ctx)
+    
+    await run_in_worker(ctx, go_back(), 'previous')
+
+@bot.hybrid_command(name='repeat', aliases=['loop'], description='Режим повтора: off, one или queue')
+@app_commands.describe(mode='off — выключен, one — текущий трек, queue — вся очередь')
+async def set_repeat(ctx, mode: str = None):
+    """Режим повтора (без параметра — следующий по кругу)"""
+    await bot.music_player.set_repeat(ctx, mode.lower() if mode else None)
+
 @bot.hybrid_command(name='disconnect', aliases=['dc'], description='Отключение от голосового канала')
 async def disconnect_bot(ctx):
     """Отключение бота от голосового канала"""
@@ -466,27 +663,33 @@ async def play_playlist(ctx, *, query: str = None):
     if not query:
         await ctx.send("❌ Укажите название плейлиста! Пример: `!playlist название плейлиста`")
         return
-    
+    await run_in_worker(ctx, load_playlist(ctx, query), 'playlist')
+
+async def load_playlist(ctx, query):
+    """Поиск плейлиста или альбома и запуск первой страницы треков"""
     if not await bot.music_player.join_voice_channel(ctx):
         return
     
     search_msg = await ctx.send("🔍 Ищу плейлист...")
     
+    pages = None  # Закрывается здесь, пока не передан фоновой задаче
+    is_album = isinstance(query, str) and "music.yandex.ru/album/" in query
     try:
-        import random
         # 1) Если пришла ссылка на альбом — воспроизводим альбом
-        if isinstance(query, str) and "music.yandex.ru/album/" in query:
+        if is_album:
+            album_id = query.split("music.yandex.ru/album/")[-1].split('?')[0].split('/')[0]
+            pages = bot.playlist_manager.iter_album_tracks(album_id, limit=10, page_size=PLAYLIST_FIRST_PAGE_SIZE, shuffle=True)
             try:
-                album_id = query.split("music.yandex.ru/album/")[-1].split('?')[0].split('/')[0]
-                album_tracks = await bot.playlist_manager.get_album_tracks(album_id, limit=50)
-                if not album_tracks:
-                    await search_msg.edit(content="❌ Не удалось получить треки альбома!")
-                    return
-                tracks = random.sample(album_tracks, min(10, len(album_tracks)))
+                first_page = await pages.__anext__()
+            except StopAsyncIteration:
+                first_page = []
             except Exception as album_err:
-                logger.error(f"Ошибка парсинга/загрузки альбома: {album_err}")
+                logger.error("Ошибка парсинга/загрузки альбома: %s", album_err)
                 await search_msg.edit(content="❌ Ошибка обработки ссылки альбома!")
                 return
+            if not first_page:
+                await search_msg.edit(content="❌ Не удалось получить треки альбома!")
+                return
         else:
             # 2) Иначе ищем пользовательский плейлист (или URL плейлиста)
             playlists = await bot.playlist_manager.search_playlists(query, limit=5)
@@ -494,40 +697,77 @@ async def play_playlist(ctx, *, query: str = None):
                 await search_msg.edit(content="❌ Плейлист не найден!")
                 return
             playlist = playlists[0]
-            tracks_list = await bot.playlist_manager.get_playlist_tracks(playlist['id'], limit=50)
-            if not tracks_list:
+            pages = bot.playlist_manager.iter_playlist_tracks(playlist['id'], limit=10, page_size=PLAYLIST_FIRST_PAGE_SIZE, shuffle=True)
+            
+            # Ждем только первую страницу, остальные догружаются в фоне
+            try:
+                first_page = await pages.__anext__()
+            except StopAsyncIteration:
+                first_page = []
+            
+            if not first_page:
                 await search_msg.edit(content="❌ Плейлист пуст!")
                 return
-            tracks = random.sample(tracks_list, min(10, len(tracks_list)))
-        
-        if not tracks:
-            await search_msg.edit(content="❌ Плейлист пуст!")
-            return
         
-        # Добавляем треки в очередь
+        # Первый трек добавляем сразу, чтобы начать воспроизведение как можно раньше
         added_count = 0
-        for track in tracks:
-            track_url = await bot.yandex_client.get_track_url(track['id'])
-            if track_url and await bot.music_player.add_to_queue(ctx, track, track_url):
+        remaining = list(first_page)
+        while remaining and added_count == 0:
+            track = remaining.pop(0)
+            stream = await bot.music_player.resolve_stream(ctx.guild.id, track['id'])
+            if stream and await bot.music_player.add_to_queue(ctx, track, stream):
                 added_count += 1
         
-        if added_count > 0:
-            await search_msg.edit(content=f"✅ Добавлено {added_count} треков в очередь!")
-            
-            # Если ничего не играет, начинаем воспроизведение
-            voice_client = bot.music_player.get_voice_client(ctx.guild.id)
-            if not voice_client.is_playing():
-                await bot.music_player.play_next(ctx)
-        else:
+        if added_count == 0:
             await search_msg.edit(content="❌ Не удалось добавить треки в очередь!")
+            return
+        
+        await search_msg.edit(content="✅ Воспроизведение начато, остальные треки добавляются...")
+        
+        # Если ничего не играет, начинаем воспроизведение
+        voice_client = bot.music_player.get_voice_client(ctx.guild.id)
+        if not voice_client.is_playing():
+            await bot.music_player.play_next(ctx)
+        
+        spawn_background(enqueue_remaining_tracks, ctx, remaining, pages, search_msg, added_count)
+        pages = None  # Страницы теперь закрывает enqueue_remaining_tracks
     
     except Exception as e:
-        logger.error(f"Ошибка в команде playlist: {e}")
+        logger.error("Ошибка в команде playlist: %s", e)
         await search_msg.edit(content="❌ Произошла ошибка при загрузке плейлиста!")
+    finally:
+        # Иначе предзагрузка страниц в _iter_hydrated_pages продолжит работать
+        if pages is not None:
+            await pages.aclose()
+
+async def enqueue_remaining_tracks(ctx, tracks, pages, status_msg, added_count):
+    """Фоновое добавление оставшихся треков плейлиста в очередь"""
+    try:
+        while True:
+            for track in tracks:
+                # После !stop или отключения дальше не добавляем
+                if not bot.music_player.get_voice_client(ctx.guild.id):
+                    return
+                stream = await bot.music_player.resolve_stream(ctx.guild.id, track['id'])
+                if stream and await bot.music_player.add_to_queue(ctx, track, stream):
+                    added_count += 1
+            try:
+                tracks = await pages.__anext__()
+            except StopAsyncIteration:
+                break
+        await status_msg.edit(content=f"✅ Добавлено {added_count} треков в очередь!")
+    except Exception as e:
+        logger.error("Ошибка фонового добавления треков плейлиста: %s", e)
+    finally:
+        await pages.aclose()
 
 @bot.hybrid_command(name='liked', aliases=['l'], description='Воспроизведение лайкнутых треков')
 async def play_liked_tracks(ctx):
     """Воспроизведение лайкнутых треков"""
+    await run_in_worker(ctx, load_liked_tracks(ctx), 'liked')
+
+async def load_liked_tracks(ctx):
+    """Добавление лайкнутых треков в очередь"""
     if not await bot.music_player.join_voice_channel(ctx):
         return
     
@@ -544,8 +784,8 @@ async def play_liked_tracks(ctx):
         # Добавляем треки в очередь
         added_count = 0
         for track in tracks:
-            track_url = await bot.yandex_client.get_track_url(track['id'])
-            if track_url and await bot.music_player.add_to_queue(ctx, track, track_url):
+            stream = await bot.music_player.resolve_stream(ctx.guild.id, track['id'])
+            if stream and await bot.music_player.add_to_queue(ctx, track, stream):
                 added_count += 1
         
         if added_count > 0:
@@ -559,7 +799,7 @@ async def play_liked_tracks(ctx):
             await search_msg.edit(content="❌ Не удалось добавить треки в очередь!")
     
     except Exception as e:
-        logger.error(f"Ошибка в команде liked: {e}")
+        logger.error("Ошибка в команде liked: %s", e)
         await search_msg.edit(content="❌ Произошла ошибка при загрузке лайкнутых треков!")
 
 @bot.command(name='testliked')
@@ -569,14 +809,11 @@ async def test_liked_command(ctx):
         await ctx.send("🔍 Тестирую получение лайкнутых треков...")
         
         # Получаем лайкнутые треки напрямую
-        liked_tracks = await asyncio.get_event_loop().run_in_executor(
-            None,
-            bot.yandex_client.client.users_likes_tracks
-        )
+        liked_tracks = await bot.yandex_client.call_api('users_likes_tracks')
         
         logger.info("Получены лайкнутые треки (объект получен)")
         if hasattr(liked_tracks, 'tracks'):
-            logger.info(f"Количество треков: {len(liked_tracks.tracks) if liked_tracks.tracks else 0}")
+            logger.info("Количество треков: %s", len(liked_tracks.tracks) if liked_tracks.tracks else 0)
         
         if liked_tracks and hasattr(liked_tracks, 'tracks') and liked_tracks.tracks:
             # Получаем ID треков
@@ -589,23 +826,22 @@ async def test_liked_command(ctx):
                     elif isinstance(track_short, dict) and 'id' in track_short:
                         track_ids.append(track_short['id'])
                     else:
-                        logger.warning(f"Не удалось получить ID для трека {i}: {track_short}")
+                        logger.warning("Не удалось получить ID для трека %s: %s", i, track_short)
                 except Exception as e:
-                    logger.warning(f"Ошибка получения ID трека {i}: {e}")
+                    logger.warning("Ошибка получения ID трека %s: %s", i, e)
             
-            logger.info(f"Загружаю {len(track_ids)} трек(а/ов)")
+            logger.info("Загружаю %s трек(а/ов)", len(track_ids))
             
             if track_ids:
                 # Загружаем полную информацию о треках
                 try:
                     # Используем tracks API напрямую
-                    full_tracks = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        bot.yandex_client.client.tracks,
+                    full_tracks = await bot.yandex_client.call_api(
+                        'tracks',
                         track_ids
                     )
                     
-                    logger.info(f"Загружено {len(full_tracks) if full_tracks else 0} треков")
+                    logger.info("Загружено %s треков", len(full_tracks) if full_tracks else 0)
                     
                     tracks = []
                     if full_tracks:
@@ -619,7 +855,7 @@ async def test_liked_command(ctx):
                                 }
                                 tracks.append(track_info)
                 except Exception as fetch_error:
-                    logger.error(f"Ошибка загрузки треков: {fetch_error}")
+                    logger.error("Ошибка загрузки треков: %s", fetch_error)
                     tracks = []
             else:
                 tracks = []
@@ -645,7 +881,7 @@ async def test_liked_command(ctx):
             await ctx.send("❌ liked_tracks пуст или не содержит tracks")
         
     except Exception as e:
-        logger.error(f"Ошибка команды testliked: {e}")
+        logger.error("Ошибка команды testliked: %s", e)
         await ctx.send(f"❌ Ошибка тестирования лайкнутых треков: {e}")
 
 @bot.command(name='myplaylists')
@@ -684,7 +920,7 @@ async def my_playlists_command(ctx):
         await ctx.send(embed=embed)
         
     except Exception as e:
-        logger.error(f"Ошибка команды myplaylists: {e}")
+        logger.error("Ошибка команды myplaylists: %s", e)
         await ctx.send(f"❌ Ошибка загрузки плейлистов: {e}")
 
 @bot.command(name='test')
@@ -708,7 +944,7 @@ async def test_search(ctx, *, query=None):
         else:
             await ctx.send("❌ Треки не найдены!")
     except Exception as e:
-        logger.error(f"Ошибка тестового поиска: {e}")
+        logger.error("Ошибка тестового поиска: %s", e)
         await ctx.send(f"❌ Ошибка поиска: {e}")
 
 @bot.command(name='debug')
@@ -736,7 +972,7 @@ async def debug_api(ctx, *, query="тест"):
         await ctx.send(embed=embed)
         
     except Exception as e:
-        logger.error(f"Ошибка отладки: {e}")
+        logger.error("Ошибка отладки: %s", e)
         await ctx.send(f"❌ Ошибка отладки: {e}")
 
 @bot.command(name='url')
@@ -768,7 +1004,7 @@ async def test_track_url(ctx, *, track_id):
         await ctx.send(embed=embed)
         
     except Exception as e:
-        logger.error(f"Ошибка тестирования URL: {e}")
+        logger.error("Ошибка тестирования URL: %s", e)
         await ctx.send(f"❌ Ошибка тестирования URL: {e}")
 
 @bot.command(name='urltest')
@@ -816,7 +1052,7 @@ async def detailed_url_test(ctx, *, track_id):
         await ctx.send(embed=embed)
         
     except Exception as e:
-        logger.error(f"Ошибка детального тестирования URL: {e}")
+        logger.error("Ошибка детального тестирования URL: %s", e)
         await ctx.send(f"❌ Ошибка детального тестирования: {e}")
 
 @bot.hybrid_command(name='status', description='Проверка статуса бота')
@@ -851,8 +1087,86 @@ async def bot_status(ctx):
     else:
         embed.add_field(name="Сейчас играет", value="🔇 Ничего", inline=False)
     
+    # Аудиобуфер текущего трека
+    buffer = bot.music_player.buffer_health(ctx.guild.id)
+    if buffer:
+        embed.add_field(
+            name="Буфер",
+            value=f"{buffer['buffered_ms'] / 1000:.1f} с ({buffer['fill']:.0%}), опустошений: {buffer['underruns']}",
+            inline=True
+        )
+    
+    # Процессы FFmpeg всего бота
+    ffmpeg = bot.music_player.ffmpeg.stats()
+    limit = ffmpeg['limit'] or '∞'
+    embed.add_field(
+        name="FFmpeg",
+        value=f"{ffmpeg['active']}/{limit} (ждут: {ffmpeg['waiting']}), CPU {ffmpeg['cpu_percent']:.0f}%, "
+              f"RSS {ffmpeg['rss'] / 1024 / 1024:.0f} МБ",
+        inline=True
+    )
+    
+    # Аудиоузлы: потоки, CPU и память каждого процесса
+    if bot.music_player.nodes is not None:
+        nodes = bot.music_player.nodes.stats()
+        embed.add_field(
+            name="Аудиоузлы",
+            value="\n".join(
+                f"#{node['index']}: {node['streams']} пот., CPU {node['cpu_percent']:.0f}%, "
+                f"RSS {node['rss'] / 1024 / 1024:.0f} МБ" if node['alive'] else f"#{node['index']}: остановлен"
+                for node in nodes
+            ),
+            inline=False
+        )
+    
+    # Выбранный вариант трека и трафик CDN сервера
+    usage = bot.music_player.bandwidth_usage(ctx.guild.id)
+    if usage['bitrate'] or usage['bytes']:
+        variant = f"{(usage['codec'] or '?').upper()} {usage['bitrate']} кбит/с" if usage['bitrate'] else "—"
+        embed.add_field(
+            name="Поток",
+            value=f"{variant}, трафик: {usage['bytes'] / 1024 / 1024:.1f} МБ за {usage['tracks']} тр.",
+            inline=True
+        )
+    
+    # Состояние цикла событий
+    loop_stats = bot.loop_monitor.stats()
+    if loop_stats['running']:
+        loop_text = (
+            f"Задержка p50/p99: {loop_stats['lag_p50_ms']:.0f}/{loop_stats['lag_p99_ms']:.0f} мс, "
+            f"макс.: {loop_stats['lag_max_ms']:.0f} мс\n"
+            f"Зависаний: {loop_stats['stalls']}"
+        )
+        last_stall = loop_stats['last_stall']
+        if last_stall:
+            loop_text += f"\nПоследнее: {last_stall.duration * 1000:.0f} мс в `{last_stall.culprit}`"
+        embed.add_field(name="Цикл событий", value=loop_text, inline=False)
+    
     await ctx.send(embed=embed)
 
+@bot.command(name='trace')
+@commands.has_permissions(administrator=True)
+async def trace_command(ctx, *, command_name: str = None):
+    """Диаграмма последней трассы команды на этом сервере (для администраторов)"""
+    guild_id = ctx.guild.id if ctx.guild else None
+    
+    def matches(root):
+        if root.name == 'command.trace':
+            return False
+        if command_name and root.name != f"command.{command_name}":
+            return False
+        return root.attributes.get('guild') == guild_id
+    
+    root = tracer.find(matches)
+    if not root:
+        await ctx.send("📭 Трассы пока не записаны")
+        return
+    
+    text = render_waterfall(root)
+    if len(text) > 1900:
+        text = text[:1900] + "\n..."
+    await ctx.send(f"⏱️ **{root.name}** — {root.duration * 1000:.0f} мс\n```\n{text}\n```")
+
 @bot.hybrid_command(name='help', description='Показ справки по командам')
 async def help_command(ctx):
     """Показ справки по командам"""
@@ -864,6 +1178,7 @@ async def help_command(ctx):
     
     commands_list = [
         ("`!play <запрос>` / `/play`", "Поиск и воспроизведение трека"),
+        ("`!playnext <запрос>` / `/playnext`", "Трек вне очереди, сыграет следующим (право перемещать участников)"),
         ("`!mywave` / `/mywave`", "Воспроизведение 'Моя волна'"),
         ("`!mywavetest`", "Тестирование 'Моя волна'"),
         ("`!radiodebug`", "Отладка радиостанций"),
@@ -879,21 +1194,33 @@ async def help_command(ctx):
         ("`!url <ID_трека>`", "Тестирование получения URL трека"),
         ("`!urltest <ID_трека>`", "Детальное тестирование URL"),
         ("`!status` / `/status`", "Проверка статуса бота"),
+        ("`!trace [команда]`", "Диаграмма времени последней команды (админ)"),
         ("`!skip` / `/skip`", "Пропуск текущего трека"),
         ("`!pause` / `/pause`", "Пауза воспроизведения"),
         ("`!resume` / `/resume`", "Возобновление воспроизведения"),
+        ("`!seek <позиция>` / `/seek`", "Перемотка: `1:30`, `90`, `+15`, `-10`"),
         ("`!stop` / `/stop`", "Остановка и очистка очереди"),
+        ("`!volume [0-200]` / `/volume`", "Громкость воспроизведения"),
+        ("`!normalize [on/off]` / `/normalize`", "Выравнивание громкости треков"),
+        ("`!eq <низ.> <сред.> <выс.>` / `/eq`", "Эквалайзер в дБ (без параметров — сброс)"),
         ("`!queue` / `/queue`", "Показ текущей очереди"),
+        ("`!remove <N>`, `!move <N> <M>`, `!shuffle`, `!jump <N>`", "Правка очереди по номерам из `!queue` (есть и slash)"),
+        ("`!previous` / `/previous`", "Предыдущий трек из истории"),
+        ("`!repeat [off/one/queue]` / `/repeat`", "Повтор трека или очереди, без параметра — следующий режим"),
         ("`!disconnect` / `/disconnect`", "Отключение от голосового канала"),
         ("`!help` / `/help`", "Показ этой справки")
     ]
     
+    # В одном embed не больше 25 полей — остальные команды идут в следующий
+    embeds = [embed]
     for command, description in commands_list:
-        embed.add_field(name=command, value=description, inline=False)
+        if len(embeds[-1].fields) == 25:
+            embeds.append(discord.Embed(color=0x00ff00))
+        embeds[-1].add_field(name=command, value=description, inline=False)
     
-    embed.set_footer(text="Бот для воспроизведения музыки через Яндекс.Музыку • Версия 1.0")
+    embeds[-1].set_footer(text="Бот для воспроизведения музыки через Яндекс.Музыку • Версия 1.0")
     
-    await ctx.send(embed=embed)
+    await ctx.send(embeds=embeds)
 
 # Команда release удалена по пожеланию пользователя
 
@@ -905,5 +1232,5 @@ if __name__ == "__main__":
     try:
         bot.run(DISCORD_TOKEN)
     except Exception as e:
-        logger.error(f"Ошибка запуска бота: {e}")
+        logger.error("Ошибка запуска бота: %s", e)
 
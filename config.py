@@ -14,6 +14,103 @@ YANDEX_TOKEN = os.getenv('YANDEX_TOKEN')
 MAX_QUEUE_SIZE = int(os.getenv('MAX_QUEUE_SIZE', 50))
 MAX_SONG_LENGTH = 600  # 10 minutes in seconds
 
+# Queue Scheduling
+QUEUE_MODE = os.getenv('QUEUE_MODE', 'fifo').lower()  # fifo — по порядку добавления, fair — поочередно по заказавшим
+# Веса пользователей или ролей в режиме fair: "id=вес,..." (вес 2 — два трека за круг, по умолчанию 1)
+FAIR_QUEUE_WEIGHTS = {
+    int(key): float(value)
+    for key, _, value in (item.strip().partition('=') for item in os.getenv('FAIR_QUEUE_WEIGHTS', '').split(','))
+    if key.strip().isdigit() and value
+}
+
+# Cache Settings
+TRACK_CACHE_SIZE = int(os.getenv('TRACK_CACHE_SIZE', 5000))  # Метаданные треков
+TRACK_CACHE_TTL = int(os.getenv('TRACK_CACHE_TTL', 3600))  # Время жизни записи в секундах
+LIKED_SYNC_INTERVAL = int(os.getenv('LIKED_SYNC_INTERVAL', 60))  # Минимальный интервал проверки ревизии лайков
+
+# Playlist Loading
+PLAYLIST_PAGE_SIZE = int(os.getenv('PLAYLIST_PAGE_SIZE', 25))  # Треков в одном запросе tracks()
+PLAYLIST_PARALLEL_PAGES = int(os.getenv('PLAYLIST_PARALLEL_PAGES', 3))  # Одновременных запросов страниц
+PLAYLIST_CACHE_SIZE = int(os.getenv('PLAYLIST_CACHE_SIZE', 200))  # Снимков плейлистов и поисковых запросов
+PLAYLIST_SEARCH_TTL = int(os.getenv('PLAYLIST_SEARCH_TTL', 600))  # Время жизни результатов поиска в секундах
+PLAYLIST_REVISION_CHECK_INTERVAL = int(os.getenv('PLAYLIST_REVISION_CHECK_INTERVAL', 30))  # Без сверки ревизии
+
+# Observability
+EXECUTOR_WORKERS = int(os.getenv('EXECUTOR_WORKERS', 16))  # Потоков для блокирующих вызовов API
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))  # 0 — отключить эндпоинт /metrics
+TRACE_ENABLED = os.getenv('TRACE_ENABLED', '1') != '0'  # Трассировка команд и воспроизведения
+TRACE_HISTORY = int(os.getenv('TRACE_HISTORY', 50))  # Сколько последних трасс хранить для !trace
+TRACE_FILE = os.getenv('TRACE_FILE', '')  # Файл JSON Lines для экспорта трасс (пусто — не писать)
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', '')  # Например, http://127.0.0.1:4318/v1/traces
+LOOP_MONITOR_INTERVAL = float(os.getenv('LOOP_MONITOR_INTERVAL', 0.1))  # Период пульса цикла событий, с
+LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', 0.25))  # Задержка, после которой снимается стек (0 — выключить)
+BLOCKING_GUARD = os.getenv('BLOCKING_GUARD', 'warn').lower()  # off, warn или raise — HTTP-запрос yandex_music в цикле событий
+
+# Audio Buffering
+AUDIO_BUFFER_SECONDS = float(os.getenv('AUDIO_BUFFER_SECONDS', 10))  # Опережающее чтение (0 — без буфера)
+AUDIO_PREROLL_SECONDS = float(os.getenv('AUDIO_PREROLL_SECONDS', 2))  # Запас перед стартом трека
+AUDIO_PREROLL_TIMEOUT = float(os.getenv('AUDIO_PREROLL_TIMEOUT', 5))
+AUDIO_STARVE_TIMEOUT = float(os.getenv('AUDIO_STARVE_TIMEOUT', 15))  # Трек завершается, если поток молчит дольше
+FFMPEG_PROBESIZE = os.getenv('FFMPEG_PROBESIZE', '32768')  # Байт для определения формата (по умолчанию FFmpeg 5 МБ)
+FFMPEG_ANALYZEDURATION = os.getenv('FFMPEG_ANALYZEDURATION', '500000')  # мкс анализа потока (0 для FFmpeg — значение по умолчанию, 5 с)
+
+# FFmpeg Supervisor
+FFMPEG_MAX_PROCESSES = int(os.getenv('FFMPEG_MAX_PROCESSES', 128))  # Общий лимит процессов, до двух на играющий сервер (0 — без лимита)
+FFMPEG_ADMISSION_TIMEOUT = float(os.getenv('FFMPEG_ADMISSION_TIMEOUT', 10))  # Ожидание свободного слота, с
+FFMPEG_NICE = int(os.getenv('FFMPEG_NICE', 5))  # Понижение приоритета процессов FFmpeg (0 — как у бота)
+FFMPEG_CPU_AFFINITY = os.getenv('FFMPEG_CPU_AFFINITY', '')  # Ядра для FFmpeg: "2,3" или "2-5" (пусто — любые)
+FFMPEG_STUCK_SECONDS = float(os.getenv('FFMPEG_STUCK_SECONDS', 60))  # Процесс завершается, если чтение висит дольше
+FFMPEG_REAP_INTERVAL = float(os.getenv('FFMPEG_REAP_INTERVAL', 15))
+
+# Audio Nodes
+AUDIO_NODES = int(os.getenv('AUDIO_NODES', 0))  # Процессы-узлы для FFmpeg, эффектов и кодирования (0 — все в процессе бота)
+AUDIO_NODE_WINDOW = int(os.getenv('AUDIO_NODE_WINDOW', 25))  # Кадров, которые узел готовит наперед (по 20 мс)
+AUDIO_NODE_STATS_INTERVAL = float(os.getenv('AUDIO_NODE_STATS_INTERVAL', 2))  # Период отчета узла о нагрузке, с
+
+# Transitions
+GAPLESS_PRELOAD_SECONDS = float(os.getenv('GAPLESS_PRELOAD_SECONDS', 15))  # Подготовка следующего трека до конца текущего (0 — без бесшовных переходов)
+CROSSFADE_SECONDS = float(os.getenv('CROSSFADE_SECONDS', 0))  # Наложение треков (нужен numpy)
+
+# Stream Quality
+# auto — по битрейту голосового канала, max — всегда лучший вариант, число — нужный битрейт в кбит/с
+STREAM_QUALITY = os.getenv('STREAM_QUALITY', 'auto').lower()
+STREAM_CODECS = tuple(codec.strip().lower() for codec in os.getenv('STREAM_CODECS', 'aac,mp3').split(',') if codec.strip())  # Порядок предпочтения
+STREAM_BITRATE_HEADROOM = float(os.getenv('STREAM_BITRATE_HEADROOM', 1.5))  # Запас над битрейтом канала: источник перекодируется в Opus
+
+# Audio Effects
+DEFAULT_VOLUME = int(os.getenv('DEFAULT_VOLUME', 100))  # %
+MAX_VOLUME = int(os.getenv('MAX_VOLUME', 200))
+NORMALIZE_VOLUME = os.getenv('NORMALIZE_VOLUME', '1') != '0'  # Выравнивание громкости треков
+TARGET_LOUDNESS = float(os.getenv('TARGET_LOUDNESS', -14))  # LUFS
+
+# Voice Connections
+VOICE_LINGER_SECONDS = int(os.getenv('VOICE_LINGER_SECONDS', 60))  # Удержание соединения после !stop (0 — отключаться сразу)
+VOICE_CONNECT_TIMEOUT = float(os.getenv('VOICE_CONNECT_TIMEOUT', 10))
+VOICE_RECONNECT_ATTEMPTS = int(os.getenv('VOICE_RECONNECT_ATTEMPTS', 5))
+VOICE_RECONNECT_BASE_DELAY = float(os.getenv('VOICE_RECONNECT_BASE_DELAY', 0.5))  # Удваивается с каждой попыткой
+VOICE_RECONNECT_MAX_DELAY = float(os.getenv('VOICE_RECONNECT_MAX_DELAY', 15))
+
+# Now Playing Panel
+NOW_PLAYING_DEBOUNCE = float(os.getenv('NOW_PLAYING_DEBOUNCE', 1.0))  # Ожидание перед правкой: быстрые пропуски дают одну правку
+NOW_PLAYING_PROGRESS_INTERVAL = float(os.getenv('NOW_PLAYING_PROGRESS_INTERVAL', 0))  # Обновление полосы прогресса, с (0 — без прогресса, не чаще 5 с)
+MESSAGE_EDIT_INTERVAL = float(os.getenv('MESSAGE_EDIT_INTERVAL', 1.0))  # Не чаще одной отправки или правки в канал за это время, с
+
+# Playback State
+PLAYBACK_STATE_FILE = os.getenv('PLAYBACK_STATE_FILE', 'playback_state.json')  # Очередь и позиция для продолжения после перезапуска ('' — не сохранять)
+PLAYBACK_STATE_INTERVAL = int(os.getenv('PLAYBACK_STATE_INTERVAL', 10))  # Период сохранения, с
+TRACK_URL_TTL = int(os.getenv('TRACK_URL_TTL', 1800))  # Ссылки CDN временные: старше этого срока запрашиваются заново
+PLAYBACK_HISTORY_SIZE = int(os.getenv('PLAYBACK_HISTORY_SIZE', 20))  # Доигранные треки сервера для !previous (со ссылками, без повторного поиска)
+
+# Logging
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))  # Размер файла до ротации
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # text или json
+# Доля INFO/DEBUG записей, попадающих в лог, по модулям: "playlist_manager=0.1,yandex_client=0.25"
+LOG_SAMPLING = os.getenv('LOG_SAMPLING', '')
+
 # Error Messages
 ERROR_MESSAGES = {
     'no_voice_channel': 'Вы должны быть в голосовом канале!',
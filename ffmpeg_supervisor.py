@@ -0,0 +1,290 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+import threading
+import subprocess
+import discord
+from metrics import FFMPEG_ADMISSION_WAIT, FFMPEG_REAPED, FFMPEG_CPU, FFMPEG_RSS
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegBusy(Exception):
+    """Все слоты FFmpeg заняты дольше времени ожидания"""
+
+
+def parse_cpu_list(value):
+    """Список ядер из "0,2-3" (пустая строка — без привязки)"""
+    cpus = set()
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        start, _, end = part.partition('-')
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def _read_proc(pid):
+    """Процессорное время (с) и RSS (байт) процесса из /proc; None — недоступно (не Linux)"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            # Имя процесса в скобках может содержать пробелы — поля считаем после ')'
+            fields = f.read().rsplit(b')', 1)[1].split()
+        with open(f'/proc/{pid}/statm', 'rb') as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / ticks  # utime + stime
+    return cpu_seconds, rss_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class SupervisedSource(discord.AudioSource):
+    """Источник под надзором: занимает слот до cleanup() и отмечает зависшее чтение"""
+
+    def __init__(self, supervisor, source, guild_id):
+        self.source = source
+        self.guild_id = guild_id
+        self.started_at = time.monotonic()
+        self.read_started = None  # Начало текущего чтения (None — не читается)
+        self.cpu = None  # (процессорное время, момент замера) для расчета загрузки
+        self.cpu_percent = 0.0
+        self.rss = 0
+        self._supervisor = supervisor
+        self._released = False
+
+    @property
+    def _process(self):
+        process = getattr(self.source, '_process', None)
+        return process if isinstance(process, subprocess.Popen) else None
+
+    def read(self):
+        self.read_started = time.monotonic()
+        try:
+            return self.source.read()
+        finally:
+            self.read_started = None
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        try:
+            self.source.cleanup()
+        finally:
+            self._supervisor._release(self)
+
+
+class FFmpegSupervisor:
+    """Процессы FFmpeg всех серверов: проверка при запуске, общий лимит с очередью,
+    приоритет и привязка к ядрам, завершение зависших процессов и их CPU/RSS"""
+
+    def __init__(self, max_processes=128, admission_timeout=10.0, nice=0, affinity='',
+                 stuck_seconds=60.0, reap_interval=15.0, executable='ffmpeg'):
+        self.max_processes = max_processes
+        self.admission_timeout = admission_timeout
+        self.nice = nice
+        self.affinity = parse_cpu_list(affinity) if affinity else set()
+        self.stuck_seconds = stuck_seconds
+        self.reap_interval = reap_interval
+        self.executable = executable
+        self.path = None
+        self.version = None
+        self.protocols = set()
+        self._probed = False
+        self.sources = set()  # Живые SupervisedSource
+        self.waiting = 0  # Запуски в очереди за слотом
+        self._slots = None
+        self._loop = None
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    # Проверка FFmpeg
+
+    def probe(self):
+        """Поиск FFmpeg и его возможностей (один раз за запуск)"""
+        self._probed = True
+        self.path = shutil.which(self.executable)
+        if self.path is None:
+            logger.error("FFmpeg (%s) не найден в PATH", self.executable)
+            return False
+        try:
+            version = subprocess.run(
+                [self.path, '-hide_banner', '-version'], capture_output=True, text=True, timeout=10
+            )
+            self.version = (version.stdout.splitlines() or ['?'])[0]
+            protocols = subprocess.run(
+                [self.path, '-hide_banner', '-protocols'], capture_output=True, text=True, timeout=10
+            )
+            self.protocols = {line.strip() for line in protocols.stdout.splitlines()}
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.error("Не удалось проверить FFmpeg %s: %s", self.path, e)
+            self.path = None
+            return False
+        if 'https' not in self.protocols:
+            logger.warning("FFmpeg собран без https: ссылки CDN Яндекса воспроизводиться не будут")
+        logger.info("FFmpeg: %s (%s)", self.version, self.path)
+        return True
+
+    @property
+    def available(self):
+        if not self._probed:
+            self.probe()
+        return self.path is not None
+
+    # Допуск к запуску
+
+    @property
+    def active(self):
+        return len(self.sources)
+
+    def _semaphore(self):
+        if self._slots is None:
+            self._loop = asyncio.get_running_loop()
+            self._slots = asyncio.Semaphore(self.max_processes)
+        return self._slots
+
+    async def acquire(self, wait=True):
+        """Слот для нового процесса; wait=False — без очереди (для подготовки следующего трека).
+
+        FFmpegBusy — слот не освободился за admission_timeout.
+        """
+        if self.max_processes <= 0:
+            return
+        slots = self._semaphore()
+        if not wait:
+            if slots.locked():
+                raise FFmpegBusy()
+            await slots.acquire()
+            return
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(slots.acquire(), self.admission_timeout)
+        except asyncio.TimeoutError:
+            FFMPEG_ADMISSION_WAIT.labels('timeout').observe(time.perf_counter() - started)
+            raise FFmpegBusy() from None
+        finally:
+            self.waiting -= 1
+        FFMPEG_ADMISSION_WAIT.labels('ok').observe(time.perf_counter() - started)
+
+    def supervise(self, source, guild_id):
+        """Передача запущенного источника под надзор (слот уже получен через acquire)"""
+        supervised = SupervisedSource(self, source, guild_id)
+        with self._lock:
+            self.sources.add(supervised)
+        process = supervised._process
+        if process is not None:
+            self._limit(process.pid)
+        return supervised
+
+    def discard(self):
+        """Возврат слота, если источник так и не был создан"""
+        if self.max_processes > 0 and self._slots is not None:
+            self._slots.release()
+
+    def _release(self, supervised):
+        # Вызывается из потоков воспроизведения: семафор освобождается в цикле событий
+        with self._lock:
+            if supervised._released:
+                return
+            supervised._released = True
+            self.sources.discard(supervised)
+        if self.max_processes > 0 and self._slots is not None:
+            self._loop.call_soon_threadsafe(self._slots.release)
+
+    def _limit(self, pid):
+        """Приоритет и привязка к ядрам процесса FFmpeg (только там, где ОС это поддерживает)"""
+        try:
+            if self.nice and hasattr(os, 'setpriority'):
+                os.setpriority(os.PRIO_PROCESS, pid, self.nice)
+            if self.affinity and hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(pid, self.affinity)
+        except OSError as e:
+            logger.warning("Не удалось ограничить процесс FFmpeg %s: %s", pid, e)
+
+    # Надзор
+
+    def start(self):
+        """Периодическая проверка процессов"""
+        if self._reaper is None and self.reap_interval > 0:
+            self._reaper = asyncio.ensure_future(self._reap_loop())
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error("Ошибка проверки процессов FFmpeg: %s", e)
+
+    def reap(self):
+        """Замер CPU/RSS, завершение зависших процессов и освобождение слотов завершившихся"""
+        now = time.monotonic()
+        for supervised in list(self.sources):
+            process = supervised._process
+            if process is None:
+                continue
+            if process.poll() is not None:
+                # Процесс завершился (poll забирает код возврата — зомби не остается), а трек еще
+                # доигрывается из буфера или ждет очереди: слот отдается новым процессам
+                if process.returncode not in (0, -9):
+                    FFMPEG_REAPED.labels('crashed').inc()
+                    logger.warning(
+                        "FFmpeg %s сервера %s завершился с кодом %s", process.pid, supervised.guild_id, process.returncode
+                    )
+                self._release(supervised)
+                continue
+            self._sample(supervised, process.pid, now)
+            if supervised.read_started is not None and now - supervised.read_started > self.stuck_seconds:
+                # Чтение висит: CDN не отвечает, а FFmpeg не переподключился
+                FFMPEG_REAPED.labels('stuck').inc()
+                logger.warning(
+                    "FFmpeg %s сервера %s не отдает звук %.0f с, процесс завершается",
+                    process.pid, supervised.guild_id, now - supervised.read_started
+                )
+                process.kill()
+
+    def _sample(self, supervised, pid, now):
+        usage = _read_proc(pid)
+        if usage is None:
+            return
+        cpu_seconds, supervised.rss = usage
+        if supervised.cpu is not None:
+            previous, moment = supervised.cpu
+            if now > moment:
+                supervised.cpu_percent = (cpu_seconds - previous) / (now - moment) * 100
+        supervised.cpu = (cpu_seconds, now)
+
+    def usage_by_guild(self):
+        """Загрузка CPU (%) и RSS (байт) процессов FFmpeg по серверам по последнему замеру"""
+        usage = {}
+        for supervised in list(self.sources):
+            cpu, rss = usage.get(supervised.guild_id, (0.0, 0))
+            usage[supervised.guild_id] = (cpu + supervised.cpu_percent, rss + supervised.rss)
+        return usage
+
+    def stats(self):
+        """Сводка для !status"""
+        usage = self.usage_by_guild().values()
+        return {
+            'active': self.active,
+            'limit': self.max_processes,
+            'waiting': self.waiting,
+            'cpu_percent': sum(cpu for cpu, _ in usage),
+            'rss': sum(rss for _, rss in usage),
+        }
+
+    def register_metrics(self):
+        FFMPEG_CPU.set_function(lambda: {guild_id: cpu for guild_id, (cpu, _) in self.usage_by_guild().items()})
+        FFMPEG_RSS.set_function(lambda: {guild_id: rss for guild_id, (_, rss) in self.usage_by_guild().items()})
+
+    async def stop(self):
+        """Остановка надзора и завершение оставшихся процессов"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for supervised in list(self.sources):
+            process = supervised._process
+            if process is not None and process.poll() is None:
+                process.kill()
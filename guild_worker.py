@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from tracing import detached, activated, current_span
+
+logger = logging.getLogger(__name__)
+
+
+class GuildWorkers:
+    """Фоновая работа серверов: у каждого сервера своя очередь и один обработчик.
+
+    Кнопки и slash-команды подтверждают взаимодействие сразу, а долгие действия (запросы к API,
+    запуск FFmpeg) выполняются здесь по порядку поступления; результат отправляется отдельным сообщением.
+    Обработчик сервера завершается, если задач нет idle_timeout секунд. Отрезки задачи
+    попадают в трассу того, кто ее поставил (команда ждет результат).
+    """
+
+    def __init__(self, idle_timeout=60.0):
+        self.idle_timeout = idle_timeout
+        self.queues = {}
+        self.tasks = {}
+
+    def submit(self, guild_id, coro, name='job'):
+        """Постановка корутины в очередь сервера; возвращает Future с ее результатом"""
+        future = asyncio.get_running_loop().create_future()
+        # Результат нужен не всегда: ошибка уже записана в лог, предупреждение asyncio не нужно
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        queue = self.queues.get(guild_id)
+        if queue is None:
+            queue = self.queues[guild_id] = asyncio.Queue()
+            self.tasks[guild_id] = asyncio.ensure_future(detached(self._run, guild_id, queue))
+        queue.put_nowait((name, coro, future, current_span()))
+        return future
+
+    def pending(self, guild_id):
+        queue = self.queues.get(guild_id)
+        return queue.qsize() if queue is not None else 0
+
+    async def _next_job(self, queue):
+        """Следующая задача или None, если задач не было idle_timeout секунд.
+
+        Не через wait_for: он может отменить get(), который уже забрал задачу из очереди,
+        и задача потеряется вместе с ее Future.
+        """
+        getter = asyncio.ensure_future(queue.get())
+        try:
+            done, _ = await asyncio.wait({getter}, timeout=self.idle_timeout)
+        finally:
+            if not getter.done():
+                getter.cancel()
+        if done:
+            return getter.result()
+        try:
+            return await getter  # Задача могла прийти одновременно с отменой
+        except asyncio.CancelledError:
+            return None
+
+    async def _run(self, guild_id, queue):
+        try:
+            while True:
+                job = await self._next_job(queue)
+                if job is None:
+                    if queue.empty():
+                        return
+                    continue
+                name, coro, future, span = job
+                try:
+                    with activated(span):
+                        result = await coro
+                    if not future.done():  # Ожидавшая команда могла быть отменена
+                        future.set_result(result)
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    logger.error("Ошибка фоновой задачи %s сервера %s: %s", name, guild_id, e)
+                    if not future.done():
+                        future.set_exception(e)
+        finally:
+            # Очередь снимается при любом выходе: иначе новые задачи сервера ждали бы вечно
+            if self.queues.get(guild_id) is queue:
+                del self.queues[guild_id]
+                self.tasks.pop(guild_id, None)
+            while not queue.empty():
+                _, coro, future, _ = queue.get_nowait()
+                coro.close()
+                future.cancel()
+
+    async def stop(self):
+        """Отмена обработчиков и незапущенных задач"""
+        for task in self.tasks.values():
+            task.cancel()
+        for queue in self.queues.values():
+            while not queue.empty():
+                _, coro, future, _ = queue.get_nowait()
+                coro.close()
+                future.cancel()
+        self.queues.clear()
+        self.tasks.clear()
@@ -0,0 +1,118 @@
+import asyncio
+import time
+import random
+import logging
+from array import array
+
+logger = logging.getLogger(__name__)
+
+class LikedTracksIndex:
+    """Компактный индекс ID лайкнутых треков одного аккаунта (в порядке библиотеки: новые первыми)"""
+
+    def __init__(self, uid):
+        self.uid = uid
+        self.revision = None  # Ревизия библиотеки, с которой синхронизирован индекс
+        self.numeric_ids = array('q')  # Числовые ID треков по позициям; -1 — ID в other_ids
+        self.other_ids = {}  # Позиция -> нечисловой ID (загруженные пользователем треки и т.п.)
+        self.synced_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.numeric_ids)
+
+    def rebuild(self, revision, track_shorts):
+        """Пересборка индекса по списку TrackShort"""
+        numeric_ids = array('q')
+        other_ids = {}
+        for track_short in track_shorts:
+            track_id = getattr(track_short, 'id', None)
+            if track_id is None and isinstance(track_short, dict):
+                track_id = track_short.get('id')
+            if not track_id:
+                continue
+            track_id = str(track_id)
+            if track_id.isdigit():
+                numeric_ids.append(int(track_id))
+            else:
+                other_ids[len(numeric_ids)] = track_id
+                numeric_ids.append(-1)
+
+        self.numeric_ids = numeric_ids
+        self.other_ids = other_ids
+        self.revision = revision
+
+    def _id_at(self, position):
+        """ID трека по позиции в индексе"""
+        track_id = self.numeric_ids[position]
+        return str(track_id) if track_id >= 0 else self.other_ids[position]
+
+    def sample(self, k):
+        """Случайная выборка k ID без копирования индекса"""
+        total = len(self)
+        k = min(k, total)
+        return [self._id_at(position) for position in random.sample(range(total), k)]
+
+    def head(self, k):
+        """Первые k ID индекса (без случайной выборки)"""
+        return [self._id_at(position) for position in range(min(k, len(self)))]
+
+
+class LikedTracksStore:
+    """Хранилище индексов лайкнутых треков с синхронизацией по ревизии библиотеки"""
+
+    def __init__(self, yandex_client, sync_interval=60):
+        self.yandex_client = yandex_client
+        self.sync_interval = sync_interval
+        self._indexes = {}  # uid -> LikedTracksIndex
+
+    def get_index(self, uid):
+        """Получение индекса для аккаунта"""
+        if uid not in self._indexes:
+            self._indexes[uid] = LikedTracksIndex(uid)
+        return self._indexes[uid]
+
+    async def sync(self, force=False):
+        """Синхронизация индекса текущего аккаунта; возвращает индекс или None"""
+        if not self.yandex_client.is_authenticated:
+            return None
+
+        uid = self.yandex_client.get_account_uid()
+        index = self.get_index(uid)
+
+        async with index.lock:
+            if not force and index.revision is not None and time.monotonic() - index.synced_at < self.sync_interval:
+                return index
+
+            # Если ревизия не изменилась, API вернет только uid и revision без списка треков
+            liked_tracks = await self.yandex_client.call_api(
+                'users_likes_tracks',
+                uid,
+                if_modified_since_revision=index.revision or 0
+            )
+            index.synced_at = time.monotonic()
+
+            if not liked_tracks:
+                return index
+
+            revision = getattr(liked_tracks, 'revision', None)
+            if index.revision is not None and revision == index.revision:
+                logger.debug("Лайки не изменились (ревизия %s)", revision)
+                return index
+
+            index.rebuild(revision, liked_tracks.tracks or [])
+            logger.info("Индекс лайков обновлен: %s треков, ревизия %s", len(index), revision)
+            return index
+
+    async def head_tracks(self, limit):
+        """Последние лайкнутые треки по порядку с загрузкой метаданных через кэш"""
+        index = await self.sync()
+        if not index or not len(index):
+            return []
+        return await self.yandex_client.get_tracks_info(index.head(limit))
+
+    async def sample_tracks(self, limit):
+        """Случайная выборка лайкнутых треков с загрузкой метаданных через кэш"""
+        index = await self.sync()
+        if not index or not len(index):
+            return []
+        return await self.yandex_client.get_tracks_info(index.sample(limit))
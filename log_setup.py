@@ -0,0 +1,130 @@
+import atexit
+import copy
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from config import (
+    LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_FORMAT, LOG_SAMPLING
+)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+class JsonFormatter(logging.Formatter):
+    """Форматирование записей лога в одну JSON-строку"""
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc_info'] = record.exc_text
+        if record.stack_info:
+            payload['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, сохраняющий трассировку исключения отдельно от сообщения.
+
+    Стандартный prepare форматирует запись целиком и вклеивает трассировку в msg; здесь
+    в msg попадает только текст сообщения, а трассировка — в exc_text, который читают
+    и текстовый, и JSON-форматтер в потоке записи.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None  # Объекты трассировки не передаются в другой поток
+        return record
+
+
+_exception_formatter = logging.Formatter()
+
+
+class SamplingFilter(logging.Filter):
+    """Выборочное пропускание записей уровня ниже WARNING для "горячих" модулей"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates  # префикс имени логгера -> доля пропускаемых записей (0..1)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+
+        for prefix, rate in self.rates.items():
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                return random.random() < rate
+        return True
+
+
+def parse_sampling(value):
+    """Разбор строки вида 'playlist_manager=0.1,yandex_client=0.25'"""
+    rates = {}
+    for part in (value or '').split(','):
+        if '=' not in part:
+            continue
+        name, rate = part.split('=', 1)
+        try:
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def setup_logging():
+    """Настройка логирования: запись в файл и консоль идет в отдельном потоке через очередь"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sampling(LOG_SAMPLING)))
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Остановка фонового потока логирования с дозаписью очереди"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from metrics import LOOP_LAG, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_culprit(summary, skip=()):
+    """Самый глубокий кадр из кода бота (не библиотек и не модулей из skip) в виде 'файл:строка (функция)'"""
+    skip = {os.path.abspath(__file__)} | {os.path.abspath(path) for path in skip}
+    for frame in reversed(summary):
+        filename = os.path.abspath(frame.filename)
+        if os.path.dirname(filename) == PROJECT_DIR and filename not in skip:
+            return f"{os.path.basename(filename)}:{frame.lineno} ({frame.name})"
+    last = summary[-1] if summary else None
+    return f"{os.path.basename(last.filename)}:{last.lineno} ({last.name})" if last else 'неизвестно'
+
+
+class StallSample:
+    """Зависание цикла событий: длительность и стек потока цикла в момент зависания"""
+
+    __slots__ = ('started_at', 'duration', 'stack', 'culprit')
+
+    def __init__(self, started_at, duration, stack, culprit):
+        self.started_at = started_at
+        self.duration = duration
+        self.stack = stack
+        self.culprit = culprit  # 'файл:строка (функция)' — ближайший к месту блокировки кадр кода бота
+
+
+class LoopMonitor:
+    """Измерение задержки цикла событий и выборка стека при зависаниях.
+
+    Задача в цикле каждые interval секунд отмечает "пульс". Сторожевой поток проверяет
+    пульс и, если его нет дольше threshold, снимает стек потока цикла через
+    sys._current_frames() — так видно, какой синхронный вызов держит цикл.
+    """
+
+    def __init__(self, interval=0.1, threshold=0.25, history=600):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = deque(maxlen=history)  # Последние задержки пульса, с
+        self.stalls = deque(maxlen=20)  # Последние зависания
+        self.stall_count = 0
+        self.max_lag = 0.0
+        self._last_beat = time.perf_counter()
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+        self._current_stall = None
+
+    def start(self):
+        """Запуск мониторинга (вызывается из работающего цикла событий)"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop.clear()
+        loop = asyncio.get_running_loop()
+        loop.slow_callback_duration = self.threshold  # Используется asyncio в режиме отладки (PYTHONASYNCIODEBUG=1)
+        self._task = loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+        logger.info("Мониторинг цикла событий запущен (порог %.0f мс)", self.threshold * 1000)
+
+    def stop(self):
+        """Остановка мониторинга"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG.observe(lag)
+
+            stall = self._current_stall
+            if stall is not None:
+                # Цикл ожил — фиксируем итоговую длительность зависания
+                self._current_stall = None
+                stall.duration = lag + self.interval
+                logger.warning("Цикл событий был заблокирован %.0f мс: %s", stall.duration * 1000, stall.culprit)
+
+    def _watch(self):
+        check_every = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(check_every):
+            silence = time.perf_counter() - self._last_beat
+            if silence < self.threshold + self.interval or self._current_stall is not None:
+                continue
+            self._sample_stall(silence)
+
+    def _sample_stall(self, silence):
+        frames = getattr(sys, '_current_frames', lambda: {})()
+        frame = frames.get(self._loop_thread_id)
+        if frame is None:
+            return
+        summary = traceback.extract_stack(frame, limit=30)
+        stack = ''.join(traceback.format_list(summary))
+        stall = StallSample(time.time(), silence, stack, find_culprit(summary))
+        self._current_stall = stall
+        self.stalls.append(stall)
+        self.stall_count += 1
+        LOOP_STALLS.inc()
+        logger.warning(
+            "Цикл событий не отвечает %.0f мс, место блокировки: %s\n%s",
+            silence * 1000, stall.culprit, stack
+        )
+
+    def stats(self):
+        """Сводка для !status: задержки в мс и последние зависания"""
+        lags = sorted(self.lags)
+        p50 = lags[len(lags) // 2] if lags else 0.0
+        p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0.0
+        return {
+            'running': self._task is not None,
+            'lag_p50_ms': p50 * 1000,
+            'lag_p99_ms': p99 * 1000,
+            'lag_max_ms': self.max_lag * 1000,
+            'stalls': self.stall_count,
+            'last_stall': self.stalls[-1] if self.stalls else None,
+        }
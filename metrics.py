@@ -0,0 +1,262 @@
+import bisect
+import logging
+import threading
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Metric:
+    """Базовый класс метрики с метками"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()  # Метрики обновляются и из потоков воспроизведения
+        REGISTRY.register(self)
+
+    def labels(self, *values):
+        """Дочерняя метрика для конкретного набора значений меток"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    def collect(self):
+        """Строки в текстовом формате Prometheus"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, child in list(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _Value:
+    def __init__(self, lock):
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, labelnames, key):
+        return [f'{name}{_format_labels(labelnames, key)} {self.value}']
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """Произвольное значение; может вычисляться функцией в момент сбора"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set_function(self, function):
+        """Значения вычисляются при сборе: функция возвращает число или словарь {значения меток: число}"""
+        self._function = function
+
+    def collect(self):
+        if self._function is None:
+            return super().collect()
+
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        try:
+            result = self._function()
+        except Exception as e:
+            logger.warning("Ошибка вычисления метрики %s: %s", self.name, e)
+            return lines
+
+        if isinstance(result, dict):
+            for key, value in result.items():
+                key = key if isinstance(key, tuple) else (key,)
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        else:
+            lines.append(f'{self.name} {result}')
+        return lines
+
+
+class _HistogramValue:
+    def __init__(self, buckets, lock):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = lock
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, labelnames, key):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            labels = _format_labels(labelnames + ('le',), key + (bound,))
+            lines.append(f'{name}_bucket{labels} {cumulative}')
+        labels = _format_labels(labelnames + ('le',), key + ('+Inf',))
+        lines.append(f'{name}_bucket{labels} {self.count}')
+        lines.append(f'{name}_sum{_format_labels(labelnames, key)} {self.sum}')
+        lines.append(f'{name}_count{_format_labels(labelnames, key)} {self.count}')
+        return lines
+
+
+class Histogram(_Metric):
+    """Распределение значений (задержек) по корзинам"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets, self._lock)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+
+class Registry:
+    """Набор всех метрик процесса"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Яндекс.Музыка
+YANDEX_CALLS = Counter('ymusic_api_calls_total', 'Вызовы API Яндекс.Музыки', ['method'])
+YANDEX_ERRORS = Counter('ymusic_api_errors_total', 'Ошибки вызовов API Яндекс.Музыки', ['method'])
+YANDEX_LATENCY = Histogram('ymusic_api_call_seconds', 'Длительность вызовов API Яндекс.Музыки', ['method'])
+TRACK_URL_LATENCY = Histogram(
+    'ymusic_track_url_seconds', 'Время получения URL трека по способам', ['strategy', 'result']
+)
+
+# Воспроизведение
+TRACK_GAP = Histogram(
+    'ymusic_track_gap_seconds', 'Пауза между окончанием трека и началом следующего',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+)
+QUEUE_DEPTH = Gauge('ymusic_queue_depth', 'Треков в очереди сервера', ['guild'])
+VOICE_CLIENTS = Gauge('ymusic_voice_clients', 'Активные голосовые подключения сервера', ['guild'])
+VOICE_HANDSHAKE = Histogram(
+    'ymusic_voice_handshake_seconds', 'Время голосового подключения (connect, move, reconnect, warm)', ['kind', 'result']
+)
+AUDIO_PREROLL = Histogram(
+    'ymusic_audio_preroll_seconds', 'Время набора начального буфера трека',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+)
+AUDIO_UNDERRUNS = Counter('ymusic_audio_underruns_total', 'Опустошения аудиобуфера до конца трека')
+STREAM_VARIANTS = Counter('ymusic_stream_variants_total', 'Выбранные варианты загрузки трека', ['codec', 'bitrate'])
+STREAM_BYTES = Counter('ymusic_stream_bytes_total', 'Оценка трафика CDN по прослушанным трекам', ['codec'])
+STREAM_BITRATE = Gauge('ymusic_stream_bitrate_kbps', 'Битрейт источника текущего трека сервера', ['guild'])
+FFMPEG_PROCESSES = Gauge('ymusic_ffmpeg_processes', 'Запущенные процессы FFmpeg')
+FFMPEG_ADMISSION_WAIT = Histogram(
+    'ymusic_ffmpeg_admission_seconds', 'Ожидание свободного слота FFmpeg', ['result'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+FFMPEG_REAPED = Counter('ymusic_ffmpeg_reaped_total', 'Процессы FFmpeg, завершенные надзором или упавшие', ['reason'])
+FFMPEG_CPU = Gauge('ymusic_ffmpeg_cpu_percent', 'Загрузка CPU процессами FFmpeg сервера', ['guild'])
+FFMPEG_RSS = Gauge('ymusic_ffmpeg_rss_bytes', 'Память процессов FFmpeg сервера', ['guild'])
+QUEUE_PAGES = Counter('ymusic_queue_pages_total', 'Страницы очереди: из кэша и построенные заново', ['result'])
+OUTBOUND_MESSAGES = Counter(
+    'ymusic_outbound_messages_total', 'Сообщения бота: отправленные, правки и объединенные правки', ['kind']
+)
+AUDIO_NODE_STREAMS = Gauge('ymusic_audio_node_streams', 'Потоки серверов на аудиоузле', ['node'])
+AUDIO_NODE_CPU = Gauge('ymusic_audio_node_cpu_percent', 'Загрузка CPU аудиоузлом вместе с его FFmpeg', ['node'])
+EXECUTOR_QUEUE = Gauge('ymusic_executor_queue_depth', 'Задачи, ожидающие потока в пуле исполнителя')
+
+# Цикл событий
+LOOP_LAG = Histogram(
+    'ymusic_event_loop_lag_seconds', 'Задержка пробуждения задачи-пульса цикла событий',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_STALLS = Counter('ymusic_event_loop_stalls_total', 'Зависания цикла событий дольше порога')
+
+
+async def handle_metrics(request):
+    """Обработчик GET /metrics"""
+    return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(host, port):
+    """Запуск HTTP-сервера метрик; возвращает AppRunner для остановки"""
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
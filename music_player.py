@@ -1,11 +1,36 @@
 import asyncio
+from collections import deque
 import discord
 from discord.ext import commands
 from discord.ui import View, Button
 import yt_dlp
 import logging
-from collections import deque
-from config import MAX_QUEUE_SIZE, MAX_SONG_LENGTH, ERROR_MESSAGES
+import time
+from config import (
+    MAX_QUEUE_SIZE, MAX_SONG_LENGTH, ERROR_MESSAGES, QUEUE_MODE, FAIR_QUEUE_WEIGHTS,
+    AUDIO_BUFFER_SECONDS, AUDIO_PREROLL_SECONDS, AUDIO_PREROLL_TIMEOUT, AUDIO_STARVE_TIMEOUT,
+    FFMPEG_PROBESIZE, FFMPEG_ANALYZEDURATION, GAPLESS_PRELOAD_SECONDS, CROSSFADE_SECONDS,
+    FFMPEG_MAX_PROCESSES, FFMPEG_ADMISSION_TIMEOUT, FFMPEG_NICE, FFMPEG_CPU_AFFINITY,
+    FFMPEG_STUCK_SECONDS, FFMPEG_REAP_INTERVAL, AUDIO_NODES, AUDIO_NODE_WINDOW,
+    DEFAULT_VOLUME, MAX_VOLUME, NORMALIZE_VOLUME, TARGET_LOUDNESS,
+    NOW_PLAYING_DEBOUNCE, NOW_PLAYING_PROGRESS_INTERVAL, MESSAGE_EDIT_INTERVAL,
+    PLAYBACK_STATE_FILE, PLAYBACK_STATE_INTERVAL, TRACK_URL_TTL, STREAM_QUALITY, STREAM_BITRATE_HEADROOM,
+    PLAYBACK_HISTORY_SIZE
+)
+from metrics import QUEUE_DEPTH, VOICE_CLIENTS, FFMPEG_PROCESSES, TRACK_GAP, STREAM_BYTES, STREAM_BITRATE
+from tracing import tracer, traced, current_span, detached
+from voice_manager import VoiceConnectionManager
+from audio_source import BufferedAudioSource, ffmpeg_before_options
+from transitions import GuildAudioStream, crossfade_available
+from audio_effects import AudioEffects, EffectsSource, effects_available
+from playback_state import PlaybackStateStore, song_to_state
+from stream_quality import target_bitrate
+from ffmpeg_supervisor import FFmpegSupervisor, FFmpegBusy
+from node_pool import AudioNodePool, RemoteStream
+from guild_worker import GuildWorkers
+from track_queue import TrackQueue, FairTrackQueue
+from queue_view import QueuePages, QueuePagerView
+from now_playing import OutboundScheduler, NowPlayingPanels
 import os
 
 # Добавляем путь к FFmpeg в PATH
@@ -16,67 +41,47 @@ if ffmpeg_path not in os.environ.get("PATH", ""):
 logger = logging.getLogger(__name__)
 
 class MusicControlView(View):
-    """Класс для кнопок управления музыкой"""
+    """Кнопки управления музыкой.
+    
+    Представление постоянное: один экземпляр регистрируется через bot.add_view при запуске
+    и обрабатывает нажатия на всех сообщениях всех серверов (сервер берется из взаимодействия),
+    поэтому кнопки работают и после перезапуска. Для отправки используются остановленные
+    экземпляры-макеты (см. MusicPlayer.control_layout): они не попадают в хранилище представлений.
+    """
+    
+    # Действие -> (эмодзи, подпись, стиль); custom_id кнопки — "ymusic:<действие>"
+    BUTTONS = {
+        'pause': ("⏸️", "Пауза", discord.ButtonStyle.secondary),
+        'stop': ("⏹️", "Стоп", discord.ButtonStyle.danger),
+        'skip': ("⏭️", "Пропустить", discord.ButtonStyle.primary),
+        'queue': ("📋", "Очередь", discord.ButtonStyle.secondary),
+        'help': ("❓", "Help", discord.ButtonStyle.secondary),
+    }
+    PAUSED = ("▶️", "Продолжить", discord.ButtonStyle.success)  # Кнопка паузы, пока воспроизведение на паузе
     
-    def __init__(self, music_player, guild_id):
-        super().__init__(timeout=300)  # 5 минут timeout
+    def __init__(self, music_player, paused=False):
+        super().__init__(timeout=None)
         self.music_player = music_player
-        self.guild_id = guild_id
-        
-        # Кнопка паузы/возобновления
-        self.pause_button = Button(
-            style=discord.ButtonStyle.secondary,  # Желтый цвет
-            emoji="⏸️",
-            label="Пауза",
-            custom_id="pause"
-        )
-        self.pause_button.callback = self.pause_callback
-        self.add_item(self.pause_button)
-        
-        # Кнопка остановки
-        self.stop_button = Button(
-            style=discord.ButtonStyle.danger,  # Красный цвет
-            emoji="⏹️",
-            label="Стоп",
-            custom_id="stop"
-        )
-        self.stop_button.callback = self.stop_callback
-        self.add_item(self.stop_button)
-        
-        # Кнопка пропуска
-        self.skip_button = Button(
-            style=discord.ButtonStyle.primary,  # Синий цвет
-            emoji="⏭️",
-            label="Пропустить",
-            custom_id="skip"
-        )
-        self.skip_button.callback = self.skip_callback
-        self.add_item(self.skip_button)
-        
-        # Кнопка очереди
-        self.queue_button = Button(
-            style=discord.ButtonStyle.secondary,
-            emoji="📋",
-            label="Очередь",
-            custom_id="queue"
-        )
-        self.queue_button.callback = self.queue_callback
-        self.add_item(self.queue_button)
-
-        # Кнопка помощи
-        self.help_button = Button(
-            style=discord.ButtonStyle.secondary,
-            emoji="❓",
-            label="Help",
-            custom_id="help"
-        )
-        self.help_button.callback = self.help_callback
-        self.add_item(self.help_button)
+        for action, (emoji, label, style) in self.BUTTONS.items():
+            if action == 'pause' and paused:
+                emoji, label, style = self.PAUSED
+            button = Button(style=style, emoji=emoji, label=label, custom_id=f"ymusic:{action}")
+            button.callback = self.dispatch
+            self.add_item(button)
     
-    async def pause_callback(self, interaction):
+    async def dispatch(self, interaction):
+        """Единый обработчик нажатий: действие из custom_id"""
+        action = interaction.data.get('custom_id', '').partition(':')[2]
+        handler = getattr(self, f'{action}_callback', None)
+        if handler is None or interaction.guild_id is None:
+            await interaction.response.send_message("❌ Неизвестная кнопка!", ephemeral=True)
+            return
+        await handler(interaction, interaction.guild_id)
+    
+    async def pause_callback(self, interaction, guild_id):
         """Обработка кнопки паузы/возобновления"""
         try:
-            voice_client = self.music_player.get_voice_client(self.guild_id)
+            voice_client = self.music_player.get_voice_client(guild_id)
             
             if not voice_client or not voice_client.is_connected():
                 await interaction.response.send_message("❌ Бот не подключен к голосовому каналу!", ephemeral=True)
@@ -84,58 +89,43 @@ class MusicControlView(View):
             
             if voice_client.is_paused():
                 voice_client.resume()
-                self.pause_button.emoji = "⏸️"
-                self.pause_button.label = "Пауза"
-                self.pause_button.style = discord.ButtonStyle.secondary  # Желтый цвет для паузы
-                await interaction.response.edit_message(content="▶️ Воспроизведение возобновлено!", view=self)
+                await interaction.response.edit_message(
+                    content="▶️ Воспроизведение возобновлено!", view=self.music_player.control_layout(guild_id)
+                )
             elif voice_client.is_playing():
                 voice_client.pause()
-                self.pause_button.emoji = "▶️"
-                self.pause_button.label = "Продолжить"
-                self.pause_button.style = discord.ButtonStyle.success  # Зеленый цвет для продолжения
-                await interaction.response.edit_message(content="⏸️ Воспроизведение приостановлено!", view=self)
+                await interaction.response.edit_message(
+                    content="⏸️ Воспроизведение приостановлено!", view=self.music_player.control_layout(guild_id)
+                )
             else:
                 await interaction.response.send_message("❌ Сейчас ничего не играет!", ephemeral=True)
                 
         except Exception as e:
-            logger.error(f"Ошибка в pause_callback: {e}")
+            logger.error("Ошибка в pause_callback: %s", e)
             await interaction.response.send_message("❌ Произошла ошибка!", ephemeral=True)
     
-    async def stop_callback(self, interaction):
+    async def stop_callback(self, interaction, guild_id):
         """Обработка кнопки остановки"""
         try:
-            voice_client = self.music_player.get_voice_client(self.guild_id)
+            voice_client = self.music_player.get_voice_client(guild_id)
             
             if not voice_client or not voice_client.is_connected():
                 await interaction.response.send_message("❌ Бот не подключен к голосовому каналу!", ephemeral=True)
                 return
             
-            # Останавливаем, чистим очередь и отключаемся от голосового канала
-            voice_client.stop()
-            queue = self.music_player.get_queue(self.guild_id)
-            queue.clear()
-            self.music_player.current_song[self.guild_id] = None
-            # Сбрасываем режим "Моя волна" и связанные данные
-            self.music_player.my_wave_mode[self.guild_id] = False
-            if self.guild_id in self.music_player.my_wave_batch_id:
-                del self.music_player.my_wave_batch_id[self.guild_id]
-            if self.guild_id in self.music_player.played_tracks:
-                del self.music_player.played_tracks[self.guild_id]
-            
-            await voice_client.disconnect()
-            if self.guild_id in self.music_player.voice_clients:
-                del self.music_player.voice_clients[self.guild_id]
+            # Останавливаем и чистим очередь; соединение еще немного удерживается для следующей команды
+            self.music_player.reset_playback(guild_id)
             
-            await interaction.response.edit_message(content="⏹️ Остановлено и отключился от голосового канала!", view=None)
+            await interaction.response.edit_message(content="⏹️ Воспроизведение остановлено, очередь очищена!", view=None)
             
         except Exception as e:
-            logger.error(f"Ошибка в stop_callback: {e}")
+            logger.error("Ошибка в stop_callback: %s", e)
             await interaction.response.send_message("❌ Произошла ошибка!", ephemeral=True)
     
-    async def skip_callback(self, interaction):
+    async def skip_callback(self, interaction, guild_id):
         """Обработка кнопки пропуска"""
         try:
-            voice_client = self.music_player.get_voice_client(self.guild_id)
+            voice_client = self.music_player.get_voice_client(guild_id)
             
             if not voice_client or not voice_client.is_connected():
                 await interaction.response.send_message("❌ Бот не подключен к голосовому каналу!", ephemeral=True)
@@ -145,67 +135,36 @@ class MusicControlView(View):
                 await interaction.response.send_message("❌ Сейчас ничего не играет!", ephemeral=True)
                 return
             
-            # Если включен режим "Моя волна", добавляем новый трек
-            if self.music_player.my_wave_mode.get(self.guild_id, False):
-                logger.info("Режим 'Моя волна' активен, добавляем новый трек...")
-                # Создаем фиктивный контекст для добавления трека
-                class FakeContext:
-                    def __init__(self, guild_id):
-                        self.guild = type('Guild', (), {'id': guild_id})()
-                
-                fake_ctx = FakeContext(self.guild_id)
-                await self.music_player._add_next_my_wave_track(fake_ctx)
-            
-            voice_client.stop()
-            await interaction.response.edit_message(content="⏭️ Трек пропущен!", view=self)
+            # В режиме "Моя волна" пропуск ждет API — подтверждаем нажатие сразу, ответ придет после
+            await interaction.response.defer()
+            ctx = GuildContext.from_interaction(self.music_player.bot, interaction)
+            self.music_player.workers.submit(guild_id, self.music_player.skip_song(ctx), 'skip')
             
         except Exception as e:
-            logger.error(f"Ошибка в skip_callback: {e}")
-            await interaction.response.send_message("❌ Произошла ошибка!", ephemeral=True)
+            logger.error("Ошибка в skip_callback: %s", e)
+            if not interaction.response.is_done():
+                await interaction.response.send_message("❌ Произошла ошибка!", ephemeral=True)
     
-    async def queue_callback(self, interaction):
+    async def queue_callback(self, interaction, guild_id):
         """Обработка кнопки очереди"""
         try:
-            queue = self.music_player.get_queue(self.guild_id)
-            current_song = self.music_player.current_song.get(self.guild_id)
+            total = self.music_player.upcoming_count(guild_id)
+            current_song = self.music_player.current_song.get(guild_id)
             
-            if not queue and not current_song:
+            if not total and not current_song:
                 await interaction.response.send_message("📋 Очередь пуста!", ephemeral=True)
                 return
             
-            embed = discord.Embed(
-                title="📋 Очередь воспроизведения",
-                color=0x00ff00
-            )
-            
-            if current_song:
-                embed.add_field(
-                    name="🎵 Сейчас играет",
-                    value=f"**{current_song['title']}**\n{current_song['artist']}",
-                    inline=False
-                )
-            
-            if queue:
-                queue_text = ""
-                for i, song in enumerate(list(queue)[:10], 1):  # Показываем только первые 10
-                    queue_text += f"{i}. **{song['title']}** - {song['artist']}\n"
-                
-                if len(queue) > 10:
-                    queue_text += f"... и еще {len(queue) - 10} треков"
-                
-                embed.add_field(
-                    name=f"📋 В очереди ({len(queue)} треков)",
-                    value=queue_text,
-                    inline=False
-                )
-            
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            message = self.music_player.queue_message(guild_id)
+            await interaction.response.send_message(ephemeral=True, **message)
+            if 'view' in message:
+                message['view'].message = await interaction.original_response()
             
         except Exception as e:
-            logger.error(f"Ошибка в queue_callback: {e}")
+            logger.error("Ошибка в queue_callback: %s", e)
             await interaction.response.send_message("❌ Произошла ошибка!", ephemeral=True)
 
-    async def help_callback(self, interaction):
+    async def help_callback(self, interaction, guild_id):
         """Обработка кнопки помощи"""
         try:
             embed = discord.Embed(
@@ -215,14 +174,44 @@ class MusicControlView(View):
             )
             embed.add_field(name="Воспроизведение", value="`!play`, `/play`, `!playlist`, `/playlist`, `!liked`, `/liked`", inline=False)
             embed.add_field(name="Моя волна", value="`!mywave`, `/mywave`, `!mywaveoff`, `/mywaveoff`", inline=False)
-            embed.add_field(name="Управление", value="`!skip`, `!pause`, `!resume`, `!stop`, `!queue`, `!disconnect` (есть и slash)", inline=False)
+            embed.add_field(name="Управление", value="`!skip`, `!pause`, `!resume`, `!seek`, `!stop`, `!queue`, `!remove`, `!move`, `!shuffle`, `!jump`, `!volume`, `!eq`, `!disconnect` (есть и slash)", inline=False)
             embed.set_footer(text="Для списка всех команд используйте `!help` или `/help`")
             await interaction.response.send_message(embed=embed, ephemeral=True)
         except Exception as e:
-            logger.error(f"Ошибка в help_callback: {e}")
+            logger.error("Ошибка в help_callback: %s", e)
             await interaction.response.send_message("❌ Произошла ошибка!", ephemeral=True)
 
+class GuildContext:
+    """Контекст сервера для методов плеера без команды: кнопки управления и продолжение
+    воспроизведения после перезапуска"""
+    
+    def __init__(self, bot, guild, channel, author=None, interaction=None):
+        self.bot = bot
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.interaction = interaction
+    
+    @classmethod
+    def from_interaction(cls, bot, interaction):
+        return cls(bot, interaction.guild, interaction.channel, interaction.user, interaction)
+    
+    async def send(self, *args, ephemeral=False, **kwargs):
+        interaction = self.interaction
+        if interaction is not None and not interaction.is_expired():
+            try:
+                if not interaction.response.is_done():
+                    await interaction.response.send_message(*args, ephemeral=ephemeral, **kwargs)
+                    return await interaction.original_response()
+                return await interaction.followup.send(*args, ephemeral=ephemeral, wait=True, **kwargs)
+            except discord.HTTPException as e:
+                logger.warning("Не удалось ответить на взаимодействие: %s", e)
+        # Скрытые сообщения бывают только в ответ на взаимодействие — отправляем обычные
+        return await self.channel.send(*args, **kwargs)
+
 class MusicPlayer:
+    REPEAT_MODES = {'off': "➡️ Повтор выключен", 'one': "🔂 Повтор трека", 'queue': "🔁 Повтор очереди"}
+    
     def __init__(self, bot):
         self.bot = bot
         self.queues = {}  # Словарь очередей для каждого сервера
@@ -231,172 +220,474 @@ class MusicPlayer:
         self.my_wave_mode = {}  # Флаг режима "Моя волна" для каждого сервера
         self.my_wave_batch_id = {}  # Batch ID для "Моя волна" для каждого сервера
         self.played_tracks = {}  # Список уже проигранных треков для каждого сервера
+        self.history = {}  # Доигранные треки (полные записи со ссылками) для !previous
+        self.repeat_mode = {}  # off, one или queue для каждого сервера
+        self._repeat_skipped = set()  # Серверы, где пропуск прервал повтор трека
+        self.streams = {}  # Непрерывный поток звука (GuildAudioStream) для каждого сервера
+        self._preload_tasks = {}  # Подготовка следующего трека для бесшовного перехода
+        self._play_locks = {}
+        self.effects = {}  # Настройки эффектов (AudioEffects) для каждого сервера
+        self.bandwidth = {}  # Оценка трафика CDN сервера: байты, секунды звучания, треки
+        self.track_ended_at = {}  # Момент окончания предыдущего трека (для метрики паузы между треками)
+        self.voice_manager = VoiceConnectionManager(bot, self.voice_clients)  # Подключения, удержание и переподключение
+        self.workers = GuildWorkers()  # Долгие действия кнопок после подтверждения нажатия
+        # Кнопки управления: один постоянный обработчик и два неизменных макета для сообщений
+        # (представления создаются в цикле событий, см. register_controls и control_layout)
+        self.control_view = None
+        self.control_layouts = {}
+        # Панель "Сейчас играет" правится на месте; отправка и правки — через общую очередь с лимитом на канал
+        self.outbound = OutboundScheduler(MESSAGE_EDIT_INTERVAL, NOW_PLAYING_DEBOUNCE)
+        self.panels = NowPlayingPanels(self, self.outbound, NOW_PLAYING_PROGRESS_INTERVAL)
+        self.queue_pages = QueuePages(self)  # Страницы !queue, кэш до изменения очереди
+        # Процессы FFmpeg всех серверов: общий лимит, приоритет, завершение зависших
+        self.ffmpeg = FFmpegSupervisor(
+            FFMPEG_MAX_PROCESSES, FFMPEG_ADMISSION_TIMEOUT, FFMPEG_NICE, FFMPEG_CPU_AFFINITY,
+            FFMPEG_STUCK_SECONDS, FFMPEG_REAP_INTERVAL
+        )
+        # Аудиоузлы: FFmpeg, эффекты и кодирование в отдельных процессах (None — в процессе бота)
+        self.nodes = AudioNodePool(AUDIO_NODES, AUDIO_NODE_WINDOW) if AUDIO_NODES > 0 else None
+        self.state_store = PlaybackStateStore(PLAYBACK_STATE_FILE)  # Очередь и позиция на диске для продолжения после перезапуска
+        self._saved_state = None
+        self._state_task = None
+        self._state_restored = False
+        
+        QUEUE_DEPTH.set_function(lambda: {guild_id: len(queue) for guild_id, queue in list(self.queues.items())})
+        VOICE_CLIENTS.set_function(
+            lambda: {guild_id: int(vc.is_connected()) for guild_id, vc in list(self.voice_clients.items())}
+        )
+        FFMPEG_PROCESSES.set_function(self.count_ffmpeg_processes)
+        self.ffmpeg.register_metrics()
+        if self.nodes is not None:
+            self.nodes.register_metrics()
+        STREAM_BITRATE.set_function(
+            lambda: {guild_id: song.get('bitrate') or 0 for guild_id, song in list(self.current_song.items()) if song}
+        )
+        if CROSSFADE_SECONDS > 0 and not crossfade_available():
+            logger.warning("CROSSFADE_SECONDS задан, но numpy не установлен: переходы будут без наложения")
+    
+    def count_ffmpeg_processes(self):
+        """Количество работающих процессов FFmpeg"""
+        count = 0
+        for stream in list(self.streams.values()):
+            for source in stream.sources():
+                process = getattr(source, '_process', None)
+                if process is not None and process.poll() is None:
+                    count += 1
+        return count
+    
+    def _after_playback(self, ctx, error, stream):
+        """Вызывается из потока воспроизведения, когда поток сервера закончился"""
+        self.track_ended_at[ctx.guild.id] = time.monotonic()
+        if self.streams.get(ctx.guild.id) is stream:
+            self.streams.pop(ctx.guild.id, None)
+        if error is None:
+            asyncio.run_coroutine_threadsafe(self.play_next(ctx), self.bot.loop)
+        else:
+            logger.error("Ошибка воспроизведения: %s", error)
         
     def get_queue(self, guild_id):
         """Получение очереди для сервера"""
         if guild_id not in self.queues:
-            self.queues[guild_id] = deque()
+            self.queues[guild_id] = FairTrackQueue(self.requester_weight) if QUEUE_MODE == 'fair' else TrackQueue()
         return self.queues[guild_id]
     
+    def requester_weight(self, requester):
+        """Вес пользователя в режиме fair: его собственный, иначе наибольший из весов ролей"""
+        if requester is None or not FAIR_QUEUE_WEIGHTS:
+            return 1.0
+        if requester.id in FAIR_QUEUE_WEIGHTS:
+            return FAIR_QUEUE_WEIGHTS[requester.id]
+        weights = [FAIR_QUEUE_WEIGHTS[role.id] for role in getattr(requester, 'roles', ()) if role.id in FAIR_QUEUE_WEIGHTS]
+        return max(weights, default=1.0)
+    
     def get_voice_client(self, guild_id):
         """Получение голосового клиента для сервера"""
         return self.voice_clients.get(guild_id)
     
+    def get_effects(self, guild_id):
+        """Настройки эффектов сервера"""
+        if guild_id not in self.effects:
+            self.effects[guild_id] = AudioEffects(DEFAULT_VOLUME / 100, NORMALIZE_VOLUME, TARGET_LOUDNESS)
+        return self.effects[guild_id]
+    
+    def get_history(self, guild_id):
+        """Последние PLAYBACK_HISTORY_SIZE доигранных треков сервера"""
+        if guild_id not in self.history:
+            self.history[guild_id] = deque(maxlen=PLAYBACK_HISTORY_SIZE)
+        return self.history[guild_id]
+    
     def get_played_tracks(self, guild_id):
         """Получение списка проигранных треков для сервера"""
         if guild_id not in self.played_tracks:
             self.played_tracks[guild_id] = set()
         return self.played_tracks[guild_id]
     
+    def target_bitrate(self, guild_id):
+        """Нужный битрейт источника для голосового канала сервера (кбит/с, None — лучший)"""
+        voice_client = self.get_voice_client(guild_id)
+        channel = getattr(voice_client, 'channel', None) or self.voice_manager.channels.get(guild_id)
+        return target_bitrate(STREAM_QUALITY, getattr(channel, 'bitrate', None), STREAM_BITRATE_HEADROOM)
+    
+    async def resolve_stream(self, guild_id, track_id):
+        """Ссылка на вариант трека под битрейт канала: {'url', 'codec', 'bitrate'} или None"""
+        return await self.bot.yandex_client.resolve_stream(track_id, self.target_bitrate(guild_id))
+    
+    def _account_bandwidth(self, guild_id, song, seconds):
+        """Учет трафика CDN: сколько секунд трек звучал при его битрейте"""
+        usage = self.bandwidth.setdefault(guild_id, {'bytes': 0, 'seconds': 0.0, 'tracks': 0})
+        usage['seconds'] += seconds
+        usage['tracks'] += 1
+        bitrate = song.get('bitrate')
+        if bitrate:
+            size = int(seconds * bitrate * 1000 / 8)
+            usage['bytes'] += size
+            STREAM_BYTES.labels(song.get('codec')).inc(size)
+    
+    def bandwidth_usage(self, guild_id):
+        """Трафик сервера и битрейт текущего трека для !status"""
+        usage = dict(self.bandwidth.get(guild_id, {'bytes': 0, 'seconds': 0.0, 'tracks': 0}))
+        song = self.current_song.get(guild_id)
+        usage['codec'] = song.get('codec') if song else None
+        usage['bitrate'] = song.get('bitrate') if song else None
+        return usage
+    
+    @traced('player.join_voice_channel')
     async def join_voice_channel(self, ctx):
         """Подключение к голосовому каналу"""
         if not ctx.author.voice:
             await ctx.send(ERROR_MESSAGES['no_voice_channel'])
             return False
         
-        voice_channel = ctx.author.voice.channel
-        # Пытаемся взять уже существующий клиент и синхронизировать кэш
-        voice_client = self.get_voice_client(ctx.guild.id)
+        # Подключение (или перемещение) с повторными попытками; после !stop соединение еще "теплое"
+        voice_client = await self.voice_manager.connect(ctx.guild, ctx.author.voice.channel, ctx)
         if not voice_client:
-            existing_vc = discord.utils.get(self.bot.voice_clients, guild=ctx.guild)
-            if existing_vc:
-                self.voice_clients[ctx.guild.id] = existing_vc
-                voice_client = existing_vc
-        
-        # Если уже подключены
-        if voice_client and voice_client.is_connected():
-            if voice_client.channel != voice_channel:
-                try:
-                    await voice_client.move_to(voice_channel)
-                except Exception as e:
-                    logger.error(f"Ошибка перемещения в голосовой канал: {e}")
-                    await ctx.send("Ошибка перемещения в голосовой канал!")
-                    return False
-            return True
-        
-        # Иначе пробуем подключиться
-        try:
-            voice_client = await voice_channel.connect(timeout=10.0, reconnect=True)
-            self.voice_clients[ctx.guild.id] = voice_client
-            return True
-        except discord.ClientException as e:
-            # Частый кейс: Already connected — пробуем взять существующий клиент
-            logger.warning(f"Исключение при подключении (вероятно, уже подключен): {e}")
-            existing_vc = discord.utils.get(self.bot.voice_clients, guild=ctx.guild)
-            if existing_vc:
-                self.voice_clients[ctx.guild.id] = existing_vc
-                if existing_vc.channel != voice_channel:
-                    try:
-                        await existing_vc.move_to(voice_channel)
-                    except Exception as move_err:
-                        logger.error(f"Ошибка перемещения после Already connected: {move_err}")
-                        await ctx.send("Ошибка перемещения в голосовой канал!")
-                        return False
-                return True
             await ctx.send("Ошибка подключения к голосовому каналу!")
             return False
-        except Exception as e:
-            logger.error(f"Ошибка подключения к голосовому каналу: {e}")
-            # Повторная попытка один раз (в т.ч. для 'list index out of range')
-            try:
-                await asyncio.sleep(0.5)
-                existing_vc = discord.utils.get(self.bot.voice_clients, guild=ctx.guild)
-                if existing_vc:
-                    self.voice_clients[ctx.guild.id] = existing_vc
-                    if existing_vc.channel != voice_channel:
-                        await existing_vc.move_to(voice_channel)
-                    return True
-                voice_client = await voice_channel.connect(timeout=10.0, reconnect=True)
-                self.voice_clients[ctx.guild.id] = voice_client
-                return True
-            except Exception as e2:
-                logger.error(f"Повторная ошибка подключения к голосовому каналу: {e2}")
-                await ctx.send("Ошибка подключения к голосовому каналу!")
-                return False
+        return True
     
-    async def play_next(self, ctx):
-        """Воспроизведение следующего трека в очереди"""
-        queue = self.get_queue(ctx.guild.id)
-        voice_client = self.get_voice_client(ctx.guild.id)
+    async def resume_after_reconnect(self, guild_id, ctx):
+        """Продолжение воспроизведения после восстановления голосового соединения"""
+        self._cancel_preload(guild_id)
+        self._return_prepared(guild_id)
+        stream = self.streams.pop(guild_id, None)
+        current = self.current_song.get(guild_id)
+        if stream is not None:
+            if current is not None and stream.entry is current:
+                current['start_at'] = stream.position
+            stream.cleanup()
+        queue = self.get_queue(guild_id)
+        if current:
+            # Прерванный трек продолжается с той же позиции по уже полученной ссылке
+            queue.appendleft(current)
+            self.current_song[guild_id] = None
+        if ctx is not None and queue:
+            logger.info("Голосовое соединение восстановлено, продолжаем очередь (%s треков)", len(queue))
+            await self.play_next(ctx)
+    
+    @traced('player.play_next')
+    async def play_next(self, ctx, preload=False):
+        """Воспроизведение следующего трека в очереди.
         
-        if not voice_client or not voice_client.is_connected():
-            return
+        preload=True — подготовка следующего трека для бесшовного перехода, пока играет текущий.
+        """
+        span = current_span()
+        if span is not None:
+            span.set_attribute('guild', ctx.guild.id)  # Смена трека из after-колбэка — отдельная трасса
+        guild_id = ctx.guild.id
         
-        if not queue:
-            # Если очередь пуста и включен режим "Моя волна", добавляем новый трек
-            if self.my_wave_mode.get(ctx.guild.id, False):
-                logger.info("Очередь пуста, но режим 'Моя волна' активен, добавляем новый трек...")
-                if await self._add_next_my_wave_track(ctx):
-                    # Рекурсивно вызываем play_next для воспроизведения добавленного трека
-                    await self.play_next(ctx)
+        # Один запуск за раз на сервер: команды, after-колбэк и предзагрузка не запускают трек дважды
+        async with self._play_locks.setdefault(guild_id, asyncio.Lock()):
+            while True:
+                voice_client = self.get_voice_client(guild_id)
+                if not voice_client or not voice_client.is_connected():
+                    return
+                
+                stream = self.streams.get(guild_id)
+                playing = stream is not None and not stream.finished and self._is_streaming(voice_client, stream)
+                if playing and (not preload or stream.next is not None):
                     return
+                
+                queue = self.get_queue(guild_id)
+                current = self.current_song.get(guild_id)
+                if not playing and current is not None:
+                    self._finish_current(guild_id)
+                repeat_one = self.repeat_mode.get(guild_id) == 'one' and guild_id not in self._repeat_skipped
+                self._repeat_skipped.discard(guild_id)
+                
+                if repeat_one and current is not None:
+                    # Повтор трека: копия записи с уже полученной ссылкой, без запросов к API
+                    song = dict(self._replay_entry(current), repeat=True)
                 else:
-                    logger.warning("Не удалось добавить трек из 'Моя волна'")
-            
-            # Если очередь пуста, останавливаем воспроизведение
-            self.current_song[ctx.guild.id] = None
-            return
-        
-        # Получаем следующий трек из очереди
-        song = queue.popleft()
-        self.current_song[ctx.guild.id] = song
-        
-        # Добавляем трек в список проигранных (если есть ID)
-        if 'id' in song and song['id']:
-            played_tracks = self.get_played_tracks(ctx.guild.id)
-            played_tracks.add(song['id'])
+                    if not queue and self.my_wave_mode.get(guild_id, False):
+                        # Если очередь пуста и включен режим "Моя волна", добавляем новый трек
+                        logger.info("Очередь пуста, но режим 'Моя волна' активен, добавляем новый трек...")
+                        if not await self._add_next_my_wave_track(ctx):
+                            logger.warning("Не удалось добавить трек из 'Моя волна'")
+                    
+                    if not queue:
+                        # Если очередь пуста, останавливаем воспроизведение
+                        if not playing:
+                            self.current_song[guild_id] = None
+                            self.panels.close(guild_id, "✅ Очередь закончилась")
+                        return
+                    
+                    # Получаем следующий трек из очереди (start_at — позиция прерванного трека)
+                    song = queue.popleft()
+                start_at = song.pop('start_at', 0)
+                
+                # Добавляем трек в список проигранных (если есть ID)
+                if 'id' in song and song['id']:
+                    played_tracks = self.get_played_tracks(guild_id)
+                    played_tracks.add(song['id'])
+                
+                try:
+                    # Проверяем доступность FFmpeg
+                    if not self._ffmpeg_available():
+                        logger.error("FFmpeg не найден в PATH!")
+                        await ctx.send("❌ FFmpeg не найден! Проверьте установку.")
+                        return
+                    
+                    # Подготовка следующего трека не ждет слота FFmpeg: новые запуски важнее
+                    source = await self._open_source(ctx, song, start_at, wait=not preload)
+                    if not voice_client.is_connected():
+                        source.cleanup()
+                        return
+                    
+                    # Текущий трек еще играет — следующий зазвучит сразу после него
+                    if playing and stream.queue_next(source, song, start_at):
+                        logger.debug("Следующий трек подготовлен: %s", song['title'])
+                        return
+                    
+                    self._start_stream(ctx, voice_client, source, song, start_at)
+                    self._announce(ctx, song)
+                    return
+                    
+                except FFmpegBusy:
+                    # Все слоты FFmpeg заняты: трек остается первым в очереди
+                    if start_at:
+                        song['start_at'] = start_at
+                    queue.appendleft(song)
+                    if not preload:
+                        logger.warning("Нет свободных процессов FFmpeg для сервера %s", guild_id)
+                        await ctx.send("⏳ Все аудиопотоки заняты, попробуйте чуть позже")
+                    return
+                except Exception as e:
+                    logger.error("Ошибка воспроизведения трека: %s", e)
+                    await ctx.send(ERROR_MESSAGES['playback_error'])
+                    # Пытаемся воспроизвести следующий трек (повтор не удавшегося трека не зацикливается)
+                    if song.get('repeat'):
+                        self._repeat_skipped.add(guild_id)
+    
+    async def _open_source(self, ctx, song, start_at=0, wait=True):
+        """Запуск FFmpeg для трека (с позиции start_at) и набор начального буфера.
         
+        FFmpegBusy — нет свободного слота (wait=False — без ожидания).
+        """
+        await self._ensure_fresh_url(ctx.guild.id, song)
+        with tracer.span('ffmpeg.admission'):
+            await self.ffmpeg.acquire(wait)
         try:
-            # Проверяем доступность FFmpeg
-            import shutil
-            if not shutil.which('ffmpeg'):
-                logger.error("FFmpeg не найден в PATH!")
-                await ctx.send("❌ FFmpeg не найден! Проверьте установку.")
-                return
-            
-            # Создаем FFmpeg источник для воспроизведения
-            source = discord.FFmpegPCMAudio(
-                song['url'],
-                before_options="-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+            with tracer.span('ffmpeg.spawn'):
+                if self.nodes is not None:
+                    # FFmpeg и буфер на аудиоузле; слот общего лимита занят до закрытия источника
+                    source = await self.nodes.open_source(ctx.guild.id, song, start_at)
+                else:
+                    source = self._create_source(song, start_at)
+        except Exception:
+            self.ffmpeg.discard()
+            raise
+        source = self.ffmpeg.supervise(source, ctx.guild.id)
+        
+        # Опережающее чтение: трек стартует с запасом, задержки CDN не слышны
+        if AUDIO_BUFFER_SECONDS > 0 and self.nodes is None:
+            source = BufferedAudioSource(
+                source, AUDIO_BUFFER_SECONDS, AUDIO_PREROLL_SECONDS, AUDIO_STARVE_TIMEOUT,
+                name=str(ctx.guild.id)
             )
-            
-            # Воспроизводим трек
-            voice_client.play(
-                source,
-                after=lambda e: asyncio.run_coroutine_threadsafe(
-                    self.play_next(ctx), 
-                    self.bot.loop
-                ) if e is None else logger.error(f"Ошибка воспроизведения: {e}")
+            source.start()
+            with tracer.span('audio.preroll'):
+                await source.wait_preroll(AUDIO_PREROLL_TIMEOUT)
+        return source
+    
+    async def _ensure_fresh_url(self, guild_id, song):
+        """Повторное получение ссылки, только если сохраненная могла истечь (TRACK_URL_TTL)"""
+        resolved_at = song.get('resolved_at')
+        if not song.get('id') or resolved_at is None or time.time() - resolved_at < TRACK_URL_TTL:
+            return
+        stream = await self.resolve_stream(guild_id, song['id'])
+        if stream:
+            song.update(url=stream['url'], codec=stream['codec'], bitrate=stream['bitrate'], resolved_at=time.time())
+    
+    @staticmethod
+    def _is_streaming(voice_client, stream):
+        """Играет ли голосовой клиент этот поток (напрямую или через цепочку эффектов)"""
+        source = voice_client.source
+        return source is stream or getattr(source, 'source', None) is stream
+    
+    def _start_stream(self, ctx, voice_client, source, song, start_at=0):
+        """Запуск непрерывного потока сервера с первого трека"""
+        callbacks = dict(
+            on_switch=lambda stream, entry: self.bot.loop.call_soon_threadsafe(
+                self._on_track_switched, ctx, stream, entry
+            ),
+            on_preload=lambda stream: self.bot.loop.call_soon_threadsafe(self._preload_next, ctx, stream),
+            on_track_end=lambda entry, seconds: self.bot.loop.call_soon_threadsafe(
+                self._account_bandwidth, ctx.guild.id, entry, seconds
             )
-            
-            # Отправляем информацию о текущем треке
-            embed = discord.Embed(
-                title="🎵 Сейчас играет",
-                description=f"**{song['title']}**\n"
-                           f"Исполнитель: {song['artist']}\n"
-                           f"Длительность: {self.format_duration(song['duration'])}",
-                color=0x00ff00
+        )
+        if self.nodes is not None:
+            # Переходы, эффекты и кодирование выполняет узел, бот только отправляет кадры
+            stream = self.nodes.start_stream(
+                ctx.guild.id, source, song, self.get_effects(ctx.guild.id),
+                GAPLESS_PRELOAD_SECONDS, CROSSFADE_SECONDS, start_at, **callbacks
             )
-            
-            if song.get('cover_url'):
-                embed.set_thumbnail(url=song['cover_url'])
-            
-            # Создаем кнопки управления
-            view = MusicControlView(self, ctx.guild.id)
-            
-            await ctx.send(embed=embed, view=view)
-            
+            played = stream
+        else:
+            stream = GuildAudioStream(
+                source, song,
+                preload_seconds=GAPLESS_PRELOAD_SECONDS,
+                crossfade_seconds=CROSSFADE_SECONDS,
+                position=start_at,
+                **callbacks
+            )
+            played = EffectsSource(stream, self.get_effects(ctx.guild.id))
+        self.streams[ctx.guild.id] = stream
+        self._set_current(ctx.guild.id, song)
+        voice_client.play(played, after=lambda e: self._after_playback(ctx, e, stream))
+        
+        ended_at = self.track_ended_at.pop(ctx.guild.id, None)
+        if ended_at is not None:
+            TRACK_GAP.observe(time.monotonic() - ended_at)
+    
+    def _on_track_switched(self, ctx, stream, song):
+        """Поток перешел к подготовленному треку (вызывается в цикле событий)"""
+        if self.streams.get(ctx.guild.id) is not stream:
+            return
+        self._set_current(ctx.guild.id, song)
+        TRACK_GAP.observe(0.0)  # Переход на границе кадра
+        self._announce(ctx, song)
+    
+    def _set_current(self, guild_id, song):
+        """Новый текущий трек сервера; предыдущий считается доигранным"""
+        previous = self.current_song.get(guild_id)
+        if previous is not None and previous is not song:
+            self._finish_current(guild_id)
+        self.current_song[guild_id] = song
+    
+    def _finish_current(self, guild_id):
+        """Текущий трек доигран: запись уходит в историю, при повторе очереди — и в конец очереди"""
+        song = self.current_song.get(guild_id)
+        self.current_song[guild_id] = None
+        if song is None:
+            return
+        if self.repeat_mode.get(guild_id) == 'queue':
+            self.get_queue(guild_id).append(self._replay_entry(song))
+        history = self.get_history(guild_id)
+        # Повторы одного трека записываются один раз
+        if not history or song.get('id') is None or history[-1].get('id') != song.get('id'):
+            history.append(song)
+    
+    @staticmethod
+    def _replay_entry(song):
+        """Копия записи для повторного воспроизведения с начала: ссылка и громкость сохраняются,
+        устаревшую ссылку _ensure_fresh_url обновит перед запуском"""
+        entry = dict(song)
+        entry.pop('start_at', None)
+        entry.pop('repeat', None)
+        return entry
+    
+    def _preload_next(self, ctx, stream):
+        """До конца трека осталось GAPLESS_PRELOAD_SECONDS — готовим следующий (в цикле событий)"""
+        if self.streams.get(ctx.guild.id) is not stream or stream.finished:
+            return
+        self._cancel_preload(ctx.guild.id)
+        # Вызывается и из команд правки очереди: подготовка идет в собственной трассе
+        self._preload_tasks[ctx.guild.id] = asyncio.ensure_future(detached(self._preload, ctx))
+    
+    def _cancel_preload(self, guild_id):
+        task = self._preload_tasks.pop(guild_id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+    
+    async def _preload(self, ctx):
+        try:
+            await self.play_next(ctx, preload=True)
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
-            logger.error(f"Ошибка воспроизведения трека: {e}")
-            await ctx.send(ERROR_MESSAGES['playback_error'])
-            # Пытаемся воспроизвести следующий трек
-            await self.play_next(ctx)
+            logger.error("Ошибка подготовки следующего трека: %s", e)
+    
+    def _return_prepared(self, guild_id):
+        """Возврат подготовленного трека в начало очереди (очередь или соединение изменились)"""
+        stream = self.streams.get(guild_id)
+        if stream is None:
+            return False
+        prepared = stream.clear_next()
+        if prepared is not None and not prepared.get('repeat'):
+            self.get_queue(guild_id).appendleft(prepared)  # Копия для повтора трека не возвращается
+        return prepared is not None
+    
+    def upcoming(self, guild_id, start=0, stop=None):
+        """Треки после текущего с номера start до stop: подготовленный к переходу и очередь (без копирования)"""
+        stream = self.streams.get(guild_id)
+        prepared = stream.next_entry if stream is not None else None
+        if prepared is not None:
+            if start == 0 and (stop is None or stop > 0):
+                yield prepared
+            start, stop = max(0, start - 1), None if stop is None else stop - 1
+        yield from self.get_queue(guild_id).slice(start, stop)
+    
+    def upcoming_count(self, guild_id):
+        stream = self.streams.get(guild_id)
+        prepared = stream is not None and stream.next_entry is not None
+        return len(self.get_queue(guild_id)) + prepared
+    
+    def _announce(self, ctx, song):
+        """Текущий трек в панели "Сейчас играет" (правка на месте, с объединением частых смен)"""
+        self.panels.show(ctx, song)
+    
+    def register_controls(self):
+        """Регистрация постоянного обработчика кнопок (один раз при запуске)"""
+        if self.control_view is None:
+            self.control_view = MusicControlView(self)
+            self.bot.add_view(self.control_view)
+    
+    def control_layout(self, guild_id):
+        """Кнопки управления для сообщения с учетом паузы сервера"""
+        voice_client = self.get_voice_client(guild_id)
+        paused = bool(voice_client and voice_client.is_paused())
+        layout = self.control_layouts.get(paused)
+        if layout is None:
+            layout = self.control_layouts[paused] = MusicControlView(self, paused)
+            layout.stop()  # Остановленное представление не сохраняется в хранилище для каждого сообщения
+        return layout
+    
+    def _ffmpeg_available(self):
+        """Проверка наличия FFmpeg (один раз за запуск, см. FFmpegSupervisor.probe)"""
+        return self.ffmpeg.available
+    
+    def _create_source(self, song, start_at=0):
+        """Создание источника звука для трека (переопределяется в бенчмарках)"""
+        return discord.FFmpegPCMAudio(
+            song['url'],
+            executable=self.ffmpeg.path or 'ffmpeg',
+            before_options=ffmpeg_before_options(FFMPEG_PROBESIZE, FFMPEG_ANALYZEDURATION, start_at)
+        )
+    
+    def buffer_health(self, guild_id):
+        """Состояние аудиобуфера текущего трека (None, если буфер не используется)"""
+        stream = self.streams.get(guild_id)
+        source = stream.current if stream is not None else None
+        if isinstance(source, BufferedAudioSource):
+            return source.health()
+        return None
     
     def format_duration(self, seconds):
         """Форматирование длительности трека"""
         minutes, seconds = divmod(seconds, 60)
         return f"{minutes}:{seconds:02d}"
     
+    @traced('player.add_next_my_wave_track')
     async def _add_next_my_wave_track(self, ctx):
         """Добавление следующего трека из 'Моя волна'"""
         try:
@@ -418,7 +709,7 @@ class MusicPlayer:
                 
                 # Проверяем, что у трека есть ID
                 if 'id' not in track or not track['id']:
-                    logger.warning(f"У трека отсутствует ID (попытка {attempt + 1}): {track.get('title', 'Unknown')}")
+                    logger.warning("У трека отсутствует ID (попытка %s): %s", attempt + 1, track.get('title', 'Unknown'))
                     # Сохраняем batch_id для следующего запроса
                     if 'batch_id' in track and track['batch_id']:
                         self.my_wave_batch_id[ctx.guild.id] = track['batch_id']
@@ -426,10 +717,10 @@ class MusicPlayer:
                 
                 # Проверяем, не был ли трек уже проигран
                 if track['id'] not in played_tracks:
-                    logger.info(f"Найден новый трек (попытка {attempt + 1}): {track['title']} - {track['artist']}")
+                    logger.info("Найден новый трек (попытка %s): %s - %s", attempt + 1, track['title'], track['artist'])
                     break
                 else:
-                    logger.info(f"Трек уже проигран (попытка {attempt + 1}): {track['title']} - {track['artist']}")
+                    logger.info("Трек уже проигран (попытка %s): %s - %s", attempt + 1, track['title'], track['artist'])
                     # Сохраняем batch_id для следующего запроса
                     if 'batch_id' in track and track['batch_id']:
                         self.my_wave_batch_id[ctx.guild.id] = track['batch_id']
@@ -441,13 +732,13 @@ class MusicPlayer:
             # Сохраняем batch_id для следующего запроса
             if 'batch_id' in track and track['batch_id']:
                 self.my_wave_batch_id[ctx.guild.id] = track['batch_id']
-                logger.info(f"Сохранен batch_id: {track['batch_id']}")
+                logger.info("Сохранен batch_id: %s", track['batch_id'])
             
-            # Получаем URL трека
-            track_url = await self.bot.yandex_client.get_track_url(track['id'])
+            # Получаем URL трека (вариант под битрейт голосового канала)
+            stream = await self.resolve_stream(ctx.guild.id, track['id'])
             
-            if not track_url:
-                logger.warning(f"Не удалось получить URL для трека {track['id']}")
+            if not stream:
+                logger.warning("Не удалось получить URL для трека %s", track['id'])
                 return False
             
             # Добавляем трек в очередь
@@ -455,22 +746,27 @@ class MusicPlayer:
                 'title': track['title'],
                 'artist': track['artist'],
                 'duration': track['duration'],
-                'url': track_url,
-                'id': track['id']
+                'url': stream['url'],
+                'codec': stream['codec'],
+                'bitrate': stream['bitrate'],
+                'id': track['id'],
+                'loudness': track.get('loudness'),
+                'true_peak': track.get('true_peak'),
+                'resolved_at': time.time()
             }
             
             queue = self.get_queue(ctx.guild.id)
             queue.append(song)
             
-            logger.info(f"Добавлен следующий трек из 'Моя волна': {track['title']} - {track['artist']}")
+            logger.info("Добавлен следующий трек из 'Моя волна': %s - %s", track['title'], track['artist'])
             return True
             
         except Exception as e:
-            logger.error(f"Ошибка добавления следующего трека из 'Моя волна': {e}")
+            logger.error("Ошибка добавления следующего трека из 'Моя волна': %s", e)
             return False
     
-    async def add_to_queue(self, ctx, song_info, url):
-        """Добавление трека в очередь"""
+    async def add_to_queue(self, ctx, song_info, stream, priority=False):
+        """Добавление трека в очередь (stream — результат resolve_stream; priority — вне очереди, !playnext)"""
         queue = self.get_queue(ctx.guild.id)
         
         if len(queue) >= MAX_QUEUE_SIZE:
@@ -485,12 +781,21 @@ class MusicPlayer:
             'title': song_info['title'],
             'artist': song_info['artist'],
             'duration': song_info['duration'],
-            'url': url,
+            'url': stream['url'],
+            'codec': stream.get('codec'),
+            'bitrate': stream.get('bitrate'),
+            'id': song_info.get('id'),
             'cover_url': song_info.get('cover_url'),
-            'requester': ctx.author
+            'requester': ctx.author,
+            'loudness': song_info.get('loudness'),
+            'true_peak': song_info.get('true_peak'),
+            'resolved_at': time.time()  # Ссылка CDN временная: по этому полю решается, запрашивать ли ее заново
         }
         
-        queue.append(song)
+        if priority:
+            queue.add_priority(song)
+        else:
+            queue.append(song)
         return True
     
     async def skip_song(self, ctx):
@@ -506,9 +811,344 @@ class MusicPlayer:
             logger.info("Режим 'Моя волна' активен, добавляем новый трек...")
             await self._add_next_my_wave_track(ctx)
         
-        voice_client.stop()
+        self.skip_current(ctx.guild.id)
         await ctx.send("⏭️ Трек пропущен!")
     
+    def skip_current(self, guild_id):
+        """Переход к следующему треку: к подготовленному — сразу, иначе через остановку потока"""
+        stream = self.streams.get(guild_id)
+        if self.repeat_mode.get(guild_id) == 'one':
+            # Пропуск выходит из повтора: подготовленная копия текущего трека отбрасывается
+            self._repeat_skipped.add(guild_id)
+            self._cancel_preload(guild_id)
+            if stream is not None and stream.next_entry is not None and stream.next_entry.get('repeat'):
+                stream.clear_next()
+        if stream is not None and stream.skip():
+            return
+        voice_client = self.get_voice_client(guild_id)
+        if voice_client:
+            voice_client.stop()
+    
+    async def _edit_queue(self, ctx, edit, prepare=True):
+        """Правка очереди по номерам из !queue (1 — следующий трек).
+        
+        Подготовленный к бесшовному переходу трек сначала возвращается в очередь, а после правки
+        готовится новый первый трек (prepare=False — не готовится). edit(queue) возвращает текст ответа.
+        """
+        guild_id = ctx.guild.id
+        async with self._play_locks.setdefault(guild_id, asyncio.Lock()):
+            returned = self._return_prepared(guild_id)
+            message = edit(self.get_queue(guild_id))
+        stream = self.streams.get(guild_id)
+        if prepare and returned and stream is not None:
+            self._preload_next(ctx, stream)
+        await ctx.send(message)
+    
+    @staticmethod
+    def _queue_index(queue, position):
+        """Индекс в очереди по номеру из !queue; None — такого номера нет"""
+        return position - 1 if 1 <= position <= len(queue) else None
+    
+    async def remove_from_queue(self, ctx, position):
+        """Удаление трека из очереди по номеру"""
+        def edit(queue):
+            index = self._queue_index(queue, position)
+            if index is None:
+                return f"❌ В очереди нет позиции {position}"
+            song = queue.pop(index)
+            return f"🗑️ Удален из очереди: **{song['title']}** - {song['artist']}"
+        await self._edit_queue(ctx, edit)
+    
+    async def move_in_queue(self, ctx, source, target):
+        """Перенос трека на другую позицию очереди"""
+        def edit(queue):
+            index = self._queue_index(queue, source)
+            if index is None:
+                return f"❌ В очереди нет позиции {source}"
+            target_index = max(1, min(target, len(queue))) - 1
+            song = queue.move(index, target_index)
+            return f"↕️ **{song['title']}** теперь на позиции {target_index + 1}"
+        await self._edit_queue(ctx, edit)
+    
+    async def shuffle_queue(self, ctx):
+        """Перемешивание очереди"""
+        def edit(queue):
+            if len(queue) < 2:
+                return "❌ В очереди меньше двух треков"
+            queue.shuffle()
+            return f"🔀 Очередь перемешана ({len(queue)} треков)"
+        await self._edit_queue(ctx, edit)
+    
+    async def jump_to(self, ctx, position):
+        """Переход к треку очереди: предыдущие удаляются, текущий прерывается"""
+        jumped = []
+        
+        def edit(queue):
+            index = self._queue_index(queue, position)
+            if index is None:
+                return f"❌ В очереди нет позиции {position}"
+            queue.drop(index)
+            jumped.append(queue[0])
+            return f"⏭️ Переход к треку {position}: **{queue[0]['title']}** - {queue[0]['artist']}"
+        
+        await self._edit_queue(ctx, edit, prepare=False)
+        if jumped:
+            voice_client = self.get_voice_client(ctx.guild.id)
+            if voice_client and (voice_client.is_playing() or voice_client.is_paused()):
+                self.skip_current(ctx.guild.id)  # Подготовленного нет — поток остановится и начнет первый трек
+            else:
+                await self.play_next(ctx)
+    
+    async def previous_track(self, ctx):
+        """Возврат к предыдущему треку из истории; прерванный текущий трек играет следующим с начала"""
+        guild_id = ctx.guild.id
+        restarted = []
+        
+        def edit(queue):
+            # Проверка под блокировкой сервера: два быстрых !previous не снимут одну запись дважды
+            history = self.get_history(guild_id)
+            if not history:
+                return "❌ История пуста"
+            song = history.pop()
+            restarted.append(song)
+            current = self.current_song.get(guild_id)
+            if current is not None:
+                queue.appendleft(self._replay_entry(current))
+                self.current_song[guild_id] = None  # Не попадает в историю: повторный !previous идет дальше назад
+            queue.appendleft(self._replay_entry(song))
+            return f"⏮️ Предыдущий трек: **{song['title']}** - {song['artist']}"
+        
+        await self._edit_queue(ctx, edit, prepare=False)
+        if not restarted:
+            return
+        voice_client = self.get_voice_client(guild_id)
+        if voice_client and (voice_client.is_playing() or voice_client.is_paused()):
+            self.skip_current(guild_id)
+        else:
+            await self.play_next(ctx)
+    
+    async def set_repeat(self, ctx, mode=None):
+        """Режим повтора: off, one (текущий трек) или queue (доигранные треки уходят в конец очереди);
+        без параметра — следующий режим по кругу"""
+        modes = list(self.REPEAT_MODES)
+        if mode is None:
+            mode = modes[(modes.index(self.repeat_mode.get(ctx.guild.id, 'off')) + 1) % len(modes)]
+        elif mode not in self.REPEAT_MODES:
+            await ctx.send("❌ Режим повтора: `off`, `one` или `queue`")
+            return
+        
+        def edit(queue):
+            self.repeat_mode[ctx.guild.id] = mode
+            return self.REPEAT_MODES[mode]
+        
+        # Подготовленный трек готовится заново: при повторе трека это копия текущего
+        await self._edit_queue(ctx, edit)
+        self.panels.refresh(ctx.guild.id)
+    
+    async def set_volume(self, ctx, percent=None):
+        """Громкость воспроизведения (применяется сразу, без перезапуска трека)"""
+        effects = self.get_effects(ctx.guild.id)
+        if percent is None:
+            await ctx.send(f"🔊 Громкость: {effects.volume:.0%}")
+            return
+        if not 0 <= percent <= MAX_VOLUME:
+            await ctx.send(f"❌ Громкость должна быть от 0 до {MAX_VOLUME}%")
+            return
+        effects.volume = percent / 100
+        self._effects_changed(ctx.guild.id)
+        await ctx.send(f"🔊 Громкость: {percent}%")
+    
+    async def set_normalization(self, ctx, enabled=None):
+        """Выравнивание громкости треков"""
+        effects = self.get_effects(ctx.guild.id)
+        if enabled is not None:
+            effects.normalize = enabled
+            self._effects_changed(ctx.guild.id)
+        await ctx.send(f"🎚️ Нормализация громкости {'включена' if effects.normalize else 'выключена'}")
+    
+    async def set_equalizer(self, ctx, bass=0.0, mid=0.0, treble=0.0):
+        """Трехполосный эквалайзер (дБ)"""
+        effects = self.get_effects(ctx.guild.id)
+        effects.set_eq(bass, mid, treble)
+        self._effects_changed(ctx.guild.id)
+        message = "🎛️ " + effects.describe().splitlines()[-1]
+        if effects.eq_enabled and not effects_available():
+            message += "\n⚠️ Для эквалайзера нужен numpy, сейчас применяется только громкость"
+        await ctx.send(message)
+    
+    def _effects_changed(self, guild_id):
+        """Передача новых настроек эффектов узлу (в процессе бота они читаются на каждом кадре)"""
+        stream = self.streams.get(guild_id)
+        if isinstance(stream, RemoteStream):
+            stream.update_effects(self.get_effects(guild_id))
+    
+    @staticmethod
+    def parse_position(value, current=0.0):
+        """Позиция из "1:30", "90", "+15" или "-10" (относительно current); None — не разобрать"""
+        value = str(value).strip()
+        sign = value[0] if value and value[0] in '+-' else ''
+        parts = value[len(sign):].split(':')
+        if not 1 <= len(parts) <= 3:
+            return None
+        seconds = 0.0
+        try:
+            for part in parts:
+                seconds = seconds * 60 + float(part)
+        except ValueError:
+            return None
+        if sign == '+':
+            return current + seconds
+        if sign == '-':
+            return current - seconds
+        return seconds
+    
+    async def seek(self, ctx, position):
+        """Перемотка текущего трека: FFmpeg перезапускается с -ss по уже полученной ссылке"""
+        guild_id = ctx.guild.id
+        stream = self.streams.get(guild_id)
+        song = stream.entry if stream is not None and not stream.finished else None
+        if song is None:
+            await ctx.send("Сейчас ничего не играет!", ephemeral=True)
+            return
+        
+        target = self.parse_position(position, stream.position)
+        if target is None:
+            await ctx.send("❌ Укажите позицию: `1:30`, `90`, `+15` или `-10`", ephemeral=True)
+            return
+        target = max(0.0, target)
+        duration = song.get('duration') or 0
+        if duration and target >= duration:
+            await ctx.send(f"❌ Трек длится {self.format_duration(duration)}", ephemeral=True)
+            return
+        
+        # Под блокировкой сервера: подготовка следующего трека не пересекается с перемоткой
+        async with self._play_locks.setdefault(guild_id, asyncio.Lock()):
+            try:
+                source = await self._open_source(ctx, song, target)
+            except FFmpegBusy:
+                await ctx.send("⏳ Все аудиопотоки заняты, попробуйте чуть позже", ephemeral=True)
+                return
+            except Exception as e:
+                logger.error("Ошибка перемотки трека: %s", e)
+                await ctx.send(ERROR_MESSAGES['playback_error'])
+                return
+            if not stream.replace_current(source, song, target):
+                source.cleanup()
+                await ctx.send("❌ Трек сменился, перемотка отменена", ephemeral=True)
+                return
+        self.panels.refresh(guild_id)
+        await ctx.send(f"⏩ Перемотано на {self.format_duration(int(target))}")
+    
+    def snapshot_state(self):
+        """Состояние воспроизведения серверов для сохранения: каналы, текущий трек с позицией, очередь"""
+        guilds = {}
+        for guild_id, voice_client in list(self.voice_clients.items()):
+            channel = self.voice_manager.channels.get(guild_id) or getattr(voice_client, 'channel', None)
+            ctx = self.voice_manager.contexts.get(guild_id)
+            text_channel = getattr(ctx, 'channel', None)
+            if channel is None or text_channel is None:
+                continue
+            current = self.current_song.get(guild_id)
+            stream = self.streams.get(guild_id)
+            songs = list(self.get_queue(guild_id))
+            if stream is not None and stream.next_entry is not None and not stream.next_entry.get('repeat'):
+                songs.insert(0, stream.next_entry)  # Подготовленный трек уже снят с очереди
+            if current is None and not songs:
+                continue
+            position = stream.position if stream is not None and stream.entry is current else 0.0
+            guilds[guild_id] = {
+                'voice_channel_id': channel.id,
+                'text_channel_id': text_channel.id,
+                'current': song_to_state(current) if current else None,
+                'position': round(position, 2),
+                'queue': [song_to_state(song) for song in songs],
+                'my_wave': self.my_wave_mode.get(guild_id, False),
+                'batch_id': self.my_wave_batch_id.get(guild_id),
+                'repeat': self.repeat_mode.get(guild_id, 'off'),
+            }
+        return guilds
+    
+    async def save_state(self):
+        """Запись состояния на диск (в пуле потоков); без изменений файл не перезаписывается"""
+        if not self.state_store.path:
+            return
+        guilds = self.snapshot_state()
+        if guilds == self._saved_state:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self.state_store.save, guilds)
+        self._saved_state = guilds
+    
+    def start_state_saver(self):
+        """Периодическое сохранение позиции и очереди (PLAYBACK_STATE_INTERVAL)"""
+        if self.state_store.path and PLAYBACK_STATE_INTERVAL > 0 and self._state_task is None:
+            self._state_task = asyncio.ensure_future(self._state_saver())
+    
+    async def _state_saver(self):
+        while True:
+            await asyncio.sleep(PLAYBACK_STATE_INTERVAL)
+            try:
+                await self.save_state()
+            except Exception as e:
+                logger.error("Ошибка сохранения состояния воспроизведения: %s", e)
+    
+    async def shutdown(self):
+        """Остановка периодического сохранения, последняя запись состояния и завершение FFmpeg"""
+        if self._state_task is not None:
+            self._state_task.cancel()
+            self._state_task = None
+        await self.save_state()
+        await self.workers.stop()
+        await self.panels.stop()
+        await self.outbound.stop()
+        await self.ffmpeg.stop()
+        if self.nodes is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.nodes.stop)
+    
+    async def restore_state(self):
+        """Продолжение воспроизведения после перезапуска с сохраненной позиции (один раз за запуск)"""
+        if self._state_restored:
+            return
+        self._state_restored = True
+        saved = await asyncio.get_running_loop().run_in_executor(None, self.state_store.load)
+        for guild_id, state in saved.items():
+            try:
+                await self._restore_guild(guild_id, state)
+            except Exception as e:
+                logger.error("Не удалось восстановить воспроизведение сервера %s: %s", guild_id, e)
+    
+    async def _restore_guild(self, guild_id, state):
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return
+        channel = guild.get_channel(state.get('voice_channel_id'))
+        text_channel = guild.get_channel(state.get('text_channel_id'))
+        if channel is None or text_channel is None:
+            return
+        # В пустой канал не возвращаемся
+        if not any(not member.bot for member in getattr(channel, 'members', [])):
+            logger.info("В канале %s никого нет, воспроизведение не восстанавливается", channel)
+            return
+        
+        songs = [dict(song) for song in state.get('queue', [])]
+        if state.get('current'):
+            songs.insert(0, dict(state['current'], start_at=state.get('position', 0)))
+        if not songs:
+            return
+        
+        ctx = GuildContext(self.bot, guild, text_channel)
+        if not await self.voice_manager.connect(guild, channel, ctx):
+            return
+        self.get_queue(guild_id).extend(songs)
+        self.my_wave_mode[guild_id] = state.get('my_wave', False)
+        self.repeat_mode[guild_id] = state.get('repeat', 'off')
+        if state.get('batch_id'):
+            self.my_wave_batch_id[guild_id] = state['batch_id']
+        logger.info(
+            "Восстановлено воспроизведение сервера %s: %s треков, позиция %.0f с",
+            guild_id, len(songs), state.get('position', 0)
+        )
+        await self.play_next(ctx)
+    
     async def pause_song(self, ctx):
         """Пауза воспроизведения"""
         voice_client = self.get_voice_client(ctx.guild.id)
@@ -518,6 +1158,7 @@ class MusicPlayer:
             return
         
         voice_client.pause()
+        self.panels.refresh(ctx.guild.id)
         await ctx.send("⏸️ Воспроизведение приостановлено!")
     
     async def resume_song(self, ctx):
@@ -529,72 +1170,79 @@ class MusicPlayer:
             return
         
         voice_client.resume()
+        self.panels.refresh(ctx.guild.id)
         await ctx.send("▶️ Воспроизведение возобновлено!")
     
-    async def stop_playback(self, ctx):
-        """Остановка воспроизведения и очистка очереди"""
-        voice_client = self.get_voice_client(ctx.guild.id)
-        queue = self.get_queue(ctx.guild.id)
+    def reset_playback(self, guild_id, text="⏹️ Воспроизведение остановлено"):
+        """Остановка, очистка очереди и режима "Моя волна"; отключение — после простоя (text — в панель)"""
+        voice_client = self.get_voice_client(guild_id)
+        queue = self.get_queue(guild_id)
         
+        # Сначала чистим очередь, чтобы after-колбэк не запустил следующий трек
+        queue.clear()
+        self._cancel_preload(guild_id)
+        stream = self.streams.get(guild_id)
+        if stream is not None:
+            stream.clear_next()
         if voice_client:
             voice_client.stop()
         
-        queue.clear()
-        self.current_song[ctx.guild.id] = None
+        self.current_song[guild_id] = None
+        self.panels.close(guild_id, text)
         # Сбрасываем режим "Моя волна" и связанные данные
-        self.my_wave_mode[ctx.guild.id] = False
-        if ctx.guild.id in self.my_wave_batch_id:
-            del self.my_wave_batch_id[ctx.guild.id]
-        if ctx.guild.id in self.played_tracks:
-            del self.played_tracks[ctx.guild.id]
+        self.my_wave_mode[guild_id] = False
+        if guild_id in self.my_wave_batch_id:
+            del self.my_wave_batch_id[guild_id]
+        if guild_id in self.played_tracks:
+            del self.played_tracks[guild_id]
         
-        # Отключаемся от голосового канала
+        # Соединение удерживается VOICE_LINGER_SECONDS: следующий !play не ждет голосового рукопожатия
         if voice_client:
-            await voice_client.disconnect()
-            if ctx.guild.id in self.voice_clients:
-                del self.voice_clients[ctx.guild.id]
-        
-        await ctx.send("⏹️ Остановлено и отключился от голосового канала!")
+            self.voice_manager.release(guild_id, lambda: self._is_idle(guild_id))
+    
+    def _is_idle(self, guild_id):
+        """Ничего не играет и очередь пуста"""
+        voice_client = self.get_voice_client(guild_id)
+        playing = voice_client is not None and (voice_client.is_playing() or voice_client.is_paused())
+        return not playing and not self.get_queue(guild_id)
+    
+    async def stop_playback(self, ctx):
+        """Остановка воспроизведения и очистка очереди"""
+        self.reset_playback(ctx.guild.id)
+        await ctx.send("⏹️ Воспроизведение остановлено, очередь очищена!")
     
     async def show_queue(self, ctx):
         """Показ текущей очереди"""
-        queue = self.get_queue(ctx.guild.id)
+        total = self.upcoming_count(ctx.guild.id)
         current = self.current_song.get(ctx.guild.id)
         
-        if not queue and not current:
+        if not total and not current:
             await ctx.send("Очередь пуста!", ephemeral=True)
             return
         
-        embed = discord.Embed(title="🎵 Очередь воспроизведения", color=0x00ff00)
-        
-        if current:
-            embed.add_field(
-                name="Сейчас играет",
-                value=f"**{current['title']}**\n{current['artist']}",
-                inline=False
-            )
-        
-        if queue:
-            queue_text = ""
-            for i, song in enumerate(list(queue)[:10], 1):  # Показываем первые 10 треков
-                queue_text += f"{i}. **{song['title']}** - {song['artist']}\n"
-            
-            if len(queue) > 10:
-                queue_text += f"... и еще {len(queue) - 10} треков"
-            
-            embed.add_field(name="Очередь", value=queue_text, inline=False)
-        
-        await ctx.send(embed=embed)
+        message = self.queue_message(ctx.guild.id)
+        sent = await ctx.send(**message)
+        if 'view' in message:
+            message['view'].message = sent
+    
+    def queue_message(self, guild_id):
+        """Первая страница очереди и кнопки листания, если страниц несколько"""
+        message = {'embed': self.queue_pages.embed(guild_id)}
+        if self.queue_pages.page_count(guild_id) > 1:
+            message['view'] = QueuePagerView(self.queue_pages, guild_id)
+        return message
     
     async def disconnect(self, ctx):
         """Отключение от голосового канала"""
         voice_client = self.get_voice_client(ctx.guild.id)
         
         if voice_client:
-            await voice_client.disconnect()
-            del self.voice_clients[ctx.guild.id]
-            self.queues[ctx.guild.id].clear()
+            await self.voice_manager.disconnect(ctx.guild.id)
+            self.get_queue(ctx.guild.id).clear()
             self.current_song[ctx.guild.id] = None
+            self.history.pop(ctx.guild.id, None)
+            self.panels.close(ctx.guild.id, "👋 Отключился от голосового канала")
+            self.queue_pages.forget(ctx.guild.id)
             await ctx.send("👋 Отключился от голосового канала!")
         else:
             await ctx.send("Бот не подключен к голосовому каналу!", ephemeral=True)
@@ -0,0 +1,464 @@
+import time
+import asyncio
+import logging
+import threading
+import itertools
+import multiprocessing
+from collections import deque
+import discord
+from config import AUDIO_PREROLL_TIMEOUT
+from audio_source import SILENCE, FRAME_SECONDS
+from audio_node import run_node, FRAMES_PER_MESSAGE
+from playback_state import song_to_state
+from metrics import AUDIO_NODE_STREAMS, AUDIO_NODE_CPU
+
+logger = logging.getLogger(__name__)
+
+OPUS_SILENCE = b'\xf8\xff\xfe'  # Кадр тишины Opus
+HELLO_TIMEOUT = 30  # Запуск процесса узла (spawn заново импортирует модули)
+
+
+def _remote(source):
+    """RemoteSource из источника, возможно обернутого надзором FFmpeg"""
+    return getattr(source, 'source', source)
+
+
+class RemoteSource(discord.AudioSource):
+    """Источник, открытый на аудиоузле: FFmpeg и буфер живут в процессе узла"""
+
+    _process = None
+
+    def __init__(self, node, source_id):
+        self.node = node
+        self.id = source_id
+
+    def read(self):
+        return b''  # Кадры идут через RemoteStream
+
+    def cleanup(self):
+        # Узел закрывает источник, только если тот еще не передан потоку
+        self.node.send('close', self.id)
+
+
+class RemoteStream(discord.AudioSource):
+    """Непрерывный поток сервера, который собирает аудиоузел (интерфейс как у GuildAudioStream).
+
+    Узел готовит кадры наперед в пределах окна кредитов и присылает их пачками; поток
+    воспроизведения discord.py берет их отсюда и возвращает кредиты. Команды, меняющие
+    текущий звук (перемотка, пропуск), увеличивают эпоху — кадры старых эпох отбрасываются.
+    """
+
+    def __init__(self, node, stream_id, guild_id, source, entry, on_switch=None, on_preload=None,
+                 on_track_end=None, position=0.0):
+        self.node = node
+        self.id = stream_id
+        self.guild_id = guild_id
+        self.current = source
+        self.entry = entry
+        self.next = None
+        self.next_entry = None
+        self.on_switch = on_switch
+        self.on_preload = on_preload
+        self.on_track_end = on_track_end
+        self.frames_read = int(position / FRAME_SECONDS)
+        self.frames_played = 0
+        self.finished = False
+        self.epoch = 0
+        self.opus = node.opus
+        self._tokens = itertools.count(1)
+        self._token = next(self._tokens)
+        self._next_token = None
+        self._entries = {self._token: entry}
+        self._packets = deque()
+        self._ended = False  # Узел сообщил о конце потока
+        self._credits = 0  # Кадры, за которые узлу еще не возвращен кредит
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+
+    @property
+    def position(self):
+        """Позиция текущего трека, с"""
+        return self.frames_read * FRAME_SECONDS
+
+    def sources(self):
+        return [source for source in (self.current, self.next) if source is not None]
+
+    def _state(self, entry, token):
+        return dict(song_to_state(entry), token=token)
+
+    def start(self, effects, preload_seconds, crossfade_seconds, window):
+        self.node.streams[self.id] = self
+        self.node.send(
+            'play', self.id, _remote(self.current).id, self._state(self.entry, self._token), self.position,
+            self._effects(effects), preload_seconds, crossfade_seconds, window
+        )
+
+    @staticmethod
+    def _effects(effects):
+        return effects.volume, effects.normalize, effects.target_lufs, effects.eq
+
+    # Сообщения узла (поток чтения узла)
+
+    def _receive(self, packets):
+        with self._cond:
+            self._packets.extend(packets)
+
+    def _receive_end(self):
+        with self._cond:
+            self._ended = True
+
+    def _preload(self):
+        if self.on_preload is not None and not self.finished:
+            self.on_preload(self)
+
+    # Команды
+
+    def queue_next(self, source, entry, position=0.0):
+        """Подготовленный трек, который зазвучит сразу после текущего; False — поток уже закончился"""
+        with self._lock:
+            if self.finished or _remote(source).node is not self.node:
+                return False
+            previous = self.next
+            token = next(self._tokens)
+            self.next, self.next_entry, self._next_token = source, entry, token
+            self._entries[token] = entry
+            self.node.send('queue_next', self.id, _remote(source).id, self._state(entry, token), position)
+        if previous is not None:
+            previous.cleanup()
+        return True
+
+    def replace_current(self, source, entry, position):
+        """Замена источника текущего трека (перемотка); False — трек уже сменился"""
+        with self._lock:
+            if self.finished or self.entry is not entry or _remote(source).node is not self.node:
+                return False
+            previous = self.current
+            self.current = source
+            self.frames_read = int(position / FRAME_SECONDS)
+            self._flush()
+            self.node.send('replace', self.id, _remote(source).id, self._token, position, self.epoch)
+        previous.cleanup()
+        return True
+
+    def clear_next(self):
+        """Отмена подготовленного трека; возвращает его запись"""
+        with self._lock:
+            source, entry = self.next, self.next_entry
+            self.next = self.next_entry = self._next_token = None
+            if source is not None:
+                self.node.send('clear_next', self.id)
+        if source is not None:
+            source.cleanup()
+        return entry
+
+    def skip(self):
+        """Переход к подготовленному треку; False — подготовленного нет"""
+        with self._lock:
+            if self.next is None or self.finished:
+                return False
+            self._flush()
+            self.node.send('skip', self.id, self.epoch)
+            return True
+
+    def update_effects(self, effects):
+        self.node.send('effects', self.id, *self._effects(effects))
+
+    def _flush(self):
+        # Вызывается под self._lock: уже присланные кадры больше не нужны
+        self.epoch += 1
+        with self._cond:
+            self._credits += len(self._packets)
+            self._packets.clear()
+
+    # Воспроизведение
+
+    def _track_ended(self):
+        if self.on_track_end is not None and self.entry is not None:
+            self.on_track_end(self.entry, self.frames_played * FRAME_SECONDS)
+        self.frames_played = 0
+
+    def _switch(self, token):
+        # Вызывается под self._lock: узел перешел к следующему треку
+        self._track_ended()
+        finished_source = self.current
+        if token == self._next_token:
+            self.current, self.entry = self.next, self.next_entry
+        else:
+            self.current, self.entry = None, self._entries.get(token)  # Подготовленный уже отменен
+        self._entries.pop(self._token, None)
+        self.next = self.next_entry = self._next_token = None
+        self._token = token
+        if finished_source is not None:
+            finished_source.cleanup()
+        if self.on_switch is not None and self.entry is not None:
+            self.on_switch(self, self.entry)
+
+    def _next_packet(self):
+        with self._cond:
+            while self._packets:
+                packet = self._packets.popleft()
+                if packet[0] == self.epoch:
+                    return packet, False
+                self._credits += 1
+            return None, self._ended
+
+    def read(self):
+        with self._lock:
+            if self.finished:
+                return b''
+            packet, ended = self._next_packet()
+            if packet is None:
+                if ended:
+                    self.finished = True
+                    self._track_ended()
+                    return b''
+                # Узел не успел подготовить кадр: тишина, пока буфер узла набирает запас
+                self._return_credits()
+                return OPUS_SILENCE if self.opus else SILENCE
+            _, token, frames_read, data = packet
+            if token != self._token:
+                self._switch(token)
+            self.frames_read = frames_read
+            self.frames_played += 1
+            with self._cond:
+                self._credits += 1
+            self._return_credits()
+            return data
+
+    def _return_credits(self):
+        with self._cond:
+            credits = self._credits if self._credits >= FRAMES_PER_MESSAGE else 0
+            self._credits -= credits
+        if credits:
+            self.node.send('credit', self.id, credits)
+
+    def is_opus(self):
+        return self.opus
+
+    def cleanup(self):
+        with self._lock:
+            if not self.finished:
+                self._track_ended()  # Остановка посреди трека
+            self.finished = True
+            sources = self.sources()
+            self.current = self.next = None
+        self.node.streams.pop(self.id, None)
+        self.node.send('stop', self.id)
+        for source in sources:
+            source.cleanup()
+
+
+class AudioNodeProcess:
+    """Процесс-узел и канал к нему"""
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.pid = None
+        self.opus = False  # Узел кодирует в Opus сам (иначе присылает PCM)
+        self.alive = False
+        self.started_at = None
+        self.streams = {}
+        self.pending = {}  # Открываемые источники: id -> Future
+        self.stats = {}
+        self._send_lock = threading.Lock()
+        self._restart = None
+
+    def start(self, executable='ffmpeg'):
+        """Запуск процесса и ожидание приветствия (блокирующий, вызывать из исполнителя)"""
+        context = multiprocessing.get_context('spawn')
+        conn, child = context.Pipe()
+        process = context.Process(
+            target=run_node, args=(child, executable), name=f'audio-node-{self.index}', daemon=True
+        )
+        process.start()
+        child.close()
+        if not conn.poll(HELLO_TIMEOUT):
+            process.kill()
+            raise RuntimeError(f"Аудиоузел {self.index} не ответил за {HELLO_TIMEOUT} с")
+        _, self.pid, self.opus = conn.recv()
+        self.process, self.conn = process, conn
+        self.stats = {}
+        self.started_at = time.monotonic()
+        self.alive = True
+        threading.Thread(target=self._read, name=f'audio-node-{self.index}-reader', daemon=True).start()
+        logger.info(
+            "Аудиоузел %s запущен (pid %s, %s)", self.index, self.pid, 'Opus' if self.opus else 'PCM, кодирует бот'
+        )
+
+    def send(self, *message):
+        if not self.alive:
+            return
+        try:
+            with self._send_lock:
+                self.conn.send(message)
+        except (OSError, EOFError, ValueError) as e:
+            logger.error("Аудиоузел %s недоступен: %s", self.index, e)
+            self._dead()
+
+    def _read(self):
+        conn = self.conn
+        while True:
+            try:
+                kind, *args = conn.recv()
+            except (OSError, EOFError):
+                break
+            try:
+                self._dispatch(kind, *args)
+            except Exception as e:
+                logger.error("Ошибка сообщения %s аудиоузла %s: %s", kind, self.index, e)
+        if self.conn is conn:
+            self._dead()
+
+    def _dispatch(self, kind, *args):
+        if kind == 'frames':
+            stream = self.streams.get(args[0])
+            if stream is not None:
+                stream._receive(args[1])
+        elif kind == 'end':
+            stream = self.streams.get(args[0])
+            if stream is not None:
+                stream._receive_end()
+        elif kind == 'preload':
+            stream = self.streams.get(args[0])
+            if stream is not None:
+                stream._preload()
+        elif kind == 'ready':
+            future = self.pending.pop(args[0], None)
+            if future is not None:
+                self.pool._resolve(future, args[1])
+        elif kind == 'stats':
+            self.stats = args[0]
+
+    def _dead(self):
+        """Узел упал или закрыл канал: его потоки заканчиваются, серверы переходят к следующему треку"""
+        if not self.alive:
+            return
+        self.alive = False
+        logger.error("Аудиоузел %s (pid %s) остановился", self.index, self.pid)
+        for stream in list(self.streams.values()):
+            stream._receive_end()
+        for future in list(self.pending.values()):
+            self.pool._resolve(future, False)
+        self.pending.clear()
+
+    @property
+    def load(self):
+        """Ключ выбора узла: потоки и открываемые источники, затем CPU по последнему отчету"""
+        return len(self.streams) + len(self.pending), self.stats.get('cpu_percent', 0.0)
+
+    def stop(self):
+        """Остановка процесса (блокирующий)"""
+        if self.process is None:
+            return
+        self.send('shutdown')
+        self.alive = False
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class AudioNodePool:
+    """Аудиоузлы бота: FFmpeg, буферы, переходы, эффекты и кодирование в Opus вынесены
+    в отдельные процессы, а голосовое соединение (UDP, шифрование) остается в процессе бота.
+
+    Сервер с играющим потоком закреплен за узлом; новый поток открывается на наименее
+    загруженном живом узле. Упавший узел перезапускается при следующем выборе.
+    """
+
+    def __init__(self, size, window=25):
+        self.nodes = [AudioNodeProcess(self, index) for index in range(size)]
+        self.window = window
+        self.executable = 'ffmpeg'
+        self._ids = itertools.count(1)
+        self._loop = None
+
+    def start(self, executable='ffmpeg'):
+        """Запуск всех узлов (блокирующий, вызывать из исполнителя)"""
+        self.executable = executable
+        for node in self.nodes:
+            try:
+                node.start(executable)
+            except Exception as e:
+                logger.error("Не удалось запустить аудиоузел %s: %s", node.index, e)
+
+    def _resolve(self, future, result):
+        # Из потока чтения узла: результат передается в цикл событий
+        def resolve():
+            if not future.done():
+                future.set_result(result)
+        self._loop.call_soon_threadsafe(resolve)
+
+    def _restart_dead(self):
+        loop = asyncio.get_running_loop()
+        for node in self.nodes:
+            if not node.alive and (node._restart is None or node._restart.done()):
+                node._restart = loop.run_in_executor(None, node.start, self.executable)
+        return [node._restart for node in self.nodes if not node.alive]
+
+    async def select(self, guild_id):
+        """Узел для сервера: тот, где уже играет его поток, иначе наименее загруженный"""
+        for node in self.nodes:
+            if node.alive and any(stream.guild_id == guild_id for stream in node.streams.values()):
+                return node
+        restarts = self._restart_dead()
+        alive = [node for node in self.nodes if node.alive]
+        if not alive:
+            await asyncio.gather(*restarts, return_exceptions=True)
+            alive = [node for node in self.nodes if node.alive]
+            if not alive:
+                raise RuntimeError("Нет доступных аудиоузлов")
+        return min(alive, key=lambda node: node.load)
+
+    async def open_source(self, guild_id, song, start_at=0):
+        """Запуск FFmpeg для трека на узле и ожидание его начального буфера"""
+        self._loop = asyncio.get_running_loop()
+        node = await self.select(guild_id)
+        source_id = next(self._ids)
+        future = self._loop.create_future()
+        node.pending[source_id] = future
+        node.send('open', source_id, song['url'], start_at)
+        try:
+            ready = await asyncio.wait_for(future, AUDIO_PREROLL_TIMEOUT + HELLO_TIMEOUT)
+        except asyncio.TimeoutError:
+            ready = False
+        finally:
+            node.pending.pop(source_id, None)
+        source = RemoteSource(node, source_id)
+        if not ready:
+            source.cleanup()
+            raise RuntimeError(f"Аудиоузел {node.index} не смог открыть трек {song.get('title')}")
+        return source
+
+    def start_stream(self, guild_id, source, entry, effects, preload_seconds=0.0, crossfade_seconds=0.0,
+                     position=0.0, **callbacks):
+        """Поток сервера на узле открытого источника"""
+        stream = RemoteStream(
+            _remote(source).node, next(self._ids), guild_id, source, entry, position=position, **callbacks
+        )
+        stream.start(effects, preload_seconds, crossfade_seconds, self.window)
+        return stream
+
+    def stats(self):
+        """Сводка для !status"""
+        return [{
+            'index': node.index,
+            'pid': node.pid,
+            'alive': node.alive,
+            'opus': node.opus,
+            'streams': len(node.streams),
+            'cpu_percent': node.stats.get('cpu_percent', 0.0),
+            'rss': node.stats.get('rss', 0),
+        } for node in self.nodes]
+
+    def register_metrics(self):
+        AUDIO_NODE_STREAMS.set_function(lambda: {node.index: len(node.streams) for node in self.nodes})
+        AUDIO_NODE_CPU.set_function(lambda: {node.index: node.stats.get('cpu_percent', 0.0) for node in self.nodes})
+
+    def stop(self):
+        """Остановка всех узлов (блокирующий)"""
+        for node in self.nodes:
+            node.stop()
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import discord
+from metrics import OUTBOUND_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_WIDTH = 16  # Символов в полосе прогресса
+MIN_PROGRESS_INTERVAL = 5.0  # Чаще прогресс не обновляется: правки расходуют лимит канала
+
+
+class OutboundScheduler:
+    """Общая очередь отправки и правки сообщений бота с учетом лимитов Discord.
+
+    Лимит на отправку и правку сообщений считается по каналу (bucket channels/{id}/messages),
+    поэтому у каждого канала свой обработчик: не чаще одной операции в interval секунд.
+    Операция с тем же ключом заменяет еще не выполненную — из нескольких правок
+    одного сообщения уходит только последняя. Ответы 429 discord.py обрабатывает сам.
+    """
+
+    def __init__(self, interval=1.0, debounce=0.5):
+        self.interval = interval
+        self.debounce = debounce
+        self.pending = {}  # channel_id -> {ключ: фабрика корутины}, порядок — порядок постановки
+        self.tasks = {}
+
+    def submit(self, channel_id, key, factory):
+        """Постановка операции (factory() возвращает корутину) с объединением по ключу"""
+        operations = self.pending.setdefault(channel_id, {})
+        if key in operations:
+            OUTBOUND_MESSAGES.labels('coalesced').inc()
+            del operations[key]  # Новая версия встает в конец очереди
+        operations[key] = factory
+        if channel_id not in self.tasks:
+            self.tasks[channel_id] = asyncio.ensure_future(self._run(channel_id))
+
+    async def _run(self, channel_id):
+        try:
+            # Ожидание перед первой операцией: частые смены трека сливаются в одну правку
+            await asyncio.sleep(self.debounce)
+            operations = self.pending.get(channel_id)
+            while operations:
+                key = next(iter(operations))
+                factory = operations.pop(key)
+                try:
+                    await factory()
+                except Exception as e:
+                    logger.warning("Ошибка отправки сообщения в канал %s: %s", channel_id, e)
+                await asyncio.sleep(self.interval)
+        finally:
+            self.tasks.pop(channel_id, None)
+            self.pending.pop(channel_id, None)
+
+    async def stop(self):
+        for task in list(self.tasks.values()):
+            task.cancel()
+        self.pending.clear()
+
+
+class NowPlayingPanels:
+    """Сообщение "Сейчас играет" сервера: создается один раз и дальше правится на месте.
+
+    Смена трека, пауза и полоса прогресса ставят правку в OutboundScheduler под одним
+    ключом, поэтому быстрые пропуски дают одну правку. Прогресс обновляется не чаще
+    progress_interval (0 — без живого прогресса).
+    """
+
+    def __init__(self, player, scheduler, progress_interval=0.0):
+        self.player = player
+        self.scheduler = scheduler
+        self.progress_interval = max(progress_interval, MIN_PROGRESS_INTERVAL) if progress_interval > 0 else 0.0
+        self.panels = {}  # guild_id -> {'channel', 'message', 'song'}
+        self._progress_task = None
+
+    def show(self, ctx, song):
+        """Текущий трек сервера (новое сообщение только при первом показе или смене канала)"""
+        panel = self.panels.get(ctx.guild.id)
+        if panel is None or panel['channel'].id != ctx.channel.id:
+            panel = self.panels[ctx.guild.id] = {'channel': ctx.channel, 'message': None, 'song': song}
+        panel['song'] = song
+        self._schedule(ctx.guild.id)
+        if self.progress_interval > 0 and self._progress_task is None:
+            self._progress_task = asyncio.ensure_future(self._progress_loop())
+
+    def refresh(self, guild_id):
+        """Перерисовка панели (пауза, перемотка)"""
+        if guild_id in self.panels:
+            self._schedule(guild_id)
+
+    def close(self, guild_id, text):
+        """Последняя правка панели без кнопок; следующий трек откроет новую"""
+        panel = self.panels.pop(guild_id, None)
+        if panel is None or panel['song'] is None:
+            return
+        panel['song'] = None
+        self.scheduler.submit(panel['channel'].id, ('panel', guild_id), lambda: self._close(panel, text))
+
+    def _schedule(self, guild_id):
+        panel = self.panels[guild_id]
+        self.scheduler.submit(panel['channel'].id, ('panel', guild_id), lambda: self._render(guild_id, panel))
+
+    async def _render(self, guild_id, panel):
+        if self.panels.get(guild_id) is not panel or panel['song'] is None:
+            return
+        embed = self.render(guild_id, panel['song'])
+        view = self.player.control_layout(guild_id)
+        if panel['message'] is not None:
+            try:
+                await panel['message'].edit(content=None, embed=embed, view=view)
+                OUTBOUND_MESSAGES.labels('edit').inc()
+                return
+            except discord.NotFound:
+                panel['message'] = None  # Сообщение удалили — создаем заново
+        panel['message'] = await panel['channel'].send(embed=embed, view=view)
+        OUTBOUND_MESSAGES.labels('send').inc()
+
+    async def _close(self, panel, text):
+        if panel['message'] is None:
+            return
+        try:
+            await panel['message'].edit(content=text, embed=None, view=None)
+            OUTBOUND_MESSAGES.labels('edit').inc()
+        except discord.NotFound:
+            pass
+
+    def render(self, guild_id, song):
+        embed = discord.Embed(
+            title="🎵 Сейчас играет",
+            description=f"**{song['title']}**\n"
+                       f"Исполнитель: {song['artist']}\n"
+                       f"Длительность: {self.player.format_duration(song['duration'])}",
+            color=0x00ff00
+        )
+        if song.get('cover_url'):
+            embed.set_thumbnail(url=song['cover_url'])
+        if self.progress_interval > 0:
+            stream = self.player.streams.get(guild_id)
+            position = stream.position if stream is not None and stream.entry is song else 0
+            embed.add_field(name="Прогресс", value=self.progress_bar(position, song['duration']), inline=False)
+        footer = []
+        voice_client = self.player.get_voice_client(guild_id)
+        if voice_client and voice_client.is_paused():
+            footer.append("⏸️ Пауза")
+        repeat = self.player.repeat_mode.get(guild_id, 'off')
+        if repeat != 'off':
+            footer.append(self.player.REPEAT_MODES[repeat])
+        if footer:
+            embed.set_footer(text=" • ".join(footer))
+        return embed
+
+    def progress_bar(self, position, duration):
+        filled = int(PROGRESS_WIDTH * min(1.0, position / duration)) if duration else 0
+        bar = "▬" * filled + "🔘" + "▬" * (PROGRESS_WIDTH - filled)
+        return f"{self.player.format_duration(int(position))} {bar} {self.player.format_duration(duration)}"
+
+    async def _progress_loop(self):
+        """Периодическое обновление прогресса играющих серверов"""
+        try:
+            while self.panels:
+                await asyncio.sleep(self.progress_interval)
+                for guild_id in list(self.panels):
+                    voice_client = self.player.get_voice_client(guild_id)
+                    if voice_client and voice_client.is_playing():
+                        self._schedule(guild_id)
+        finally:
+            self._progress_task = None
+
+    async def stop(self):
+        if self._progress_task is not None:
+            self._progress_task.cancel()
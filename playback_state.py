@@ -0,0 +1,48 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Поля записи очереди, которые переживают перезапуск (requester — объект Discord, не сохраняется)
+SONG_FIELDS = (
+    'id', 'title', 'artist', 'duration', 'url', 'codec', 'bitrate', 'cover_url', 'loudness', 'true_peak', 'resolved_at'
+)
+
+
+def song_to_state(song):
+    return {field: song.get(field) for field in SONG_FIELDS if song.get(field) is not None}
+
+
+class PlaybackStateStore:
+    """Состояние воспроизведения серверов на диске: текущий трек с позицией и очередь.
+
+    Файл перезаписывается целиком через временный файл, поэтому при сбое во время
+    записи остается предыдущая версия.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """guild_id -> состояние (пустой словарь, если файла нет или он поврежден)"""
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("Не удалось прочитать состояние воспроизведения %s: %s", self.path, e)
+            return {}
+        return {int(guild_id): state for guild_id, state in data.get('guilds', {}).items()}
+
+    def save(self, guilds):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'guilds': {str(guild_id): state for guild_id, state in guilds.items()}}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error("Не удалось сохранить состояние воспроизведения %s: %s", self.path, e)
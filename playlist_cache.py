@@ -0,0 +1,77 @@
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class PlaylistSnapshot:
+    """Снимок плейлиста: список ID треков на момент определенной ревизии"""
+
+    __slots__ = ('key', 'revision', 'track_ids', 'checked_at')
+
+    def __init__(self, key, revision, track_ids):
+        self.key = key  # 'uid:kind'
+        self.revision = revision
+        self.track_ids = tuple(track_ids)
+        self.checked_at = time.monotonic()  # Когда ревизия последний раз сверялась с API
+
+    def touch(self):
+        """Отметка об успешной проверке ревизии"""
+        self.checked_at = time.monotonic()
+
+    def is_fresh(self, interval):
+        """Можно ли использовать снимок без проверки ревизии"""
+        return time.monotonic() - self.checked_at < interval
+
+
+class PlaylistCache:
+    """Кэш снимков плейлистов (по 'uid:kind' и ревизии) и результатов поиска плейлистов"""
+
+    def __init__(self, max_size=200, search_ttl=600):
+        self.max_size = max_size
+        self.search_ttl = search_ttl
+        self._snapshots = OrderedDict()  # 'uid:kind' -> PlaylistSnapshot
+        self._searches = OrderedDict()  # (запрос, limit) -> (время, список плейлистов)
+
+    def get_snapshot(self, key):
+        """Получение снимка плейлиста"""
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None:
+            self._snapshots.move_to_end(key)
+        return snapshot
+
+    def put_snapshot(self, key, revision, track_ids):
+        """Сохранение снимка плейлиста"""
+        snapshot = PlaylistSnapshot(key, revision, track_ids)
+        self._snapshots[key] = snapshot
+        self._snapshots.move_to_end(key)
+        while len(self._snapshots) > self.max_size:
+            self._snapshots.popitem(last=False)
+        return snapshot
+
+    @staticmethod
+    def _search_key(query, limit):
+        return (' '.join(query.lower().split()), limit)
+
+    def get_search(self, query, limit):
+        """Получение результатов поиска плейлистов (None, если нет или устарели)"""
+        key = self._search_key(query, limit)
+        entry = self._searches.get(key)
+        if entry is None:
+            return None
+
+        added_at, playlists = entry
+        if time.monotonic() - added_at > self.search_ttl:
+            del self._searches[key]
+            return None
+
+        self._searches.move_to_end(key)
+        return playlists
+
+    def put_search(self, query, limit, playlists):
+        """Сохранение результатов поиска плейлистов"""
+        key = self._search_key(query, limit)
+        self._searches[key] = (time.monotonic(), playlists)
+        self._searches.move_to_end(key)
+        while len(self._searches) > self.max_size:
+            self._searches.popitem(last=False)
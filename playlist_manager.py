@@ -1,13 +1,22 @@
 import asyncio
 import random
 import logging
+from collections import deque
 from yandex_client import YandexMusicClient
+from liked_index import LikedTracksStore
+from playlist_cache import PlaylistCache
+from config import (
+    LIKED_SYNC_INTERVAL, PLAYLIST_PAGE_SIZE, PLAYLIST_PARALLEL_PAGES,
+    PLAYLIST_CACHE_SIZE, PLAYLIST_SEARCH_TTL, PLAYLIST_REVISION_CHECK_INTERVAL
+)
 
 logger = logging.getLogger(__name__)
 
 class PlaylistManager:
     def __init__(self, yandex_client: YandexMusicClient):
         self.yandex_client = yandex_client
+        self.liked_store = LikedTracksStore(yandex_client, LIKED_SYNC_INTERVAL)  # Индекс лайкнутых треков
+        self.playlist_cache = PlaylistCache(PLAYLIST_CACHE_SIZE, PLAYLIST_SEARCH_TTL)  # Снимки плейлистов и поиск
     
     async def get_playlist_tracks(self, playlist_id, limit=20):
         """Получение треков из плейлиста"""
@@ -16,94 +25,52 @@ class PlaylistManager:
             return []
         
         try:
-            logger.info(f"Получаем треки из плейлиста {playlist_id}...")
+            logger.info("Получаем треки из плейлиста %s...", playlist_id)
             
             # Пробуем разные способы получения треков из плейлиста
             tracks = []
             
             # Способ 0: Для плейлиста "Мне нравится" сначала пробуем users_likes_tracks
-            logger.info(f"Проверяем условие для способа 0: playlist_id='{playlist_id}'")
+            logger.debug("Проверяем условие для способа 0: playlist_id='%s'", playlist_id)
             should_use_likes = ('нравится' in playlist_id.lower() or 'liked' in playlist_id.lower() or 
                                '131840276:3' in playlist_id or 'Мне нравится' in playlist_id)
-            logger.info(f"Условие для users_likes_tracks: {should_use_likes}")
+            logger.debug("Условие для users_likes_tracks: %s", should_use_likes)
             
             if should_use_likes:
                 try:
-                    logger.info("Пробуем получить лайкнутые треки (приоритетный способ)...")
-                    liked_tracks = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        self.yandex_client.client.users_likes_tracks
-                    )
+                    logger.info("Пробуем получить лайкнутые треки из локального индекса (приоритетный способ)...")
+                    tracks = await self.liked_store.sample_tracks(limit)
                     
-                    if liked_tracks and hasattr(liked_tracks, 'tracks') and liked_tracks.tracks:
-                        total = len(liked_tracks.tracks)
-                        logger.info(f"Найдено лайкнутых треков: {total}")
-
-                        # Собираем все ID, затем выбираем случайные
-                        all_ids = []
-                        for track_short in liked_tracks.tracks:
-                            if hasattr(track_short, 'id') and track_short.id:
-                                all_ids.append(track_short.id)
-                            elif isinstance(track_short, dict) and track_short.get('id'):
-                                all_ids.append(track_short['id'])
-
-                        if all_ids:
-                            sample_size = min(limit, len(all_ids))
-                            track_ids = random.sample(all_ids, sample_size)
-                            logger.info(f"Случайно выбрано {len(track_ids)} треков для загрузки")
-                            
-                            # Загружаем полную информацию о треках
-                            logger.info("Загружаем полную информацию о выбранных треках...")
-                            try:
-                                # Используем tracks API напрямую
-                                full_tracks = await asyncio.get_event_loop().run_in_executor(
-                                    None,
-                                    self.yandex_client.client.tracks,
-                                    track_ids
-                                )
-                                
-                                logger.info(f"Загружено треков: {len(full_tracks) if full_tracks else 0}")
-                                
-                                if full_tracks:
-                                    for track in full_tracks:
-                                        if track:
-                                            track_info = {
-                                                'id': track.id,
-                                                'title': track.title,
-                                                'artist': ', '.join([artist.name for artist in track.artists]),
-                                                'duration': track.duration_ms // 1000,
-                                                'album': track.albums[0].title if track.albums else 'Неизвестный альбом',
-                                                'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None
-                                            }
-                                            tracks.append(track_info)
-                                    
-                                    if tracks:
-                                        logger.info(f"Готово треков: {len(tracks)} (liked random)")
-                                        return tracks
-                                    else:
-                                        logger.warning("Не удалось обработать загруженные треки")
-                                else:
-                                    logger.warning("Не удалось загрузить полную информацию о треках")
-                                    
-                            except Exception as fetch_error:
-                                logger.error(f"Ошибка загрузки треков: {fetch_error}")
-                        else:
-                            logger.warning("Не найдены ID лайкнутых треков")
+                    if tracks:
+                        logger.info("Готово треков: %s (liked random)", len(tracks))
+                        return tracks
                     else:
-                        logger.warning("liked_tracks пуст или не содержит tracks")
+                        logger.warning("Индекс лайков пуст или не удалось загрузить треки")
                             
                 except Exception as e0:
-                    logger.error(f"Способ 0 (users_likes_tracks приоритетный) не сработал: {e0}")
+                    logger.error("Способ 0 (индекс лайков) не сработал: %s", e0)
                     import traceback
-                    logger.error(f"Traceback: {traceback.format_exc()}")
+                    logger.error("Traceback: %s", traceback.format_exc())
             else:
-                logger.info("Условие для users_likes_tracks не выполнено, пропускаем способ 0")
+                logger.debug("Условие для users_likes_tracks не выполнено, пропускаем способ 0")
+            
+            # Быстрый путь: ID вида 'uid:kind' — снимок плейлиста из кэша (сверка ревизии) и метаданные через кэш треков
+            parsed = self._parse_playlist_id(playlist_id)
+            if parsed:
+                try:
+                    track_ids = await self.get_playlist_track_ids(*parsed)
+                    if track_ids:
+                        tracks = await self.yandex_client.get_tracks_info(track_ids[:limit])
+                        if tracks:
+                            logger.info("Получено %s треков из снимка плейлиста", len(tracks))
+                            return tracks
+                except Exception as e_snapshot:
+                    logger.warning("Снимок плейлиста не сработал: %s", e_snapshot)
             
             # Способ 1: Через users_playlists с kind='3'
             try:
-                playlist = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.yandex_client.client.users_playlists,
+                playlist = await self.yandex_client.call_api(
+                    'users_playlists',
                     '3',  # kind для пользовательских плейлистов
                     playlist_id
                 )
@@ -124,50 +91,35 @@ class PlaylistManager:
                             tracks.append(track_info)
                     
                     if tracks:
-                        logger.info(f"Получено {len(tracks)} треков способом 1")
+                        logger.info("Получено %s треков способом 1", len(tracks))
                         return tracks
                         
             except Exception as e1:
-                logger.warning(f"Способ 1 не сработал: {e1}")
+                logger.warning("Способ 1 не сработал: %s", e1)
             
             # Способ 2: Для плейлиста "Мне нравится" используем users_likes_tracks
             # Проверяем по ID или названию плейлиста
             if ('нравится' in playlist_id.lower() or 'liked' in playlist_id.lower() or 
                 '131840276:3' in playlist_id or 'Мне нравится' in playlist_id):
                 try:
-                    logger.info("Пробуем получить треки через users_likes_tracks...")
-                    liked_tracks = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        self.yandex_client.client.users_likes_tracks
-                    )
+                    logger.info("Пробуем получить треки через индекс лайков...")
+                    index = await self.liked_store.sync(force=True)
                     
-                    if liked_tracks and hasattr(liked_tracks, 'tracks') and liked_tracks.tracks:
-                        for track_short in liked_tracks.tracks[:limit]:
-                            if track_short.track:
-                                track = track_short.track
-                                track_info = {
-                                    'id': track.id,
-                                    'title': track.title,
-                                    'artist': ', '.join([artist.name for artist in track.artists]),
-                                    'duration': track.duration_ms // 1000,
-                                    'album': track.albums[0].title if track.albums else 'Неизвестный альбом',
-                                    'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None
-                                }
-                                tracks.append(track_info)
+                    if index and len(index):
+                        tracks = await self.yandex_client.get_tracks_info(index.head(limit))
                         
                         if tracks:
-                            logger.info(f"Получено {len(tracks)} треков через users_likes_tracks")
+                            logger.info("Получено %s треков через индекс лайков", len(tracks))
                             return tracks
                             
                 except Exception as e2:
-                    logger.warning(f"Способ 2 (users_likes_tracks) не сработал: {e2}")
+                    logger.warning("Способ 2 (индекс лайков) не сработал: %s", e2)
             
             # Способ 3: Пробуем получить плейлист без kind
             try:
                 logger.info("Пробуем получить плейлист без kind...")
-                playlist = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.yandex_client.client.users_playlists,
+                playlist = await self.yandex_client.call_api(
+                    'users_playlists',
                     playlist_id
                 )
                 
@@ -186,18 +138,17 @@ class PlaylistManager:
                             tracks.append(track_info)
                     
                     if tracks:
-                        logger.info(f"Получено {len(tracks)} треков способом 3")
+                        logger.info("Получено %s треков способом 3", len(tracks))
                         return tracks
                         
             except Exception as e3:
-                logger.warning(f"Способ 3 не сработал: {e3}")
+                logger.warning("Способ 3 не сработал: %s", e3)
             
             # Способ 4: Пробуем получить плейлист с kind=3 (число)
             try:
                 logger.info("Пробуем получить плейлист с kind=3...")
-                playlist = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.yandex_client.client.users_playlists,
+                playlist = await self.yandex_client.call_api(
+                    'users_playlists',
                     3,  # kind как число
                     playlist_id
                 )
@@ -217,11 +168,11 @@ class PlaylistManager:
                             tracks.append(track_info)
                     
                     if tracks:
-                        logger.info(f"Получено {len(tracks)} треков способом 4")
+                        logger.info("Получено %s треков способом 4", len(tracks))
                         return tracks
                         
             except Exception as e4:
-                logger.warning(f"Способ 4 не сработал: {e4}")
+                logger.warning("Способ 4 не сработал: %s", e4)
             
             # Способ 5: Попробуем получить плейлист через tracks API
             try:
@@ -229,12 +180,11 @@ class PlaylistManager:
                 # Парсим ID плейлиста
                 if ':' in playlist_id:
                     user_id, playlist_kind = playlist_id.split(':')
-                    logger.info(f"Парсинг ID: user_id={user_id}, kind={playlist_kind}")
+                    logger.info("Парсинг ID: user_id=%s, kind=%s", user_id, playlist_kind)
                     
                     # Пробуем получить треки через tracks API
-                    track_ids = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        self.yandex_client.client.users_playlists,
+                    track_ids = await self.yandex_client.call_api(
+                        'users_playlists',
                         user_id,
                         playlist_id
                     )
@@ -243,9 +193,8 @@ class PlaylistManager:
                         # Получаем информацию о треках
                         track_id_list = [track_short.track.id for track_short in track_ids.tracks[:limit] if track_short.track]
                         if track_id_list:
-                            tracks_info = await asyncio.get_event_loop().run_in_executor(
-                                None,
-                                self.yandex_client.client.tracks,
+                            tracks_info = await self.yandex_client.call_api(
+                                'tracks',
                                 track_id_list
                             )
                             
@@ -263,17 +212,17 @@ class PlaylistManager:
                                         tracks.append(track_info)
                                 
                                 if tracks:
-                                    logger.info(f"Получено {len(tracks)} треков способом 5")
+                                    logger.info("Получено %s треков способом 5", len(tracks))
                                     return tracks
                                     
             except Exception as e5:
-                logger.warning(f"Способ 5 не сработал: {e5}")
+                logger.warning("Способ 5 не сработал: %s", e5)
             
             logger.warning("Все способы получения треков из плейлиста не сработали")
             return []
                 
         except Exception as e:
-            logger.error(f"Общая ошибка получения плейлиста: {e}")
+            logger.error("Общая ошибка получения плейлиста: %s", e)
             
         return []
     
@@ -291,7 +240,7 @@ class PlaylistManager:
                     uid = parts.split("/playlists/")[0].split("?")[0].split("/")[0]
                     kind = parts.split("/playlists/")[-1].split("?")[0].split("/")[0]
                     playlist_id = f"{uid}:{kind}"
-                    logger.info(f"Распознан плейлист по URL: {playlist_id}")
+                    logger.info("Распознан плейлист по URL: %s", playlist_id)
                     # Возвращаем псевдо-список с одним плейлистом
                     return [{
                         'id': playlist_id,
@@ -301,12 +250,16 @@ class PlaylistManager:
                         'owner': uid
                     }]
                 except Exception as parse_err:
-                    logger.warning(f"Не удалось распарсить URL плейлиста: {parse_err}")
+                    logger.warning("Не удалось распарсить URL плейлиста: %s", parse_err)
                     # продолжим обычным поиском как fallback
             
-            search_result = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.yandex_client.client.search,
+            cached = self.playlist_cache.get_search(query, limit)
+            if cached is not None:
+                logger.info("Результаты поиска плейлистов взяты из кэша: %s", query)
+                return cached
+            
+            search_result = await self.yandex_client.call_api(
+                'search',
                 query,
                 'playlist',
                 limit
@@ -325,80 +278,197 @@ class PlaylistManager:
                         }
                         playlists.append(playlist_info)
             
+            if playlists:
+                self.playlist_cache.put_search(query, limit, playlists)
             return playlists
         except Exception as e:
-            logger.error(f"Ошибка поиска плейлистов: {e}")
+            logger.error("Ошибка поиска плейлистов: %s", e)
             return []
 
-    async def get_album_tracks(self, album_id, limit=50):
-        """Получение треков из альбома по ID"""
+    @staticmethod
+    def _parse_playlist_id(playlist_id):
+        """Разбор ID плейлиста вида 'uid:kind'; возвращает (uid, kind) или None"""
+        if not isinstance(playlist_id, str) or playlist_id.count(':') != 1:
+            return None
+        uid, kind = playlist_id.split(':')
+        if not uid or not kind.isdigit():
+            return None
+        return uid, kind
+    
+    async def _fetch_playlist_track_ids(self, uid, kind):
+        """Загрузка списка ID треков плейлиста без метаданных (rich-tracks=false); возвращает (ID, ревизия)"""
+        playlist = await self.yandex_client.call_api('users_playlists', kind, uid, {'rich-tracks': 'false'})
+        if not playlist:
+            return [], None
+        track_ids = [track_short.track_id for track_short in (playlist.tracks or []) if getattr(track_short, 'id', None)]
+        return track_ids, getattr(playlist, 'revision', None)
+    
+    async def _fetch_playlist_revision(self, key):
+        """Легкий запрос ревизии плейлиста (playlists_list не возвращает треки)"""
+        playlists = await self.yandex_client.call_api(
+            'playlists_list',
+            [key]
+        )
+        if playlists and playlists[0]:
+            return getattr(playlists[0], 'revision', None)
+        return None
+    
+    async def get_playlist_track_ids(self, uid, kind):
+        """Получение ID треков плейлиста через кэш снимков с проверкой ревизии"""
+        key = f"{uid}:{kind}"
+        snapshot = self.playlist_cache.get_snapshot(key)
+        
+        if snapshot is not None:
+            if snapshot.is_fresh(PLAYLIST_REVISION_CHECK_INTERVAL):
+                return list(snapshot.track_ids)
+            
+            try:
+                revision = await self._fetch_playlist_revision(key)
+            except Exception as e:
+                logger.warning("Не удалось проверить ревизию плейлиста %s: %s", key, e)
+                revision = None
+            
+            if revision is not None and revision == snapshot.revision:
+                snapshot.touch()
+                logger.info("Плейлист %s не изменился (ревизия %s), используем снимок", key, revision)
+                return list(snapshot.track_ids)
+        
+        track_ids, revision = await self._fetch_playlist_track_ids(uid, kind)
+        if track_ids:
+            self.playlist_cache.put_snapshot(key, revision, track_ids)
+            logger.info("Снимок плейлиста %s обновлен: %s треков, ревизия %s", key, len(track_ids), revision)
+        return track_ids
+    
+    async def _iter_hydrated_pages(self, track_ids, page_size):
+        """Загрузка метаданных по страницам: несколько запросов tracks() идут параллельно, страницы отдаются по порядку"""
+        pages = [track_ids[i:i + page_size] for i in range(0, len(track_ids), page_size)]
+        pending = deque()
+        next_page = 0
+        try:
+            while next_page < len(pages) or pending:
+                while next_page < len(pages) and len(pending) < PLAYLIST_PARALLEL_PAGES:
+                    pending.append(asyncio.ensure_future(self.yandex_client.get_tracks_info(pages[next_page])))
+                    next_page += 1
+                page = await pending.popleft()
+                if page:
+                    yield page
+        finally:
+            # Потребитель мог прекратить итерацию раньше — отменяем уже запущенные запросы
+            for task in pending:
+                task.cancel()
+    
+    async def iter_playlist_tracks(self, playlist_id, limit=None, page_size=PLAYLIST_PAGE_SIZE, shuffle=False):
+        """Постраничная загрузка треков плейлиста (асинхронный генератор списков track_info)"""
         if not self.yandex_client.is_authenticated:
             logger.error("Клиент не авторизован")
-            return []
-        try:
-            logger.info(f"Получаем треки из альбома {album_id}...")
-            # Приводим ID к числу, если возможно
-            parsed_id = None
-            try:
-                parsed_id = int(str(album_id).strip())
-            except Exception:
-                parsed_id = album_id
-
-            # Основная попытка: одиночный ID
+            return
+        
+        parsed = self._parse_playlist_id(playlist_id)
+        track_ids = []
+        if parsed:
             try:
-                albums_res = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.yandex_client.client.albums_with_tracks,
-                    parsed_id
-                )
-            except Exception as primary_err:
-                logger.warning(f"albums_with_tracks с одиночным ID не сработал: {primary_err}")
-                # Резерв: список ID
-                albums_res = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.yandex_client.client.albums_with_tracks,
-                    [parsed_id]
-                )
+                track_ids = await self.get_playlist_track_ids(*parsed)
+            except Exception as e:
+                logger.warning("Не удалось загрузить ID треков плейлиста %s: %s", playlist_id, e)
+        
+        if not track_ids:
+            # Нестандартный ID ("Мне нравится", название и т.п.) — используем старую загрузку одной страницей
+            tracks = await self.get_playlist_tracks(playlist_id, limit or 50)
+            if shuffle:
+                random.shuffle(tracks)
+            if tracks:
+                yield tracks
+            return
+        
+        if shuffle:
+            track_ids = random.sample(track_ids, min(limit or len(track_ids), len(track_ids)))
+        elif limit:
+            track_ids = track_ids[:limit]
+        
+        logger.info("Плейлист %s: %s треков, страницы по %s", playlist_id, len(track_ids), page_size)
+        async for page in self._iter_hydrated_pages(track_ids, page_size):
+            yield page
+    
+    async def _fetch_album(self, album_id):
+        """Загрузка альбома вместе с треками"""
+        # Приводим ID к числу, если возможно
+        parsed_id = None
+        try:
+            parsed_id = int(str(album_id).strip())
+        except Exception:
+            parsed_id = album_id
 
-            if not albums_res:
-                return []
+        # Основная попытка: одиночный ID
+        try:
+            albums_res = await self.yandex_client.call_api(
+                'albums_with_tracks',
+                parsed_id
+            )
+        except Exception as primary_err:
+            logger.warning("albums_with_tracks с одиночным ID не сработал: %s", primary_err)
+            # Резерв: список ID
+            albums_res = await self.yandex_client.call_api(
+                'albums_with_tracks',
+                [parsed_id]
+            )
 
-            # Нормализуем ответ: может быть одним объектом Album или списком
-            if hasattr(albums_res, 'volumes'):
-                album = albums_res
-            elif hasattr(albums_res, '__iter__') and not isinstance(albums_res, (str, bytes)):
-                album = list(albums_res)[0]
-            else:
-                album = albums_res
+        if not albums_res:
+            return None
 
-            # album.volumes — список дисков (каждый — список треков)
-            volumes = getattr(album, 'volumes', []) or []
-            tracks = []
-            for disk in volumes:
-                for track in disk:
-                    if len(tracks) >= limit:
-                        break
-                    if not track:
-                        continue
-                    track_info = {
-                        'id': track.id,
-                        'title': track.title,
-                        'artist': ', '.join([a.name for a in (getattr(track, 'artists', None) or [])]) if getattr(track, 'artists', None) else 'Неизвестный исполнитель',
-                        'duration': (getattr(track, 'duration_ms', 0) or 0) // 1000,
-                        'album': getattr(album, 'title', 'Альбом'),
-                        'cover_url': (
-                            f"https://{getattr(getattr(album, 'cover', None), 'uri', '').replace('%%', '200x200')}"
-                            if getattr(getattr(album, 'cover', None), 'uri', None)
-                            else None
-                        )
-                    }
-                    tracks.append(track_info)
-                if len(tracks) >= limit:
-                    break
-            logger.info(f"Получено {len(tracks)} треков из альбома")
+        # Нормализуем ответ: может быть одним объектом Album или списком
+        if hasattr(albums_res, 'volumes'):
+            return albums_res
+        elif hasattr(albums_res, '__iter__') and not isinstance(albums_res, (str, bytes)):
+            return list(albums_res)[0]
+        return albums_res
+    
+    async def iter_album_tracks(self, album_id, limit=None, page_size=PLAYLIST_PAGE_SIZE, shuffle=False):
+        """Постраничная выдача треков альбома (асинхронный генератор списков track_info)"""
+        if not self.yandex_client.is_authenticated:
+            logger.error("Клиент не авторизован")
+            return
+        
+        logger.info("Получаем треки из альбома %s...", album_id)
+        album = await self._fetch_album(album_id)
+        if not album:
+            return
+        
+        # album.volumes — список дисков (каждый — список треков)
+        album_tracks = [track for disk in (getattr(album, 'volumes', []) or []) for track in disk if track]
+        if shuffle:
+            random.shuffle(album_tracks)
+        if limit:
+            album_tracks = album_tracks[:limit]
+        
+        cover_uri = getattr(getattr(album, 'cover', None), 'uri', None)
+        page = []
+        for track in album_tracks:
+            track_info = {
+                'id': track.id,
+                'title': track.title,
+                'artist': ', '.join([a.name for a in (getattr(track, 'artists', None) or [])]) if getattr(track, 'artists', None) else 'Неизвестный исполнитель',
+                'duration': (getattr(track, 'duration_ms', 0) or 0) // 1000,
+                'album': getattr(album, 'title', 'Альбом'),
+                'cover_url': f"https://{cover_uri.replace('%%', '200x200')}" if cover_uri else None
+            }
+            self.yandex_client.track_cache.put(track_info)
+            page.append(track_info)
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+    
+    async def get_album_tracks(self, album_id, limit=50):
+        """Получение треков из альбома по ID"""
+        tracks = []
+        try:
+            async for page in self.iter_album_tracks(album_id, limit=limit):
+                tracks.extend(page)
+            logger.info("Получено %s треков из альбома", len(tracks))
             return tracks
         except Exception as e:
-            logger.error(f"Ошибка получения альбома: {e}")
+            logger.error("Ошибка получения альбома: %s", e)
             return []
     
     async def get_liked_tracks(self, limit=20):
@@ -408,33 +478,15 @@ class PlaylistManager:
             return []
         
         try:
-            # Сначала пробуем получить треки через API лайков
+            # Сначала пробуем получить треки через локальный индекс лайков (последние limit, по порядку)
             try:
-                liked_tracks = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.yandex_client.client.users_likes_tracks
-                )
-                
-                tracks = []
-                if liked_tracks and hasattr(liked_tracks, 'tracks') and liked_tracks.tracks:
-                    for track_short in liked_tracks.tracks[:limit]:
-                        if track_short.track:
-                            track = track_short.track
-                            track_info = {
-                                'id': track.id,
-                                'title': track.title,
-                                'artist': ', '.join([artist.name for artist in track.artists]),
-                                'duration': track.duration_ms // 1000,
-                                'album': track.albums[0].title if track.albums else 'Неизвестный альбом',
-                                'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None
-                            }
-                            tracks.append(track_info)
+                tracks = await self.liked_store.head_tracks(limit)
                 
                 if tracks:
-                    logger.info(f"Получено {len(tracks)} треков через API лайков")
+                    logger.info("Получено %s треков через индекс лайков", len(tracks))
                     return tracks
             except Exception as e:
-                logger.warning(f"API лайков не сработал: {e}")
+                logger.warning("Индекс лайков не сработал: %s", e)
             
             # Если API лайков не сработал, ищем плейлист "Мне нравится"
             logger.info("Ищем плейлист 'Мне нравится'...")
@@ -448,14 +500,14 @@ class PlaylistManager:
                     playlist_title = playlist.get('title', '').lower()
                     if 'нравится' in playlist_title or 'liked' in playlist_title or 'favorites' in playlist_title:
                         liked_playlist_id = playlist.get('id')
-                        logger.info(f"Найден плейлист 'Мне нравится': {playlist.get('title')} (ID: {liked_playlist_id})")
+                        logger.info("Найден плейлист 'Мне нравится': %s (ID: %s)", playlist.get('title'), liked_playlist_id)
                         break
             
             if liked_playlist_id:
                 # Получаем треки из плейлиста "Мне нравится"
                 tracks = await self.get_playlist_tracks(liked_playlist_id, limit)
                 if tracks:
-                    logger.info(f"Получено {len(tracks)} треков из плейлиста 'Мне нравится'")
+                    logger.info("Получено %s треков из плейлиста 'Мне нравится'", len(tracks))
                     return tracks
             
             # Если не нашли плейлист "Мне нравится", пробуем другие варианты
@@ -467,16 +519,16 @@ class PlaylistManager:
                     playlist_title = playlist.get('title', '').lower()
                     if any(keyword in playlist_title for keyword in ['избранное', 'favorite', 'like', 'любимое']):
                         liked_playlist_id = playlist.get('id')
-                        logger.info(f"Найден альтернативный плейлист: {playlist.get('title')} (ID: {liked_playlist_id})")
+                        logger.info("Найден альтернативный плейлист: %s (ID: %s)", playlist.get('title'), liked_playlist_id)
                         tracks = await self.get_playlist_tracks(liked_playlist_id, limit)
                         if tracks:
-                            logger.info(f"Получено {len(tracks)} треков из альтернативного плейлиста")
+                            logger.info("Получено %s треков из альтернативного плейлиста", len(tracks))
                             return tracks
             
             logger.warning("Не удалось найти плейлист с лайкнутыми треками")
             return []
                 
         except Exception as e:
-            logger.error(f"Ошибка получения лайкнутых треков: {e}")
+            logger.error("Ошибка получения лайкнутых треков: %s", e)
             
         return []
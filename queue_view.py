@@ -0,0 +1,115 @@
+import logging
+import discord
+from discord.ui import View, Button
+from metrics import QUEUE_PAGES
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 10
+
+
+class QueuePages:
+    """Страницы очереди сервера для !queue и кнопки "Очередь".
+
+    Текст страницы строится по срезу очереди (без копирования) и хранится до изменения
+    очереди: ключ — версия очереди, подготовленный к переходу трек и текущий трек.
+    """
+
+    def __init__(self, player, page_size=PAGE_SIZE):
+        self.player = player
+        self.page_size = page_size
+        self.cache = {}  # guild_id -> {'key': ключ состояния, 'pages': {номер: текст}}
+
+    def _key(self, guild_id):
+        stream = self.player.streams.get(guild_id)
+        prepared = stream.next_entry if stream is not None else None
+        return self.player.get_queue(guild_id).version, prepared, self.player.current_song.get(guild_id)
+
+    def page_count(self, guild_id):
+        return max(1, -(-self.player.upcoming_count(guild_id) // self.page_size))
+
+    def text(self, guild_id, page):
+        key = self._key(guild_id)
+        cached = self.cache.get(guild_id)
+        # Записи сравниваются по идентичности: одинаковые треки в очереди — разные словари
+        if cached is None or cached['key'][0] != key[0] or cached['key'][1] is not key[1] or cached['key'][2] is not key[2]:
+            cached = self.cache[guild_id] = {'key': key, 'pages': {}}
+        text = cached['pages'].get(page)
+        if text is not None:
+            QUEUE_PAGES.labels('hit').inc()
+            return text
+        QUEUE_PAGES.labels('render').inc()
+        start = page * self.page_size
+        text = "\n".join(
+            f"{number}. **{song['title']}** - {song['artist']}"
+            for number, song in enumerate(self.player.upcoming(guild_id, start, start + self.page_size), start + 1)
+        )
+        cached['pages'][page] = text
+        return text
+
+    def embed(self, guild_id, page=0):
+        """Embed страницы (номер страницы приводится к допустимому)"""
+        pages = self.page_count(guild_id)
+        page = max(0, min(page, pages - 1))
+        embed = discord.Embed(title="📋 Очередь воспроизведения", color=0x00ff00)
+        current = self.player.current_song.get(guild_id)
+        if current:
+            embed.add_field(name="🎵 Сейчас играет", value=f"**{current['title']}**\n{current['artist']}", inline=False)
+        total = self.player.upcoming_count(guild_id)
+        if total:
+            embed.add_field(name=f"📋 В очереди ({total} треков)", value=self.text(guild_id, page), inline=False)
+        if pages > 1:
+            embed.set_footer(text=f"Страница {page + 1}/{pages}")
+        return embed
+
+    def forget(self, guild_id):
+        self.cache.pop(guild_id, None)
+
+
+class QueuePagerView(View):
+    """Кнопки листания очереди под одним сообщением !queue"""
+
+    def __init__(self, pages, guild_id, page=0):
+        super().__init__(timeout=120)
+        self.pages = pages
+        self.guild_id = guild_id
+        self.page = page
+        self.message = None  # Сообщение с кнопками: при истечении таймаута кнопки отключаются
+        self.previous_button = Button(style=discord.ButtonStyle.secondary, emoji="◀️")
+        self.previous_button.callback = self.previous_callback
+        self.add_item(self.previous_button)
+        self.next_button = Button(style=discord.ButtonStyle.secondary, emoji="▶️")
+        self.next_button.callback = self.next_callback
+        self.add_item(self.next_button)
+        self._update_buttons()
+
+    def _update_buttons(self):
+        pages = self.pages.page_count(self.guild_id)
+        self.page = max(0, min(self.page, pages - 1))
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= pages - 1
+
+    async def _turn(self, interaction, step):
+        try:
+            self.page += step
+            self._update_buttons()
+            await interaction.response.edit_message(embed=self.pages.embed(self.guild_id, self.page), view=self)
+        except Exception as e:
+            logger.error("Ошибка листания очереди: %s", e)
+            if not interaction.response.is_done():
+                await interaction.response.send_message("❌ Произошла ошибка!", ephemeral=True)
+
+    async def on_timeout(self):
+        self.previous_button.disabled = True
+        self.next_button.disabled = True
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException as e:
+                logger.debug("Не удалось отключить кнопки очереди: %s", e)
+
+    async def previous_callback(self, interaction):
+        await self._turn(interaction, -1)
+
+    async def next_callback(self, interaction):
+        await self._turn(interaction, 1)
@@ -0,0 +1,47 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# discord.py кодирует голос в Opus 128 кбит/с независимо от настроек канала
+OPUS_BITRATE_KBPS = 128
+
+
+def target_bitrate(quality, channel_bitrate=None, headroom=1.5):
+    """Минимальный битрейт источника (кбит/с), при котором перекодирование в Opus не теряет качество.
+
+    quality: 'auto' — по битрейту голосового канала, 'max' — лучший вариант (None), число — кбит/с.
+    """
+    if quality == 'max':
+        return None
+    if quality != 'auto':
+        try:
+            return float(quality)
+        except ValueError:
+            logger.warning("Неизвестное значение STREAM_QUALITY=%s, используется auto", quality)
+    channel_kbps = (channel_bitrate or 64000) / 1000
+    return min(channel_kbps, OPUS_BITRATE_KBPS) * headroom
+
+
+def select_download_info(download_info, target_kbps=None, codecs=('aac', 'mp3')):
+    """Выбор варианта загрузки трека.
+
+    Из вариантов не ниже target_kbps берется самый дешевый: сначала по порядку кодеков
+    в codecs (AAC меньше весит и быстрее декодируется при том же качестве), затем по битрейту.
+    Если подходящего нет или target_kbps не задан — лучший по битрейту.
+    """
+    variants = [info for info in download_info if not getattr(info, 'preview', False)] or list(download_info)
+    if not variants:
+        return None
+
+    def codec_rank(info):
+        codec = (getattr(info, 'codec', None) or '').lower()
+        return codecs.index(codec) if codec in codecs else len(codecs)
+
+    def bitrate(info):
+        return getattr(info, 'bitrate_in_kbps', 0) or 0
+
+    if target_kbps is not None:
+        suitable = [info for info in variants if bitrate(info) >= target_kbps]
+        if suitable:
+            return min(suitable, key=lambda info: (codec_rank(info), bitrate(info)))
+    return max(variants, key=lambda info: (bitrate(info), -codec_rank(info)))
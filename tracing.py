@@ -0,0 +1,258 @@
+import json
+import time
+import queue
+import random
+import logging
+import functools
+import threading
+import contextvars
+import inspect
+from collections import deque
+from contextlib import contextmanager
+from config import TRACE_ENABLED, TRACE_HISTORY, TRACE_FILE, TRACE_OTLP_ENDPOINT
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """Отрезок времени выполнения операции внутри трассы"""
+
+    __slots__ = (
+        'name', 'trace_id', 'span_id', 'parent', 'children', 'attributes',
+        'start', 'end', 'start_ns', 'error', '_token'
+    )
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else random.getrandbits(64)
+        self.span_id = random.getrandbits(64)
+        self.children = []
+        self.attributes = dict(attributes or {})
+        self.start = time.perf_counter()
+        self.start_ns = time.time_ns()
+        self.end = None
+        self.error = None
+        self._token = None
+        if parent is not None:
+            parent.children.append(self)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def duration(self):
+        """Длительность в секундах (для незавершенного отрезка — до текущего момента)"""
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def walk(self, depth=0):
+        """Обход дерева отрезков в порядке начала"""
+        yield depth, self
+        for child in sorted(self.children, key=lambda span: span.start):
+            yield from child.walk(depth + 1)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': f'{self.trace_id:016x}',
+            'span_id': f'{self.span_id:016x}',
+            'parent_id': f'{self.parent.span_id:016x}' if self.parent else None,
+            'start_ns': self.start_ns,
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': {key: str(value) for key, value in self.attributes.items()},
+            'error': self.error,
+        }
+
+
+class FileExporter:
+    """Запись завершенных трасс в файл JSON Lines из отдельного потока"""
+
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+
+    def export(self, root):
+        self._queue.put([span.to_dict() for _, span in root.walk()])
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            try:
+                with open(self.path, 'a', encoding='utf-8') as file:
+                    for span in spans:
+                        file.write(json.dumps(span, ensure_ascii=False) + '\n')
+            except OSError as e:
+                logger.warning("Не удалось записать трассу в %s: %s", self.path, e)
+
+
+class OpenTelemetryExporter:
+    """Передача трасс в OpenTelemetry-коллектор (нужен пакет opentelemetry-exporter-otlp)"""
+
+    def __init__(self, endpoint):
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        provider = TracerProvider(resource=Resource.create({'service.name': 'yandex-music-bot'}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        self._trace = trace
+        self._tracer = provider.get_tracer(__name__)
+
+    def export(self, root):
+        self._export_span(root, None)
+
+    def _export_span(self, span, parent_context):
+        otel_span = self._tracer.start_span(
+            span.name,
+            context=parent_context,
+            start_time=span.start_ns,
+            attributes={key: str(value) for key, value in span.attributes.items()},
+        )
+        if span.error:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        context = self._trace.set_span_in_context(otel_span)
+        for child in span.children:
+            self._export_span(child, context)
+        otel_span.end(end_time=span.start_ns + int(span.duration * 1e9))
+
+
+class Tracer:
+    """Создание отрезков и хранение последних завершенных трасс"""
+
+    def __init__(self, enabled=True, history=50):
+        self.enabled = enabled
+        self.recent = deque(maxlen=history)  # Последние завершенные корневые отрезки
+        self.exporters = []
+
+    def start_span(self, name, **attributes):
+        """Начало отрезка; он становится текущим для вложенных вызовов"""
+        if not self.enabled:
+            return None
+        span = Span(name, _current_span.get(), attributes)
+        span._token = _current_span.set(span)
+        return span
+
+    def finish_span(self, span, error=None):
+        """Завершение отрезка (повторный вызов ничего не делает)"""
+        if span is None or span.end is not None:
+            return
+        span.end = time.perf_counter()
+        if error is not None:
+            span.error = f'{type(error).__name__}: {error}'
+        try:
+            _current_span.reset(span._token)
+        except ValueError:
+            # Отрезок завершается в другом контексте (например, в обработчике ошибок)
+            pass
+        if span.parent is None:
+            self.recent.append(span)
+            for exporter in self.exporters:
+                try:
+                    exporter.export(span)
+                except Exception as e:
+                    logger.warning("Ошибка экспорта трассы: %s", e)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Контекстный менеджер отрезка"""
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.finish_span(span, e)
+            raise
+        else:
+            self.finish_span(span)
+
+    def find(self, predicate=None):
+        """Последняя завершенная трасса, удовлетворяющая условию"""
+        for root in reversed(self.recent):
+            if predicate is None or predicate(root):
+                return root
+        return None
+
+
+def current_span():
+    """Текущий отрезок (или None)"""
+    return _current_span.get()
+
+
+@contextmanager
+def activated(span):
+    """Блок, в котором span — текущий отрезок (работа команды, переданная другой задаче)"""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+async def detached(func, *args):
+    """Выполнение func(*args) в фоновой задаче вне трассы, в которой задача создана.
+
+    Задача копирует контекст вместе с отрезком команды, а тот завершается и экспортируется
+    раньше задачи; без сброса ее отрезки дописывались бы в уже отправленную трассу.
+    Корутина создается только при запуске задачи: отмененная до старта задача не оставляет
+    невыполненных корутин.
+    """
+    _current_span.set(None)
+    return await func(*args)
+
+
+def traced(name=None):
+    """Декоратор асинхронной функции: каждый вызов оформляется отрезком"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_class(prefix, exclude=()):
+    """Декоратор класса: оборачивает все его асинхронные методы в отрезки"""
+    def decorator(cls):
+        for attr_name, attr in list(vars(cls).items()):
+            if attr_name in exclude or attr_name.startswith('__'):
+                continue
+            if inspect.iscoroutinefunction(attr):
+                setattr(cls, attr_name, traced(f'{prefix}.{attr_name}')(attr))
+        return cls
+    return decorator
+
+
+def render_waterfall(root, width=24):
+    """Текстовая диаграмма трассы: смещение и длительность каждого отрезка"""
+    total = max(root.duration, 1e-9)
+    lines = []
+    for depth, span in root.walk():
+        offset = span.start - root.start
+        begin = int(offset / total * width)
+        length = max(1, int(span.duration / total * width))
+        bar = ' ' * begin + '█' * min(length, width - begin)
+        label = ('  ' * depth + span.name)[:34]
+        mark = ' ⚠' if span.error else ''
+        lines.append(f"{label:<34} {offset * 1000:7.0f} {span.duration * 1000:7.0f} |{bar:<{width}}|{mark}")
+    header = f"{'отрезок':<34} {'+мс':>7} {'мс':>7}"
+    return '\n'.join([header] + lines)
+
+
+tracer = Tracer(enabled=TRACE_ENABLED, history=TRACE_HISTORY)
+
+if TRACE_FILE:
+    tracer.exporters.append(FileExporter(TRACE_FILE))
+
+if TRACE_OTLP_ENDPOINT:
+    try:
+        tracer.exporters.append(OpenTelemetryExporter(TRACE_OTLP_ENDPOINT))
+    except ImportError:
+        logger.warning("TRACE_OTLP_ENDPOINT задан, но пакеты opentelemetry не установлены")
@@ -0,0 +1,69 @@
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class TrackInfoCache:
+    """LRU-кэш метаданных треков (словари track_info) с ограничением по времени жизни"""
+
+    def __init__(self, max_size=5000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()  # track_id -> (время добавления, track_info)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(track_id):
+        """Нормализация ID трека: '123:456' и 123 приводятся к '123'"""
+        return str(track_id).split(':')[0]
+
+    def get(self, track_id):
+        """Получение метаданных трека из кэша (None, если нет или устарели)"""
+        key = self._key(track_id)
+        entry = self._items.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        added_at, track_info = entry
+        if time.monotonic() - added_at > self.ttl:
+            del self._items[key]
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return track_info
+
+    def get_many(self, track_ids):
+        """Разделение списка ID на найденные в кэше и отсутствующие"""
+        found = {}
+        missing = []
+        for track_id in track_ids:
+            track_info = self.get(track_id)
+            if track_info is not None:
+                found[self._key(track_id)] = track_info
+            else:
+                missing.append(track_id)
+        return found, missing
+
+    def put(self, track_info):
+        """Добавление метаданных трека в кэш"""
+        if not track_info or not track_info.get('id'):
+            return
+
+        key = self._key(track_info['id'])
+        self._items[key] = (time.monotonic(), track_info)
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        """Очистка кэша"""
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,317 @@
+import random
+import itertools
+
+
+class _Node:
+    __slots__ = ('value', 'priority', 'size', 'left', 'right', 'key')
+
+    def __init__(self, value, key=None):
+        self.value = value
+        self.priority = random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+        self.key = key  # Ключ порядка для FairTrackQueue
+
+
+def _size(node):
+    return node.size if node is not None else 0
+
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+    return node
+
+
+def _split(node, count):
+    """Разбиение на первые count элементов и остальные"""
+    if node is None:
+        return None, None
+    if _size(node.left) >= count:
+        left, node.left = _split(node.left, count)
+        return left, _update(node)
+    node.right, right = _split(node.right, count - _size(node.left) - 1)
+    return _update(node), right
+
+
+def _split_key(node, key):
+    """Разбиение на узлы с ключом меньше key и остальные"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split_key(node.right, key)
+        return _update(node), right
+    left, node.left = _split_key(node.left, key)
+    return left, _update(node)
+
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return _update(left)
+    right.left = _merge(left, right.left)
+    return _update(right)
+
+
+class TrackQueue:
+    """Очередь треков с доступом по номеру: декартово дерево по неявному ключу.
+
+    Добавление в начало и конец, извлечение, вставка, удаление и перенос по номеру — O(log n),
+    срез для постраничного просмотра — O(log n + k) без копирования очереди. Совместима
+    с deque в том, что использует плеер (append, appendleft, popleft, extend, clear, итерация).
+    version увеличивается при каждом изменении.
+    """
+
+    def __init__(self, items=()):
+        self._root = None
+        self.version = 0
+        self.extend(items)
+
+    def __len__(self):
+        return _size(self._root)
+
+    def __bool__(self):
+        return self._root is not None
+
+    def __iter__(self):
+        return self.slice(0)
+
+    def _index(self, index):
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('индекс за пределами очереди')
+        return index
+
+    def _node(self, index):
+        node = self._root
+        while True:
+            left = _size(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node
+            else:
+                index -= left + 1
+                node = node.right
+
+    def __getitem__(self, index):
+        return self._node(self._index(index)).value
+
+    def _changed(self):
+        self.version += 1
+
+    def _clamp(self, index):
+        return max(0, min(len(self), index + len(self) if index < 0 else index))
+
+    def _insert_node(self, index, node):
+        left, right = _split(self._root, index)
+        self._root = _merge(_merge(left, node), right)
+        self._changed()
+
+    def insert(self, index, value):
+        self._insert_node(self._clamp(index), _Node(value))
+
+    def add_priority(self, value):
+        """Трек вне общей очереди — в начало (!playnext)"""
+        self.insert(0, value)
+
+    def append(self, value):
+        self._root = _merge(self._root, _Node(value))
+        self._changed()
+
+    def appendleft(self, value):
+        self._root = _merge(_Node(value), self._root)
+        self._changed()
+
+    def extend(self, values):
+        for value in values:
+            self._root = _merge(self._root, _Node(value))
+        self._changed()
+
+    def _pop_node(self, index):
+        left, rest = _split(self._root, self._index(index))
+        node, right = _split(rest, 1)
+        self._root = _merge(left, right)
+        self._changed()
+        return node
+
+    def pop(self, index=-1):
+        return self._pop_node(index).value
+
+    def popleft(self):
+        if self._root is None:
+            raise IndexError('очередь пуста')
+        return self.pop(0)
+
+    def move(self, source, target):
+        """Перенос элемента с номера source на номер target (номера после переноса)"""
+        value = self.pop(source)
+        self.insert(target, value)
+        return value
+
+    def drop(self, count):
+        """Удаление первых count элементов (переход к элементу с номером count)"""
+        dropped, self._root = _split(self._root, count)
+        self._changed()
+        return _size(dropped)
+
+    def shuffle(self):
+        """Перемешивание на месте: значения переставляются по узлам, форма дерева не меняется"""
+        values = list(self)
+        random.shuffle(values)
+        for node, value in zip(self._nodes(0), values):
+            node.value = value
+        self._changed()
+
+    def clear(self):
+        self._root = None
+        self._changed()
+
+    def _nodes(self, start):
+        # Обход по порядку с узла номер start: стек хранит путь к нему
+        stack = []
+        node = self._root
+        while node is not None:
+            left = _size(node.left)
+            if start < left:
+                stack.append(node)
+                node = node.left
+            elif start == left:
+                stack.append(node)
+                break
+            else:
+                start -= left + 1
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+    def slice(self, start, stop=None):
+        """Элементы с номера start до stop (итератор, без копирования очереди)"""
+        start = max(0, start)
+        count = max(0, (len(self) if stop is None else min(stop, len(self))) - start)
+        for node, _ in zip(self._nodes(start), range(count)):
+            yield node.value
+
+
+class FairTrackQueue(TrackQueue):
+    """Очередь с поочередным воспроизведением заказов разных пользователей.
+
+    Self-clocked fair queueing: трек получает метку окончания max(V, метка предыдущего трека
+    того же пользователя) + 1 / вес, где V — метка последнего начатого трека. Очередь упорядочена
+    по меткам, поэтому 50 треков одного !playlist не отодвигают чужой !play дальше второй
+    позиции, а пользователь с весом 2 получает два трека за круг. Вставка и извлечение — O(log n).
+
+    Ключ узла (полоса, метка, номер): полоса -1 — возвращенные в начало треки, 0 — приоритетная
+    (!playnext, по порядку добавления), 1 — общая. Номера из !queue, перенос и удаление работают
+    как в TrackQueue; перенесенный трек получает ключ соседа. После удаления из середины
+    и перемешивания метки общей полосы пересчитываются, после пропуска V сдвигается.
+    """
+
+    MAX_IDLE_REQUESTERS = 64  # Метки ушедших пользователей чистятся, когда их больше
+
+    def __init__(self, weight=None):
+        self.weight = weight or (lambda requester: 1.0)
+        self.virtual_time = 0.0
+        self.finish = {}  # Пользователь (id) -> метка его последнего трека
+        self._seq = itertools.count()
+        super().__init__()
+
+    def _insert_key(self, node):
+        left, right = _split_key(self._root, node.key)
+        self._root = _merge(_merge(left, node), right)
+        self._changed()
+
+    def append(self, value):
+        requester = value.get('requester')
+        requester_id = getattr(requester, 'id', requester)
+        start = max(self.virtual_time, self.finish.get(requester_id, self.virtual_time))
+        tag = start + 1.0 / max(self.weight(requester), 0.01)
+        self.finish[requester_id] = tag
+        self._insert_key(_Node(value, (1, tag, next(self._seq))))
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def appendleft(self, value):
+        self._root = _merge(_Node(value, (-1, 0.0, -next(self._seq))), self._root)
+        self._changed()
+
+    def add_priority(self, value):
+        self._insert_key(_Node(value, (0, 0.0, next(self._seq))))
+
+    def insert(self, index, value):
+        index = self._clamp(index)
+        key = self._node(index - 1).key if index > 0 else (-1, 0.0, -next(self._seq))
+        self._insert_node(index, _Node(value, key))
+
+    def _pop_node(self, index):
+        index = self._index(index)
+        node = super()._pop_node(index)
+        if index == 0 and node.key[0] == 1:
+            self.virtual_time = max(self.virtual_time, node.key[1])
+        elif node.key[0] == 1:
+            # Удален трек из середины: у его владельца не должно остаться пропуска в метках
+            self._retag()
+        self._served()
+        return node
+
+    def drop(self, count):
+        # Пропущенные треки считаются начатыми: V переходит к метке последнего из них
+        count = max(0, min(count, len(self)))
+        if count and self._node(count - 1).key[0] == 1:
+            self.virtual_time = max(self.virtual_time, self._node(count - 1).key[1])
+        dropped = super().drop(count)
+        self._served()
+        return dropped
+
+    def shuffle(self):
+        """Перемешивание: порядок треков каждого пользователя случаен, очередность между
+        пользователями по-прежнему определяется метками"""
+        super().shuffle()
+        self._retag()
+
+    def _served(self):
+        if self._root is None:
+            self.virtual_time = 0.0
+            self.finish.clear()
+        elif len(self.finish) > self.MAX_IDLE_REQUESTERS:
+            self.finish = {requester: tag for requester, tag in self.finish.items() if tag > self.virtual_time}
+
+    def _retag(self):
+        """Пересчет меток общей полосы от текущего V в нынешнем порядке и перестройка дерева"""
+        nodes = list(self._nodes(0))
+        finish = {}
+        for node in nodes:
+            if node.key[0] != 1:
+                continue
+            requester = node.value.get('requester')
+            requester_id = getattr(requester, 'id', requester)
+            start = max(self.virtual_time, finish.get(requester_id, self.virtual_time))
+            tag = start + 1.0 / max(self.weight(requester), 0.01)
+            finish[requester_id] = tag
+            node.key = (1, tag, node.key[2])
+        self.finish = finish
+        nodes.sort(key=lambda node: node.key)
+        self._root = None
+        for node in nodes:
+            node.left = node.right = None
+            node.size = 1
+            self._root = _merge(self._root, node)
+        self._changed()
+
+    def clear(self):
+        super().clear()
+        self.virtual_time = 0.0
+        self.finish.clear()
@@ -0,0 +1,191 @@
+import logging
+import threading
+import discord
+from audio_source import FRAME_SIZE, FRAME_SECONDS
+
+try:
+    import numpy as np
+except ImportError:  # numpy необязателен: без него переходы бесшовные, но без наложения
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def crossfade_available():
+    return np is not None
+
+
+def crossfade_frame(outgoing, incoming, start, end):
+    """Смешивание двух PCM-кадров (s16le) с линейным изменением громкости от start к end"""
+    a = np.frombuffer(outgoing.ljust(FRAME_SIZE, b'\x00'), dtype=np.int16).astype(np.float32)
+    b = np.frombuffer(incoming.ljust(FRAME_SIZE, b'\x00'), dtype=np.int16).astype(np.float32)
+    # Кривая по сэмплам (пара каналов — один шаг), чтобы внутри кадра не было ступеньки
+    ramp = np.repeat(np.linspace(start, end, a.size // 2, endpoint=False, dtype=np.float32), 2)
+    mixed = a * (1.0 - ramp) + b * ramp
+    return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes()
+
+
+class GuildAudioStream(discord.AudioSource):
+    """Непрерывный источник звука сервера: треки сменяются на границе кадра.
+
+    voice_client.play() вызывается один раз на серию треков. За preload_seconds до конца
+    трека поток просит следующий (on_preload), тот готовится заранее (queue_next) и начинает звучать в том же вызове read(), в котором закончился
+    текущий, — без паузы на запуск FFmpeg. Если задан crossfade_seconds и установлен numpy,
+    последние секунды трека накладываются на начало следующего.
+    """
+
+    def __init__(self, source, entry, on_switch=None, on_preload=None, preload_seconds=0.0, crossfade_seconds=0.0,
+                 position=0.0, on_track_end=None):
+        self.current = source
+        self.entry = entry
+        self.next = None
+        self.next_entry = None
+        self._next_position = 0.0
+        # Колбэки вызываются из потока воспроизведения: on_switch(stream, entry), on_preload(stream),
+        # on_track_end(entry, seconds) — трек закончился или прерван, seconds — сколько он звучал
+        self.on_switch = on_switch
+        self.on_preload = on_preload
+        self.on_track_end = on_track_end
+        self.frames_played = 0  # Кадров текущего трека, отданных в голосовой канал (перемотка не учитывается)
+        self.preload_frames = int(preload_seconds / FRAME_SECONDS)
+        self._preload_requested = False
+        self.crossfade_frames = int(crossfade_seconds / FRAME_SECONDS) if np is not None else 0
+        self.frames_read = int(position / FRAME_SECONDS)  # Кадров текущего трека (с учетом перемотки)
+        self.finished = False
+        self._fade_pos = None  # Номер кадра наложения, пока идет переход
+        self._skip = False
+        self._lock = threading.Lock()
+
+    @property
+    def position(self):
+        """Позиция текущего трека, с"""
+        return self.frames_read * FRAME_SECONDS
+
+    def sources(self):
+        return [source for source in (self.current, self.next) if source is not None]
+
+    def queue_next(self, source, entry, position=0.0):
+        """Подготовленный трек, который зазвучит сразу после текущего; False — поток уже закончился"""
+        with self._lock:
+            if self.finished:
+                return False
+            previous = self.next
+            self.next, self.next_entry = source, entry
+            self._next_position = position
+        if previous is not None:
+            previous.cleanup()
+        return True
+
+    def replace_current(self, source, entry, position):
+        """Замена источника текущего трека (перемотка) на границе кадра; False — трек уже сменился"""
+        with self._lock:
+            if self.finished or self.entry is not entry:
+                return False
+            previous = self.current
+            self.current = source
+            self.frames_read = int(position / FRAME_SECONDS)
+            self._fade_pos = None
+            if self.next is None:
+                self._preload_requested = False  # После перемотки назад следующий трек запросится заново
+        previous.cleanup()
+        return True
+
+    def clear_next(self):
+        """Отмена подготовленного трека (очередь изменилась); возвращает его запись"""
+        with self._lock:
+            source, entry = self.next, self.next_entry
+            self.next = self.next_entry = None
+            self._fade_pos = None
+        if source is not None:
+            source.cleanup()
+        return entry
+
+    def skip(self):
+        """Переход к подготовленному треку на следующем кадре; False — подготовленного нет"""
+        with self._lock:
+            if self.next is None or self.finished:
+                return False
+            self._skip = True
+            return True
+
+    def _track_ended(self):
+        if self.on_track_end is not None and self.entry is not None:
+            self.on_track_end(self.entry, self.frames_played * FRAME_SECONDS)
+        self.frames_played = 0
+
+    def _switch(self):
+        # Вызывается под self._lock
+        self._track_ended()
+        finished_source = self.current
+        self.current, self.entry = self.next, self.next_entry
+        self.next = self.next_entry = None
+        self.frames_read = self._fade_pos or int(self._next_position / FRAME_SECONDS)
+        self._next_position = 0.0
+        self._fade_pos = None
+        self._skip = False
+        self._preload_requested = False
+        finished_source.cleanup()
+        if self.on_switch is not None:
+            self.on_switch(self, self.entry)
+
+    def _check_preload(self):
+        if self._preload_requested or self.on_preload is None or not self.preload_frames or self.next is not None:
+            return
+        total = int((self.entry.get('duration') or 0) / FRAME_SECONDS)
+        if total - self.frames_read <= self.preload_frames:
+            self._preload_requested = True
+            self.on_preload(self)
+
+    def _fade_start(self):
+        if not self.crossfade_frames or self.next is None:
+            return None
+        duration = self.entry.get('duration') or 0
+        total = int(duration / FRAME_SECONDS)
+        return max(0, total - self.crossfade_frames) if total > self.crossfade_frames * 2 else None
+
+    def read(self):
+        with self._lock:
+            if self.finished:
+                return b''
+            if self._skip:
+                self._switch()
+
+            frame = self.current.read()
+            while not frame:
+                if self.next is None:
+                    self.finished = True
+                    self._track_ended()
+                    return b''
+                self._switch()
+                frame = self.current.read()
+            self.frames_read += 1
+            self.frames_played += 1
+            self._check_preload()
+
+            fade_start = self._fade_start()
+            if fade_start is not None and self.frames_read > fade_start:
+                incoming = self.next.read()
+                if incoming:
+                    self._fade_pos = (self._fade_pos or 0) + 1
+                    start = self._fade_pos - 1
+                    frame = crossfade_frame(
+                        frame, incoming,
+                        start / self.crossfade_frames, min(1.0, (start + 1) / self.crossfade_frames)
+                    )
+                    if self._fade_pos >= self.crossfade_frames:
+                        # Наложение закончилось раньше, чем текущий трек (длительность занижена)
+                        self._switch()
+            return frame
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        with self._lock:
+            if not self.finished:
+                self._track_ended()  # Остановка посреди трека
+            self.finished = True
+            sources = self.sources()
+            self.current = self.next = None
+        for source in sources:
+            source.cleanup()
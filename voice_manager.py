@@ -0,0 +1,222 @@
+import time
+import random
+import asyncio
+import logging
+import discord
+from metrics import VOICE_HANDSHAKE
+from config import (
+    VOICE_LINGER_SECONDS, VOICE_CONNECT_TIMEOUT, VOICE_RECONNECT_ATTEMPTS,
+    VOICE_RECONNECT_BASE_DELAY, VOICE_RECONNECT_MAX_DELAY
+)
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceConnectionManager:
+    """Голосовые подключения серверов: повторные попытки, "теплое" удержание после остановки
+    и восстановление после обрыва без потери очереди"""
+
+    def __init__(self, bot, clients):
+        self.bot = bot
+        self.clients = clients  # guild_id -> VoiceClient (тот же словарь, что MusicPlayer.voice_clients)
+        self.channels = {}  # guild_id -> последний голосовой канал
+        self.contexts = {}  # guild_id -> контекст последней команды (для сообщений после переподключения)
+        self._linger_tasks = {}
+        self._recover_tasks = {}
+        self._leaving = set()  # Серверы, откуда бот уходит сам (не восстанавливать)
+
+    def get(self, guild_id):
+        return self.clients.get(guild_id)
+
+    def _adopt_existing(self, guild):
+        """Подхват подключения, о котором знает discord.py, но не знает плеер"""
+        existing = discord.utils.get(self.bot.voice_clients, guild=guild)
+        if existing:
+            self.clients[guild.id] = existing
+        return existing
+
+    @staticmethod
+    def backoff_delay(attempt):
+        """Задержка перед повторной попыткой: экспоненциальный рост со случайным разбросом"""
+        delay = min(VOICE_RECONNECT_MAX_DELAY, VOICE_RECONNECT_BASE_DELAY * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def connect(self, guild, channel, ctx=None):
+        """Подключение к каналу (или перемещение); возвращает VoiceClient или None"""
+        self.cancel_linger(guild.id)
+        self._leaving.discard(guild.id)
+        self.channels[guild.id] = channel
+        if ctx is not None:
+            self.contexts[guild.id] = ctx
+
+        voice_client = self.clients.get(guild.id) or self._adopt_existing(guild)
+        if voice_client and voice_client.is_connected():
+            if voice_client.channel != channel:
+                started = time.perf_counter()
+                try:
+                    await voice_client.move_to(channel)
+                except Exception as e:
+                    VOICE_HANDSHAKE.labels('move', 'error').observe(time.perf_counter() - started)
+                    logger.error("Ошибка перемещения в голосовой канал: %s", e)
+                    return None
+                VOICE_HANDSHAKE.labels('move', 'ok').observe(time.perf_counter() - started)
+            else:
+                VOICE_HANDSHAKE.labels('warm', 'ok').observe(0)
+            return voice_client
+
+        return await self._connect_with_backoff(guild, channel, 'connect')
+
+    async def _connect_with_backoff(self, guild, channel, kind):
+        """Подключение с повторными попытками и экспоненциальной задержкой"""
+        for attempt in range(VOICE_RECONNECT_ATTEMPTS):
+            started = time.perf_counter()
+            try:
+                voice_client = await channel.connect(timeout=VOICE_CONNECT_TIMEOUT, reconnect=True)
+                VOICE_HANDSHAKE.labels(kind, 'ok').observe(time.perf_counter() - started)
+                self.clients[guild.id] = voice_client
+                logger.info(
+                    "Голосовое подключение к %s за %.0f мс (попытка %s)",
+                    channel, (time.perf_counter() - started) * 1000, attempt + 1
+                )
+                return voice_client
+            except discord.ClientException as e:
+                # Частый случай: Already connected — берем существующий клиент
+                logger.warning("Исключение при подключении (вероятно, уже подключен): %s", e)
+                existing = self._adopt_existing(guild)
+                if existing:
+                    if existing.channel == channel:
+                        return existing
+                    try:
+                        await existing.move_to(channel)
+                        return existing
+                    except Exception as move_error:
+                        logger.error("Ошибка перемещения в голосовой канал (попытка %s): %s", attempt + 1, move_error)
+                VOICE_HANDSHAKE.labels(kind, 'error').observe(time.perf_counter() - started)
+            except Exception as e:
+                VOICE_HANDSHAKE.labels(kind, 'error').observe(time.perf_counter() - started)
+                logger.error("Ошибка подключения к голосовому каналу (попытка %s): %s", attempt + 1, e)
+
+            if attempt + 1 < VOICE_RECONNECT_ATTEMPTS:
+                await asyncio.sleep(self.backoff_delay(attempt))
+                # За время ожидания discord.py мог восстановить соединение сам
+                existing = self._adopt_existing(guild)
+                if existing and existing.is_connected():
+                    return existing
+
+        logger.error("Не удалось подключиться к %s после %s попыток", channel, VOICE_RECONNECT_ATTEMPTS)
+        return None
+
+    def release(self, guild_id, is_idle):
+        """Остановка без немедленного отключения: соединение удерживается VOICE_LINGER_SECONDS"""
+        self.cancel_linger(guild_id)
+        if VOICE_LINGER_SECONDS <= 0:
+            self._linger_tasks[guild_id] = asyncio.ensure_future(self.disconnect(guild_id))
+            return
+        self._linger_tasks[guild_id] = asyncio.ensure_future(self._linger(guild_id, is_idle))
+
+    async def _linger(self, guild_id, is_idle):
+        try:
+            await asyncio.sleep(VOICE_LINGER_SECONDS)
+        except asyncio.CancelledError:
+            return
+        self._linger_tasks.pop(guild_id, None)
+        if is_idle():
+            logger.info("Отключение от голосового канала сервера %s после простоя", guild_id)
+            await self.disconnect(guild_id)
+
+    def cancel_linger(self, guild_id):
+        task = self._linger_tasks.pop(guild_id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    async def disconnect(self, guild_id):
+        """Немедленное отключение от голосового канала"""
+        self.cancel_linger(guild_id)
+        recover_task = self._recover_tasks.pop(guild_id, None)
+        if recover_task is not None:
+            recover_task.cancel()
+        voice_client = self.clients.pop(guild_id, None)
+        self.channels.pop(guild_id, None)
+        if voice_client is None:
+            return False
+        self._leaving.add(guild_id)
+        try:
+            await voice_client.disconnect()
+        except Exception as e:
+            logger.warning("Ошибка отключения от голосового канала: %s", e)
+        return True
+
+    # Коды закрытия голосового соединения, означающие отключение со стороны Discord, а не обрыв:
+    # 4014 — бота отключили или канал удален, 1000 — discord.py закрыл соединение сам,
+    # получив состояние без канала (так выглядит кнопка "Отключить" у модератора)
+    FORCED_CLOSE_CODES = (1000, 4014)
+
+    def _forced_disconnect(self, guild):
+        """Бота отключили на стороне Discord, а не оборвалось соединение.
+
+        Решение принимается по публичным признакам: после обрыва discord.py сам отказывается
+        от соединения и убирает клиент из guild.voice_client еще до состояния без канала,
+        а при отключении модератором клиент в этот момент либо еще подключен, либо только
+        закрывается. Код закрытия (внутренние поля discord.py, проверено на версии из
+        requirements.txt) — лишь дополнительная подсказка, когда клиент уже убран.
+        """
+        voice_client = self.clients.get(guild.id)
+        if voice_client is None or voice_client.is_connected():
+            return True
+        if guild.voice_client is voice_client:
+            return True
+        ws = getattr(voice_client, 'ws', None)
+        code = getattr(ws, '_close_code', None) or getattr(getattr(ws, 'socket', None), 'close_code', None)
+        return code in self.FORCED_CLOSE_CODES
+
+    def on_voice_state_update(self, guild, before, after, on_recovered, on_stopped):
+        """Обработка изменения голосового состояния самого бота.
+
+        Переподключение — только после обрыва соединения; если бота отключил модератор,
+        воспроизведение останавливается (on_stopped), иначе бот спорил бы с ним.
+        """
+        if after.channel is not None:
+            if before.channel != after.channel:
+                # Бота переместили — запоминаем новый канал
+                self.channels[guild.id] = after.channel
+            return
+
+        if guild.id in self._leaving:
+            self._leaving.discard(guild.id)
+            return
+
+        channel = before.channel or self.channels.get(guild.id)
+        if channel is None or guild.id in self._recover_tasks:
+            return
+        if self._forced_disconnect(guild):
+            logger.info("Бота отключили от голосового канала сервера %s, воспроизведение остановлено", guild.id)
+            self.cancel_linger(guild.id)
+            self.clients.pop(guild.id, None)
+            self.channels.pop(guild.id, None)
+            on_stopped(guild.id)
+            return
+        logger.warning("Голосовое соединение сервера %s оборвалось, восстанавливаем", guild.id)
+        self._recover_tasks[guild.id] = asyncio.ensure_future(self._recover(guild, channel, on_recovered))
+
+    async def _recover(self, guild, channel, on_recovered):
+        """Переподключение после обрыва; очередь плеера при этом сохраняется"""
+        try:
+            stale = self.clients.pop(guild.id, None)
+            if stale is not None and stale.is_connected():
+                await stale.disconnect(force=True)
+            await asyncio.sleep(self.backoff_delay(0))
+
+            # В пустой канал не возвращаемся
+            if not any(not member.bot for member in getattr(channel, 'members', [])):
+                logger.info("В канале %s никого нет, переподключение отменено", channel)
+                return
+
+            voice_client = await self._connect_with_backoff(guild, channel, 'reconnect')
+            if voice_client is not None:
+                await on_recovered(guild.id, self.contexts.get(guild.id))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error("Ошибка восстановления голосового соединения: %s", e)
+        finally:
+            self._recover_tasks.pop(guild.id, None)
@@ -1,30 +1,67 @@
 import asyncio
+import functools
+import time
 import logging
 from yandex_music import Client
-from config import ERROR_MESSAGES
+from config import ERROR_MESSAGES, TRACK_CACHE_SIZE, TRACK_CACHE_TTL, STREAM_CODECS
+from track_cache import TrackInfoCache
+from stream_quality import select_download_info
+from metrics import YANDEX_CALLS, YANDEX_ERRORS, YANDEX_LATENCY, TRACK_URL_LATENCY, STREAM_VARIANTS
+from tracing import tracer, traced_class
 import yt_dlp
 
 logger = logging.getLogger(__name__)
 
+@traced_class('yandex', exclude=('call_api',))
 class YandexMusicClient:
     def __init__(self):
         self.client = None
         self.is_authenticated = False
+        self.track_cache = TrackInfoCache(TRACK_CACHE_SIZE, TRACK_CACHE_TTL)  # Кэш метаданных треков
         
+    async def call_api(self, method, *args, **kwargs):
+        """Вызов метода yandex_music.Client в пуле потоков с учетом в метриках"""
+        return await self.call_object(self.client, method, *args, **kwargs)
+    
+    async def call_object(self, obj, method, /, *args, **kwargs):
+        """Вызов метода объекта yandex_music, делающего HTTP-запрос (Track, DownloadInfo и т.п.), в пуле потоков"""
+        label = method if obj is self.client else f"{type(obj).__name__}.{method}"
+        YANDEX_CALLS.labels(label).inc()
+        started = time.perf_counter()
+        try:
+            func = getattr(obj, method)
+            with tracer.span(f'yandex.api.{label}'):
+                return await asyncio.get_event_loop().run_in_executor(
+                    None,
+                    functools.partial(func, *args, **kwargs)
+                )
+        except Exception:
+            YANDEX_ERRORS.labels(label).inc()
+            raise
+        finally:
+            YANDEX_LATENCY.labels(label).observe(time.perf_counter() - started)
+    
+    async def get_download_info(self, track, get_direct_links=False):
+        """Асинхронная версия Track.get_download_info"""
+        return await self.call_object(track, 'get_download_info', get_direct_links)
+    
+    async def get_direct_link(self, download_info):
+        """Асинхронная версия DownloadInfo.get_direct_link (без запроса, если ссылка уже получена)"""
+        if getattr(download_info, 'direct_link', None):
+            return download_info.direct_link
+        return await self.call_object(download_info, 'get_direct_link')
+    
     async def authenticate_with_token(self, token):
         """Аутентификация в Яндекс.Музыке"""
         try:
             # Создаем клиент с токеном
             self.client = Client(token)
-            await asyncio.get_event_loop().run_in_executor(
-                None, 
-                self.client.init
-            )
+            await self.call_api('init')
             self.is_authenticated = True
             logger.info("Успешная авторизация в Яндекс.Музыке")
             return True
         except Exception as e:
-            logger.error(f"Ошибка авторизации в Яндекс.Музыке: {e}")
+            logger.error("Ошибка авторизации в Яндекс.Музыке: %s", e)
             self.is_authenticated = False
             return False
     
@@ -36,10 +73,7 @@ class YandexMusicClient:
         
         try:
             # Простой поиск без дополнительных параметров
-            search_result = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.client.search(query)
-            )
+            search_result = await self.call_api('search', query)
             
             tracks = []
             if search_result and hasattr(search_result, 'tracks') and search_result.tracks:
@@ -51,7 +85,8 @@ class YandexMusicClient:
                             'artist': ', '.join([artist.name for artist in track.artists]) if track.artists else 'Неизвестный исполнитель',
                             'duration': track.duration_ms // 1000 if track.duration_ms else 0,
                             'album': track.albums[0].title if track.albums and len(track.albums) > 0 else 'Неизвестный альбом',
-                            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None
+                            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None,
+                            **self._loudness_info(track)
                         }
                         tracks.append(track_info)
             
@@ -62,22 +97,19 @@ class YandexMusicClient:
             return await self._alternative_search(query, limit)
             
         except Exception as e:
-            logger.error(f"Ошибка поиска треков: {e}")
+            logger.error("Ошибка поиска треков: %s", e)
             # Попробуем альтернативный способ поиска
             try:
                 return await self._alternative_search(query, limit)
             except Exception as e2:
-                logger.error(f"Альтернативный поиск также не удался: {e2}")
+                logger.error("Альтернативный поиск также не удался: %s", e2)
                 return []
     
     async def _alternative_search(self, query, limit=10):
         """Альтернативный способ поиска треков"""
         try:
             # Простой поиск без дополнительных параметров
-            search_result = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.client.search(query)
-            )
+            search_result = await self.call_api('search', query)
             
             tracks = []
             if search_result and hasattr(search_result, 'tracks') and search_result.tracks:
@@ -89,24 +121,80 @@ class YandexMusicClient:
                             'artist': ', '.join([artist.name for artist in track.artists]) if track.artists else 'Неизвестный исполнитель',
                             'duration': track.duration_ms // 1000 if track.duration_ms else 0,
                             'album': track.albums[0].title if track.albums and len(track.albums) > 0 else 'Неизвестный альбом',
-                            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None
+                            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None,
+                            **self._loudness_info(track)
                         }
                         tracks.append(track_info)
             
             return tracks
         except Exception as e:
-            logger.error(f"Ошибка альтернативного поиска: {e}")
+            logger.error("Ошибка альтернативного поиска: %s", e)
             return []
     
+    def get_account_uid(self):
+        """Получение UID текущего аккаунта (None, если клиент не инициализирован)"""
+        me = getattr(self.client, 'me', None) if self.client else None
+        account = getattr(me, 'account', None) if me else None
+        return getattr(account, 'uid', None) if account else None
+    
+    @staticmethod
+    def _loudness_info(track):
+        """Громкость трека по EBU R128 (для нормализации при воспроизведении)"""
+        r128 = getattr(track, 'r128', None)
+        return {
+            'loudness': getattr(r128, 'i', None),
+            'true_peak': getattr(r128, 'tp', None)
+        }
+    
+    @staticmethod
+    def _build_track_info(track):
+        """Преобразование объекта Track в словарь track_info"""
+        return {
+            'id': track.id,
+            'title': track.title,
+            'artist': ', '.join([artist.name for artist in track.artists]) if track.artists else 'Неизвестный исполнитель',
+            'duration': track.duration_ms // 1000 if track.duration_ms else 0,
+            'album': track.albums[0].title if track.albums and len(track.albums) > 0 else 'Неизвестный альбом',
+            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None,
+            **YandexMusicClient._loudness_info(track)
+        }
+    
+    async def get_tracks_info(self, track_ids):
+        """Получение метаданных треков по списку ID через кэш (недостающие загружаются одним запросом)"""
+        if not self.is_authenticated or not track_ids:
+            return []
+        
+        found, missing = self.track_cache.get_many(track_ids)
+        
+        if missing:
+            try:
+                full_tracks = await self.call_api(
+                    'tracks',
+                    missing
+                )
+                for track in full_tracks or []:
+                    if track:
+                        track_info = self._build_track_info(track)
+                        self.track_cache.put(track_info)
+                        found[TrackInfoCache._key(track_info['id'])] = track_info
+            except Exception as e:
+                logger.error("Ошибка загрузки метаданных треков: %s", e)
+        
+        # Сохраняем исходный порядок ID
+        return [found[key] for key in (TrackInfoCache._key(track_id) for track_id in track_ids) if key in found]
+    
     async def get_track_info_by_id(self, track_id):
         """Получение информации о треке по ID"""
         if not self.is_authenticated:
             return None
         
+        cached = self.track_cache.get(track_id)
+        if cached is not None:
+            return cached
+        
         try:
-            track = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.client.tracks,
+            track = await self.call_api(
+                'tracks',
                 [track_id]
             )
             
@@ -118,104 +206,94 @@ class YandexMusicClient:
                     'artist': ', '.join([artist.name for artist in track_obj.artists]) if track_obj.artists else 'Неизвестный исполнитель',
                     'duration': track_obj.duration_ms // 1000 if track_obj.duration_ms else 0,
                     'album': track_obj.albums[0].title if track_obj.albums and len(track_obj.albums) > 0 else 'Неизвестный альбом',
-                    'cover_url': f"https://{track_obj.cover_uri.replace('%%', '200x200')}" if track_obj.cover_uri else None
+                    'cover_url': f"https://{track_obj.cover_uri.replace('%%', '200x200')}" if track_obj.cover_uri else None,
+                    **self._loudness_info(track_obj)
                 }
+                self.track_cache.put(track_info)
                 return track_info
             
         except Exception as e:
-            logger.error(f"Ошибка получения информации о треке: {e}")
+            logger.error("Ошибка получения информации о треке: %s", e)
             
         return None
     
-    async def get_track_url(self, track_id):
-        """Получение URL трека для воспроизведения"""
-        if not self.is_authenticated:
+    async def _stream_variant(self, download_info, target_kbps):
+        """Прямая ссылка на выбранный вариант загрузки: {'url', 'codec', 'bitrate'}"""
+        if not download_info:
+            return None
+        variant = select_download_info(download_info, target_kbps, STREAM_CODECS)
+        if variant is None:
             return None
         
-        # Попробуем несколько способов получения URL
+        url = await self.get_direct_link(variant)
+        if not url:
+            return None
+        codec = getattr(variant, 'codec', None)
+        bitrate = getattr(variant, 'bitrate_in_kbps', None)
+        STREAM_VARIANTS.labels(codec, bitrate).inc()
+        logger.debug("Выбран вариант %s %s кбит/с (нужно от %s)", codec, bitrate, target_kbps)
+        return {'url': url, 'codec': codec, 'bitrate': bitrate}
+    
+    async def _get_url_download_info(self, track_id, target_kbps=None):
+        """Способ 1: варианты загрузки одним запросом tracks_download_info"""
+        download_info = await self.call_api('tracks_download_info', track_id)
+        return await self._stream_variant(download_info, target_kbps)
+    
+    async def _get_url_track_download_info(self, track_id, target_kbps=None):
+        """Способ 2: получение URL через tracks и get_download_info"""
+        track = await self.call_api(
+            'tracks',
+            [track_id]
+        )
         
-        # Способ 1: Через track_download_info
-        try:
-            download_info = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.client.track_download_info,
-                track_id
-            )
-            
-            if download_info:
-                logger.info(f"Получена информация о загрузке для трека {track_id}")
-                
-                # Выбираем лучшее качество
-                if hasattr(download_info, '__iter__') and len(download_info) > 0:
-                    best_quality = max(download_info, key=lambda x: getattr(x, 'bitrate_in_kbps', 0))
-                else:
-                    best_quality = download_info
-                
-                # Получаем прямую ссылку
-                if hasattr(best_quality, 'direct_link') and best_quality.direct_link:
-                    logger.info(f"Найдена прямая ссылка через direct_link")
-                    return best_quality.direct_link
-                elif hasattr(best_quality, 'get_direct_link'):
-                    direct_link = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        best_quality.get_direct_link
-                    )
-                    logger.info(f"Получена прямая ссылка через get_direct_link")
-                    return direct_link
-                elif hasattr(best_quality, 'url'):
-                    logger.info(f"Найдена ссылка через url")
-                    return best_quality.url
-                    
-        except Exception as e:
-            logger.error(f"Способ 1 получения URL не удался: {e}")
+        if track and track[0] and hasattr(track[0], 'get_download_info'):
+            download_info = await self.get_download_info(track[0])
+            return await self._stream_variant(download_info, target_kbps)
         
-        # Способ 2: Через tracks и get_download_info
-        try:
-            track = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.client.tracks,
-                [track_id]
-            )
-            
-            if track and track[0]:
-                track_obj = track[0]
-                
-                # Пробуем получить download_info напрямую
-                if hasattr(track_obj, 'get_download_info'):
-                    download_info = track_obj.get_download_info()
-                    if download_info and len(download_info) > 0:
-                        best_quality = max(download_info, key=lambda x: getattr(x, 'bitrate_in_kbps', 0))
-                        
-                        if hasattr(best_quality, 'direct_link') and best_quality.direct_link:
-                            logger.info(f"Найдена прямая ссылка через tracks.get_download_info")
-                            return best_quality.direct_link
-                        elif hasattr(best_quality, 'get_direct_link'):
-                            direct_link = best_quality.get_direct_link()
-                            logger.info(f"Получена прямая ссылка через get_direct_link")
-                            return direct_link
-                            
-        except Exception as e:
-            logger.error(f"Способ 2 получения URL не удался: {e}")
+        return None
+    
+    async def _get_url_ytdlp(self, track_id, target_kbps=None):
+        """Способ 3: yt-dlp (качество выбирает сам yt-dlp)"""
+        url = await self.get_track_url_ytdlp(track_id)
+        return {'url': url, 'codec': None, 'bitrate': None} if url else None
+    
+    async def resolve_stream(self, track_id, target_kbps=None):
+        """Ссылка для воспроизведения с кодеком и битрейтом выбранного варианта.
         
-        # Способ 3: Через yt-dlp
-        try:
-            ytdlp_url = await self.get_track_url_ytdlp(track_id)
-            if ytdlp_url:
-                logger.info(f"Получен URL через yt-dlp")
-                return ytdlp_url
-        except Exception as e:
-            logger.error(f"Способ 3 (yt-dlp) не удался: {e}")
+        target_kbps — нужный битрейт (см. stream_quality.target_bitrate); None — лучшее качество.
+        """
+        if not self.is_authenticated:
+            return None
         
-        # Способ 4: Создаем URL на основе ID (может не работать, но попробуем)
-        try:
-            # Иногда можно создать URL напрямую
-            fake_url = f"https://music.yandex.ru/track/{track_id}"
-            logger.info(f"Создан фиктивный URL: {fake_url}")
-            return fake_url
-        except Exception as e:
-            logger.error(f"Способ 4 также не удался: {e}")
+        # Попробуем несколько способов получения URL (время каждого попадает в метрики)
+        strategies = (
+            ('download_info', self._get_url_download_info),
+            ('track_download_info', self._get_url_track_download_info),
+            ('ytdlp', self._get_url_ytdlp),
+        )
+        
+        for number, (name, strategy) in enumerate(strategies, 1):
+            started = time.perf_counter()
+            stream = None
+            try:
+                stream = await strategy(track_id, target_kbps)
+            except Exception as e:
+                logger.error("Способ %s (%s) получения URL не удался: %s", number, name, e)
+            TRACK_URL_LATENCY.labels(name, 'ok' if stream else 'fail').observe(time.perf_counter() - started)
             
-        return None
+            if stream:
+                return stream
+        
+        # Способ 4: Создаем URL на основе ID (может не работать, но попробуем)
+        fake_url = f"https://music.yandex.ru/track/{track_id}"
+        logger.info("Создан фиктивный URL: %s", fake_url)
+        TRACK_URL_LATENCY.labels('fallback', 'ok').observe(0)
+        return {'url': fake_url, 'codec': None, 'bitrate': None}
+    
+    async def get_track_url(self, track_id, target_kbps=None):
+        """Получение URL трека для воспроизведения"""
+        stream = await self.resolve_stream(track_id, target_kbps)
+        return stream['url'] if stream else None
     
     async def get_track_url_ytdlp(self, track_id):
         """Получение URL трека через yt-dlp"""
@@ -236,44 +314,29 @@ class YandexMusicClient:
                 )
                 
                 if info and 'url' in info:
-                    logger.info(f"Получен URL через yt-dlp: {info['url'][:100]}...")
+                    logger.info("Получен URL через yt-dlp: %s...", info['url'][:100])
                     return info['url']
                     
         except Exception as e:
-            logger.error(f"Ошибка получения URL через yt-dlp: {e}")
+            logger.error("Ошибка получения URL через yt-dlp: %s", e)
             
         return None
     
-    async def _get_track_url_alternative(self, track_id):
+    async def _get_track_url_alternative(self, track_id, target_kbps=None):
         """Альтернативный способ получения URL трека"""
         try:
-            # Попробуем получить трек напрямую через клиент
-            track = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.client.track_download_info,
-                track_id
-            )
-            
-            if track:
-                # Ищем лучший вариант
-                if hasattr(track, 'get_direct_link'):
-                    return await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        track.get_direct_link
-                    )
-                elif hasattr(track, 'direct_link'):
-                    return track.direct_link
-                else:
-                    return str(track)
+            # Попробуем получить варианты загрузки напрямую через клиент
+            stream = await self._get_url_download_info(track_id, target_kbps)
+            if stream:
+                return stream['url']
             
         except Exception as e:
-            logger.error(f"Ошибка альтернативного получения URL: {e}")
+            logger.error("Ошибка альтернативного получения URL: %s", e)
             
         # Последняя попытка - используем старый API
         try:
-            track = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.client.tracks,
+            track = await self.call_api(
+                'tracks',
                 [track_id]
             )
             
@@ -281,16 +344,13 @@ class YandexMusicClient:
                 # Попробуем получить ссылку на трек напрямую
                 track_obj = track[0]
                 if hasattr(track_obj, 'get_download_info'):
-                    download_info = track_obj.get_download_info()
-                    if download_info and len(download_info) > 0:
-                        best = max(download_info, key=lambda x: getattr(x, 'bitrate_in_kbps', 0))
-                        if hasattr(best, 'direct_link'):
-                            return best.direct_link
-                        elif hasattr(best, 'get_direct_link'):
-                            return best.get_direct_link()
+                    download_info = await self.get_download_info(track_obj)
+                    stream = await self._stream_variant(download_info, target_kbps)
+                    if stream:
+                        return stream['url']
             
         except Exception as e2:
-            logger.error(f"Последняя попытка получения URL также не удалась: {e2}")
+            logger.error("Последняя попытка получения URL также не удалась: %s", e2)
             
         return None
     
@@ -304,7 +364,7 @@ class YandexMusicClient:
             logger.info("Получение начальных треков из 'Моя волна'...")
             direct_tracks = await self._get_direct_my_wave_tracks(limit)
             if direct_tracks:
-                logger.info(f"Получены начальные треки с user:onyourwave: {len(direct_tracks)} треков")
+                logger.info("Получены начальные треки с user:onyourwave: %s треков", len(direct_tracks))
                 return direct_tracks
             
             # Если не удалось, пробуем другие способы
@@ -314,35 +374,32 @@ class YandexMusicClient:
             try:
                 liked_tracks = await self._get_liked_tracks_fallback(limit)
                 if liked_tracks:
-                    logger.info(f"Используем лайкнутые треки: {len(liked_tracks)} треков")
+                    logger.info("Используем лайкнутые треки: %s треков", len(liked_tracks))
                     return liked_tracks
             except Exception as e:
-                logger.error(f"Ошибка получения лайкнутых треков: {e}")
+                logger.error("Ошибка получения лайкнутых треков: %s", e)
             
             # Способ 3: Популярные треки
             try:
                 popular_tracks = await self._get_popular_tracks_fallback(limit)
                 if popular_tracks:
-                    logger.info(f"Используем популярные треки: {len(popular_tracks)} треков")
+                    logger.info("Используем популярные треки: %s треков", len(popular_tracks))
                     return popular_tracks
             except Exception as e:
-                logger.error(f"Ошибка получения популярных треков: {e}")
+                logger.error("Ошибка получения популярных треков: %s", e)
             
             logger.warning("Не удалось найти треки для 'Моя волна'")
             return []
                 
         except Exception as e:
-            logger.error(f"Общая ошибка получения 'Моя волна': {e}")
+            logger.error("Общая ошибка получения 'Моя волна': %s", e)
             
         return []
     
     async def _get_liked_tracks_fallback(self, limit=20):
         """Получение лайкнутых треков как альтернатива 'Моя волна'"""
         try:
-            liked_tracks = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.client.users_likes_tracks
-            )
+            liked_tracks = await self.call_api('users_likes_tracks')
             
             tracks = []
             if liked_tracks and hasattr(liked_tracks, 'tracks'):
@@ -355,13 +412,14 @@ class YandexMusicClient:
                             'artist': ', '.join([artist.name for artist in track.artists]) if track.artists else 'Неизвестный исполнитель',
                             'duration': track.duration_ms // 1000 if track.duration_ms else 0,
                             'album': track.albums[0].title if track.albums and len(track.albums) > 0 else 'Неизвестный альбом',
-                            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None
+                            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None,
+                            **self._loudness_info(track)
                         }
                         tracks.append(track_info)
             
             return tracks
         except Exception as e:
-            logger.error(f"Ошибка получения лайкнутых треков: {e}")
+            logger.error("Ошибка получения лайкнутых треков: %s", e)
             return []
     
     async def _get_direct_my_wave_tracks(self, limit=20):
@@ -374,45 +432,42 @@ class YandexMusicClient:
             
             # Способ 1: Базовый вызов
             try:
-                station_tracks = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.client.rotor_station_tracks,
+                station_tracks = await self.call_api(
+                    'rotor_station_tracks',
                     'user:onyourwave'
                 )
                 logger.info("Получены треки с user:onyourwave (способ 1)")
             except Exception as e1:
-                logger.error(f"Способ 1 не удался: {e1}")
+                logger.error("Способ 1 не удался: %s", e1)
                 
                 # Способ 2: С настройками
                 try:
-                    station_tracks = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        self.client.rotor_station_tracks,
+                    station_tracks = await self.call_api(
+                        'rotor_station_tracks',
                         'user:onyourwave',
                         {"language": "ru", "moodEnergy": "all"},
                         None
                     )
                     logger.info("Получены треки с user:onyourwave (способ 2)")
                 except Exception as e2:
-                    logger.error(f"Способ 2 не удался: {e2}")
+                    logger.error("Способ 2 не удался: %s", e2)
                     
                     # Способ 3: С пустыми параметрами
                     try:
-                        station_tracks = await asyncio.get_event_loop().run_in_executor(
-                            None,
-                            self.client.rotor_station_tracks,
+                        station_tracks = await self.call_api(
+                            'rotor_station_tracks',
                             'user:onyourwave',
                             {},
                             ""
                         )
                         logger.info("Получены треки с user:onyourwave (способ 3)")
                     except Exception as e3:
-                        logger.error(f"Способ 3 не удался: {e3}")
+                        logger.error("Способ 3 не удался: %s", e3)
                         raise e3
             
             tracks = []
             if station_tracks and hasattr(station_tracks, 'sequence'):
-                logger.info(f"Найдено {len(station_tracks.sequence)} треков в последовательности")
+                logger.info("Найдено %s треков в последовательности", len(station_tracks.sequence))
                 for track_short in station_tracks.sequence[:limit]:
                     if hasattr(track_short, 'track') and track_short.track:
                         track = track_short.track
@@ -422,21 +477,22 @@ class YandexMusicClient:
                             'artist': ', '.join([artist.name for artist in track.artists]) if track.artists else 'Неизвестный исполнитель',
                             'duration': track.duration_ms // 1000 if track.duration_ms else 0,
                             'album': track.albums[0].title if track.albums and len(track.albums) > 0 else 'Неизвестный альбом',
-                            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None
+                            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None,
+                            **self._loudness_info(track)
                         }
                         tracks.append(track_info)
             
-            logger.info(f"Обработано {len(tracks)} треков с user:onyourwave")
+            logger.info("Обработано %s треков с user:onyourwave", len(tracks))
             return tracks
             
         except Exception as e:
-            logger.error(f"Ошибка прямого получения треков с user:onyourwave: {e}")
+            logger.error("Ошибка прямого получения треков с user:onyourwave: %s", e)
             return []
     
     async def get_next_my_wave_track(self, batch_id=None):
         """Получение следующего трека из 'Моя волна' для обновления"""
         try:
-            logger.info(f"Получение следующего трека из 'Моя волна' (batch_id: {batch_id})...")
+            logger.info("Получение следующего трека из 'Моя волна' (batch_id: %s)...", batch_id)
             
             # Пробуем получить следующий трек с user:onyourwave
             station_tracks = None
@@ -444,29 +500,27 @@ class YandexMusicClient:
             # Способ 1: С batch_id для получения следующего трека
             if batch_id:
                 try:
-                    station_tracks = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        self.client.rotor_station_tracks,
+                    station_tracks = await self.call_api(
+                        'rotor_station_tracks',
                         'user:onyourwave',
                         None,  # settings
                         batch_id  # batch_id для получения следующего трека
                     )
                     logger.info("Получен следующий трек с batch_id")
                 except Exception as e1:
-                    logger.error(f"Способ 1 с batch_id не удался: {e1}")
+                    logger.error("Способ 1 с batch_id не удался: %s", e1)
                     batch_id = None  # Сбрасываем batch_id для следующей попытки
             
             # Способ 2: Без batch_id (получаем новые треки)
             if not station_tracks:
                 try:
-                    station_tracks = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        self.client.rotor_station_tracks,
+                    station_tracks = await self.call_api(
+                        'rotor_station_tracks',
                         'user:onyourwave'
                     )
                     logger.info("Получен следующий трек без batch_id")
                 except Exception as e2:
-                    logger.error(f"Способ 2 без batch_id не удался: {e2}")
+                    logger.error("Способ 2 без batch_id не удался: %s", e2)
                     return None
             
             if station_tracks and hasattr(station_tracks, 'sequence') and station_tracks.sequence:
@@ -481,39 +535,37 @@ class YandexMusicClient:
                         'duration': track.duration_ms // 1000 if track.duration_ms else 0,
                         'album': track.albums[0].title if track.albums and len(track.albums) > 0 else 'Неизвестный альбом',
                         'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None,
-                        'batch_id': getattr(station_tracks, 'batch_id', None)  # Сохраняем batch_id для следующего запроса
+                        'batch_id': getattr(station_tracks, 'batch_id', None),  # Сохраняем batch_id для следующего запроса
+                        **self._loudness_info(track)
                     }
-                    logger.info(f"Получен следующий трек: {track_info['title']} - {track_info['artist']}")
+                    logger.info("Получен следующий трек: %s - %s", track_info['title'], track_info['artist'])
                     return track_info
             
             return None
             
         except Exception as e:
-            logger.error(f"Ошибка получения следующего трека из 'Моя волна': {e}")
+            logger.error("Ошибка получения следующего трека из 'Моя волна': %s", e)
             return None
     
     async def _get_radio_tracks_fallback(self, limit=20):
         """Получение треков через радиостанции как альтернатива 'Моя волна'"""
         try:
             # Попробуем получить радиостанции пользователя
-            stations = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.client.rotor_stations_dashboard
-            )
+            stations = await self.call_api('rotor_stations_dashboard')
             
             tracks = []
             if stations and hasattr(stations, 'stations'):
-                logger.info(f"Найдено {len(stations.stations)} радиостанций")
+                logger.info("Найдено %s радиостанций", len(stations.stations))
                 
                 # Ищем станцию "Моя волна"
                 for station in stations.stations:
                     if hasattr(station, 'station') and station.station:
                         station_info = station.station
                         station_name = getattr(station_info, 'name', '').lower()
-                        logger.info(f"Радиостанция: {station_name}")
+                        logger.info("Радиостанция: %s", station_name)
                         
                         if 'волна' in station_name or 'my wave' in station_name or station_info.id == 'user:onyourwave':
-                            logger.info(f"Найдена станция 'Моя волна': {station_name}")
+                            logger.info("Найдена станция 'Моя волна': %s", station_name)
                             
                             # Получаем треки с этой станции
                             try:
@@ -522,44 +574,40 @@ class YandexMusicClient:
                                 
                                 # Способ 1: С базовыми параметрами
                                 try:
-                                    station_tracks = await asyncio.get_event_loop().run_in_executor(
-                                        None,
-                                        self.client.rotor_station_tracks,
+                                    station_tracks = await self.call_api(
+                                        'rotor_station_tracks',
                                         station_info.id,
                                         None,  # settings
                                         None   # batch_id
                                     )
                                 except Exception as e1:
-                                    logger.error(f"Способ 1 получения треков с радиостанции не удался: {e1}")
+                                    logger.error("Способ 1 получения треков с радиостанции не удался: %s", e1)
                                     
                                     # Способ 2: С пустыми параметрами
                                     try:
-                                        station_tracks = await asyncio.get_event_loop().run_in_executor(
-                                            None,
-                                            self.client.rotor_station_tracks,
+                                        station_tracks = await self.call_api(
+                                            'rotor_station_tracks',
                                             station_info.id,
                                             {},   # settings как пустой dict
                                             ""    # batch_id как пустая строка
                                         )
                                     except Exception as e2:
-                                        logger.error(f"Способ 2 получения треков с радиостанции не удался: {e2}")
+                                        logger.error("Способ 2 получения треков с радиостанции не удался: %s", e2)
                                         
                                         # Способ 3: Только с ID станции
                                         try:
-                                            station_tracks = await asyncio.get_event_loop().run_in_executor(
-                                                None,
-                                                self.client.rotor_station_tracks,
+                                            station_tracks = await self.call_api(
+                                                'rotor_station_tracks',
                                                 station_info.id
                                             )
                                         except Exception as e3:
-                                            logger.error(f"Способ 3 получения треков с радиостанции не удался: {e3}")
+                                            logger.error("Способ 3 получения треков с радиостанции не удался: %s", e3)
                                             
                                             # Способ 4: Через rotor API напрямую
                                             try:
                                                 logger.info("Попытка получения треков через rotor API...")
-                                                rotor_tracks = await asyncio.get_event_loop().run_in_executor(
-                                                    None,
-                                                    self.client.rotor_station_tracks,
+                                                rotor_tracks = await self.call_api(
+                                                    'rotor_station_tracks',
                                                     station_info.id,
                                                     {"language": "ru", "moodEnergy": "all"},
                                                     None
@@ -568,7 +616,7 @@ class YandexMusicClient:
                                                     station_tracks = rotor_tracks
                                                     logger.info("Получены треки через rotor API")
                                             except Exception as e4:
-                                                logger.error(f"Способ 4 получения треков с радиостанции не удался: {e4}")
+                                                logger.error("Способ 4 получения треков с радиостанции не удался: %s", e4)
                                                 raise e4
                                 
                                 if station_tracks and hasattr(station_tracks, 'sequence'):
@@ -586,23 +634,22 @@ class YandexMusicClient:
                                             tracks.append(track_info)
                                     
                                     if tracks:
-                                        logger.info(f"Получено {len(tracks)} треков с радиостанции 'Моя волна'")
+                                        logger.info("Получено %s треков с радиостанции 'Моя волна'", len(tracks))
                                         return tracks
                             except Exception as e:
-                                logger.error(f"Ошибка получения треков с радиостанции: {e}")
+                                logger.error("Ошибка получения треков с радиостанции: %s", e)
             
             return []
         except Exception as e:
-            logger.error(f"Ошибка получения радиостанций: {e}")
+            logger.error("Ошибка получения радиостанций: %s", e)
             return []
     
     async def _get_popular_tracks_fallback(self, limit=20):
         """Получение популярных треков как альтернатива 'Моя волна'"""
         try:
             # Попробуем получить популярные треки через поиск
-            search_results = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.client.search,
+            search_results = await self.call_api(
+                'search',
                 'популярные треки'
             )
             
@@ -622,15 +669,14 @@ class YandexMusicClient:
             
             return tracks
         except Exception as e:
-            logger.error(f"Ошибка получения популярных треков: {e}")
+            logger.error("Ошибка получения популярных треков: %s", e)
             return []
     
     async def _get_playlist_tracks(self, playlist_id, limit=20):
         """Получение треков из плейлиста по ID"""
         try:
-            playlist = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.client.users_playlists,
+            playlist = await self.call_api(
+                'users_playlists',
                 '3',  # kind для пользовательских плейлистов
                 playlist_id
             )
@@ -646,13 +692,14 @@ class YandexMusicClient:
                             'artist': ', '.join([artist.name for artist in track.artists]) if track.artists else 'Неизвестный исполнитель',
                             'duration': track.duration_ms // 1000 if track.duration_ms else 0,
                             'album': track.albums[0].title if track.albums and len(track.albums) > 0 else 'Неизвестный альбом',
-                            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None
+                            'cover_url': f"https://{track.cover_uri.replace('%%', '200x200')}" if track.cover_uri else None,
+                            **self._loudness_info(track)
                         }
                         tracks.append(track_info)
             
             return tracks
         except Exception as e:
-            logger.error(f"Ошибка получения треков плейлиста: {e}")
+            logger.error("Ошибка получения треков плейлиста: %s", e)
             return []
     
     async def get_user_playlists(self):
@@ -669,61 +716,52 @@ class YandexMusicClient:
             
             # Способ 1: С kind='3' (пользовательские плейлисты)
             try:
-                playlists = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.client.users_playlists,
+                playlists = await self.call_api(
+                    'users_playlists',
                     '3'  # kind для пользовательских плейлистов
                 )
                 logger.info("Получены плейлисты способом 1 (kind='3')")
                 
                 # Проверяем, что это за объект
-                logger.info(f"Тип объекта: {type(playlists)}")
+                logger.debug("Тип объекта: %s", type(playlists))
                 if hasattr(playlists, '__iter__') and not isinstance(playlists, str):
-                    logger.info("Объект итерируемый, но не строка")
+                    logger.debug("Объект итерируемый, но не строка")
                 else:
-                    logger.info("Объект не итерируемый или строка")
+                    logger.debug("Объект не итерируемый или строка")
                     
             except Exception as e1:
-                logger.warning(f"Способ 1 не сработал: {e1}")
+                logger.warning("Способ 1 не сработал: %s", e1)
                 
                 # Способ 2: Без параметров
                 try:
-                    playlists = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        self.client.users_playlists
-                    )
+                    playlists = await self.call_api('users_playlists')
                     logger.info("Получены плейлисты способом 2 (без параметров)")
                 except Exception as e2:
-                    logger.warning(f"Способ 2 не сработал: {e2}")
+                    logger.warning("Способ 2 не сработал: %s", e2)
                     
                     # Способ 3: С kind=3 (число)
                     try:
-                        playlists = await asyncio.get_event_loop().run_in_executor(
-                            None,
-                            self.client.users_playlists,
+                        playlists = await self.call_api(
+                            'users_playlists',
                             3  # kind как число
                         )
                         logger.info("Получены плейлисты способом 3 (kind=3)")
                     except Exception as e3:
-                        logger.warning(f"Способ 3 не сработал: {e3}")
+                        logger.warning("Способ 3 не сработал: %s", e3)
                         
                         # Способ 4: Попробуем получить коллекцию пользователя
                         try:
                             logger.info("Пробуем получить коллекцию пользователя...")
                             # Получаем информацию о пользователе
-                            user_info = await asyncio.get_event_loop().run_in_executor(
-                                None,
-                                self.client.account_status
-                            )
+                            user_info = await self.call_api('account_status')
                             
                             if user_info and hasattr(user_info, 'account'):
                                 user_id = user_info.account.uid
-                                logger.info(f"ID пользователя: {user_id}")
+                                logger.info("ID пользователя: %s", user_id)
                                 
                                 # Получаем плейлисты пользователя по ID
-                                playlists = await asyncio.get_event_loop().run_in_executor(
-                                    None,
-                                    self.client.users_playlists,
+                                playlists = await self.call_api(
+                                    'users_playlists',
                                     user_id
                                 )
                                 logger.info("Получены плейлисты способом 4 (по ID пользователя)")
@@ -731,7 +769,7 @@ class YandexMusicClient:
                                 raise Exception("Не удалось получить ID пользователя")
                                 
                         except Exception as e4:
-                            logger.error(f"Способ 4 не сработал: {e4}")
+                            logger.error("Способ 4 не сработал: %s", e4)
                             raise e4
             
             playlist_list = []
@@ -754,15 +792,15 @@ class YandexMusicClient:
                             playlist_info['cover_url'] = f"https://{playlists.cover.uri.replace('%%', '200x200')}"
                         
                         playlist_list.append(playlist_info)
-                        logger.info(f"Добавлен плейлист: {playlist_info['title']} (ID: {playlist_info['id']})")
+                        logger.debug("Добавлен плейлист: %s (ID: %s)", playlist_info['title'], playlist_info['id'])
                     except Exception as e:
-                        logger.error(f"Ошибка обработки единственного плейлиста: {e}")
+                        logger.error("Ошибка обработки единственного плейлиста: %s", e)
                 
                 # Если это список плейлистов
                 elif hasattr(playlists, '__iter__') and not isinstance(playlists, str):
                     try:
                         playlists_list = list(playlists)
-                        logger.info(f"Найдено {len(playlists_list)} плейлистов в списке")
+                        logger.info("Найдено %s плейлистов в списке", len(playlists_list))
                         for i, playlist in enumerate(playlists_list):
                             try:
                                 playlist_info = {
@@ -777,12 +815,12 @@ class YandexMusicClient:
                                     playlist_info['cover_url'] = f"https://{playlist.cover.uri.replace('%%', '200x200')}"
                                 
                                 playlist_list.append(playlist_info)
-                                logger.info(f"Добавлен плейлист: {playlist_info['title']} (ID: {playlist_info['id']})")
+                                logger.debug("Добавлен плейлист: %s (ID: %s)", playlist_info['title'], playlist_info['id'])
                             except Exception as e:
-                                logger.error(f"Ошибка обработки плейлиста {i}: {e}")
+                                logger.error("Ошибка обработки плейлиста %s: %s", i, e)
                                 continue
                     except Exception as e:
-                        logger.error(f"Ошибка преобразования в список: {e}")
+                        logger.error("Ошибка преобразования в список: %s", e)
                 
                 # Если это объект с атрибутом playlists
                 elif hasattr(playlists, 'playlists'):
@@ -791,7 +829,7 @@ class YandexMusicClient:
                         playlists_attr = playlists.playlists
                         if hasattr(playlists_attr, '__iter__') and not isinstance(playlists_attr, str):
                             playlists_list = list(playlists_attr)
-                            logger.info(f"Найдено {len(playlists_list)} плейлистов в атрибуте playlists")
+                            logger.info("Найдено %s плейлистов в атрибуте playlists", len(playlists_list))
                             for i, playlist in enumerate(playlists_list):
                                 try:
                                     playlist_info = {
@@ -806,22 +844,22 @@ class YandexMusicClient:
                                         playlist_info['cover_url'] = f"https://{playlist.cover.uri.replace('%%', '200x200')}"
                                     
                                     playlist_list.append(playlist_info)
-                                    logger.info(f"Добавлен плейлист: {playlist_info['title']} (ID: {playlist_info['id']})")
+                                    logger.debug("Добавлен плейлист: %s (ID: %s)", playlist_info['title'], playlist_info['id'])
                                 except Exception as e:
-                                    logger.error(f"Ошибка обработки плейлиста {i}: {e}")
+                                    logger.error("Ошибка обработки плейлиста %s: %s", i, e)
                                     continue
                     except Exception as e:
-                        logger.error(f"Ошибка обработки атрибута playlists: {e}")
+                        logger.error("Ошибка обработки атрибута playlists: %s", e)
                 
                 else:
-                    logger.warning(f"Неизвестный тип объекта плейлистов: {type(playlists)}")
-                    logger.info(f"Атрибуты объекта: {dir(playlists)}")
+                    logger.warning("Неизвестный тип объекта плейлистов: %s", type(playlists))
+                    logger.debug("Атрибуты объекта: %s", dir(playlists))
             else:
                 logger.warning("Плейлисты не найдены или пусты")
             
-            logger.info(f"Итого обработано {len(playlist_list)} плейлистов")
+            logger.info("Итого обработано %s плейлистов", len(playlist_list))
             return playlist_list
             
         except Exception as e:
-            logger.error(f"Ошибка получения плейлистов: {e}")
+            logger.error("Ошибка получения плейлистов: %s", e)
             return []